@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Asyncio client layer for Gemini, Custom Search and YouTube.
+The searchers call the REST endpoints directly (aiohttp when it is installed,
+otherwise the pooled requests session on worker threads), Gemini uses
+generate_content_async, and AsyncGeminiCSVProcessor drives process_csv with
+hundreds of products in flight on a single thread. The rate limiters, response
+cache and URL health store are the same shared objects the threaded code uses.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import aiohttp
+except ImportError:  # optional: without it HTTP calls run on worker threads
+    aiohttp = None
+
+from gemini_csv_processor import GeminiCSVProcessor, GoogleImageSearcher
+from http_session import PooledHTTPSession, get_shared_session
+from instrumentation import get_run_metrics
+from product_families import shares_images
+from pipeline_stages import run_stages_async
+from rate_limiter import RateLimiter, get_rate_limiter
+from resilience import call_with_retry_async, wait_for_circuit_async
+from response_cache import ResponseCache, get_shared_cache
+from results_jsonl import JSONLResultsWriter
+from structured_generation import SECTION_KEYS, StructuredSectionGenerator, generation_config, parse_sections, section_schema
+from url_health import URLHealthStore, get_shared_health_store
+
+CUSTOMSEARCH_ENDPOINT = 'https://www.googleapis.com/customsearch/v1'
+YOUTUBE_SEARCH_ENDPOINT = 'https://www.googleapis.com/youtube/v3/search'
+
+class AsyncHTTPClient:
+    def __init__(self, max_connections: int = 100, max_connections_per_host: int = 8, timeout: float = 10, http_session: Optional[PooledHTTPSession] = None):
+        """HTTP client for coroutines; falls back to the pooled requests session without aiohttp"""
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.http_session = http_session or get_shared_session()
+        self._session = None
+
+    def _aiohttp_session(self):
+        # Created lazily because an aiohttp session belongs to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_connections_per_host)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def get_json(self, url: str, params: Dict) -> Dict:
+        """GET a JSON API endpoint, raising on HTTP errors"""
+        if aiohttp:
+            async with self._aiohttp_session().get(url, params=params) as response:
+                response.raise_for_status()
+                return await response.json()
+        response = await asyncio.to_thread(self.http_session.get, url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    async def head(self, url: str) -> Tuple[int, str]:
+        """HEAD a URL following redirects. Returns (status, lower-cased content type)."""
+        if aiohttp:
+            async with self._aiohttp_session().head(url, allow_redirects=True) as response:
+                return response.status, response.headers.get('content-type', '').lower()
+        response = await asyncio.to_thread(self.http_session.head, url, timeout=self.timeout, allow_redirects=True)
+        return response.status_code, response.headers.get('content-type', '').lower()
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+class AsyncImageSearcher:
+    def __init__(self, api_key: str, search_engine_id: str, http: AsyncHTTPClient, rate_limiter: Optional[RateLimiter] = None,
+                 cache: Optional[ResponseCache] = None, url_health: Optional[URLHealthStore] = None, endpoint: str = CUSTOMSEARCH_ENDPOINT):
+        """Custom Search image client for coroutines"""
+        self.api_key = api_key
+        self.search_engine_id = search_engine_id
+        self.http = http
+        self.rate_limiter = rate_limiter or get_rate_limiter('customsearch')
+        self.cache = cache or get_shared_cache()
+        self.url_health = url_health or get_shared_health_store()
+        self.endpoint = endpoint
+
+    async def search_images(self, query: str, num_images: int = 5) -> List[str]:
+        """Search for images using the Custom Search REST API"""
+        try:
+            found, image_urls = self.cache.get('customsearch', query, prompt=f"num={num_images}")
+            if found:
+                return image_urls
+
+            async def search():
+                await self.rate_limiter.acquire_async()
+                with get_run_metrics().api_call('customsearch'):
+                    return await self.http.get_json(self.endpoint, {
+                        'key': self.api_key,
+                        'cx': self.search_engine_id,
+                        'q': query,
+                        'searchType': 'image',
+                        'num': num_images,
+                        'imgSize': 'LARGE',
+                        'imgType': 'photo',
+                        'safe': 'active'
+                    })
+
+            result = await call_with_retry_async('customsearch', search)
+            image_urls = [item['link'] for item in result.get('items', []) if 'link' in item]
+            self.cache.set('customsearch', query, image_urls, prompt=f"num={num_images}")
+            return image_urls
+        except Exception as e:
+            print(f"Error searching images for '{query}': {str(e)}")
+            raise
+
+    async def validate_image_url(self, url: str) -> bool:
+        """Validate an image URL (recent checks are answered by the URL health store)"""
+        record = self.url_health.cached_check(url)
+        if record is None:
+            try:
+                with get_run_metrics().api_call('url_head'):
+                    status, content_type = await self.http.head(url)
+                record = self.url_health.record_check(url, status, content_type)
+            except Exception as e:
+                record = self.url_health.record_check(url, None, error=str(e)[:200])
+        return GoogleImageSearcher.is_working_image(record)
+
+    async def get_working_image_urls(self, query: str, num_images: int = 5) -> List[str]:
+        """Get working image URLs, validating all candidates at once; keeps search-rank order
+
+        Stops once the num_images best-ranked valid URLs are known (see GoogleImageSearcher.get_working_image_urls).
+        """
+        search_results = await self.search_images(query, num_images * 2)
+        if not search_results:
+            return []
+
+        async def check(rank: int) -> Tuple[int, bool]:
+            return rank, await self.validate_image_url(search_results[rank])
+
+        tasks = [asyncio.ensure_future(check(rank)) for rank in range(len(search_results))]
+        checked: Dict[int, bool] = {}
+        selected: List[int] = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                rank, valid = await next_done
+                url = search_results[rank]
+                checked[rank] = valid
+                if valid:
+                    print(f"✓ Valid image URL found: {url[:80]}...")
+                else:
+                    print(f"✗ Invalid image URL: {url[:80]}...")
+                selected = GoogleImageSearcher.top_valid_ranks(checked, len(search_results), num_images)
+                if len(selected) >= num_images:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+        return [search_results[rank] for rank in selected]
+
+class AsyncYouTubeSearcher:
+    def __init__(self, api_key: str, http: AsyncHTTPClient, rate_limiter: Optional[RateLimiter] = None,
+                 cache: Optional[ResponseCache] = None, endpoint: str = YOUTUBE_SEARCH_ENDPOINT):
+        """YouTube Data API search client for coroutines"""
+        self.api_key = api_key
+        self.http = http
+        self.rate_limiter = rate_limiter or get_rate_limiter('youtube')
+        self.cache = cache or get_shared_cache()
+        self.endpoint = endpoint
+
+    async def search_video(self, query: str) -> Optional[str]:
+        """Search for a YouTube video"""
+        try:
+            found, video_url = self.cache.get('youtube', query)
+            if found:
+                return video_url
+
+            async def search():
+                await self.rate_limiter.acquire_async()
+                with get_run_metrics().api_call('youtube'):
+                    return await self.http.get_json(self.endpoint, {
+                        'key': self.api_key,
+                        'q': query,
+                        'part': 'snippet',
+                        'type': 'video',
+                        'maxResults': 1,
+                        'order': 'relevance',
+                        'safeSearch': 'moderate'
+                    })
+
+            result = await call_with_retry_async('youtube', search)
+            video_url = None
+            if result.get('items'):
+                video_url = f"https://www.youtube.com/watch?v={result['items'][0]['id']['videoId']}"
+            self.cache.set('youtube', query, video_url)
+            return video_url
+        except Exception as e:
+            print(f"Error searching YouTube for '{query}': {str(e)}")
+            raise
+
+class AsyncSectionGenerator(StructuredSectionGenerator):
+    """StructuredSectionGenerator with a coroutine version of generate"""
+
+    async def _request_async(self, prompt: str, keys: List[str]) -> str:
+        """Coroutine version of _request"""
+        if self.rate_limiter:
+            await self.rate_limiter.acquire_async()
+        self.requests += 1
+        config = generation_config(section_schema(keys))
+        generate_async = getattr(self.model, 'generate_content_async', None)
+        with get_run_metrics().api_call('gemini'):
+            if generate_async is not None:
+                response = await generate_async(prompt, generation_config=config)
+            else:
+                response = await asyncio.to_thread(self.model.generate_content, prompt, generation_config=config)
+        return response.text
+
+    async def generate_async(self, product_name: str, keys: Optional[List[str]] = None) -> Dict[str, str]:
+        """Return key -> text for the requested sections, re-asking only for missing keys"""
+        missing = list(keys or SECTION_KEYS)
+        sections: Dict[str, str] = {}
+        for attempt in range(self.max_attempts):
+            prompt = self.create_prompt(product_name, missing)
+            found, text = self.cache.get('gemini', product_name, self.model_name, prompt) if self.cache else (False, None)
+            if not found:
+                text = await call_with_retry_async('gemini', lambda: self._request_async(prompt, missing))
+
+            parsed = parse_sections(text, missing)
+            if parsed and not found and self.cache:
+                self.cache.set('gemini', product_name, text, self.model_name, prompt)
+            sections.update(parsed)
+            missing = [key for key in missing if key not in sections]
+            if not missing:
+                break
+            if attempt + 1 < self.max_attempts:
+                self.retries += 1
+                print(f"Retrying {len(missing)} missing sections for {product_name}: {', '.join(missing)}")
+        return sections
+
+class AsyncGeminiCSVProcessor(GeminiCSVProcessor):
+    def __init__(self, gemini_api_key: str, google_api_key: str, search_engine_id: str, model=None):
+        """GeminiCSVProcessor whose process_csv runs on asyncio (process_csv stays a blocking call)"""
+        super().__init__(gemini_api_key, google_api_key, search_engine_id, model)
+        self.http = AsyncHTTPClient(http_session=self.image_searcher.http_session)
+        self.async_section_generator = AsyncSectionGenerator(self.model, self.model_name, self.rate_limiter, self.cache)
+        self.async_image_searcher = AsyncImageSearcher(google_api_key, search_engine_id, self.http, self.image_searcher.rate_limiter,
+                                                       self.image_searcher.cache, self.image_searcher.url_health)
+        self.async_youtube_searcher = AsyncYouTubeSearcher(google_api_key, self.http, self.youtube_searcher.rate_limiter, self.youtube_searcher.cache)
+
+    async def process_product_async(self, product_name: str) -> Dict:
+        """Coroutine version of process_product: the text, image and video stages run concurrently"""
+        if self.families is not None:
+            sibling = await self.families.claim_async(product_name)
+            if sibling is not None:
+                result = self.reuse_sibling(sibling, product_name)
+                if shares_images(sibling['product'], product_name):
+                    return result
+                with get_run_metrics().product(product_name):
+                    outputs, errors = await run_stages_async({
+                        'images': self.async_image_searcher.get_working_image_urls(f"{product_name} product high quality", 5)
+                    }, self.stage_timeouts)
+                return self.add_own_images(result, outputs, errors)
+
+        result = None
+        try:
+            started_at = time.time()
+            print(f"Generating description and searching for media for: {product_name}")
+            with get_run_metrics().product(product_name):
+                outputs, errors = await run_stages_async({
+                    'text': self.async_section_generator.generate_async(product_name),
+                    'images': self.async_image_searcher.get_working_image_urls(f"{product_name} product high quality", 5),
+                    'video': self.async_youtube_searcher.search_video(f"{product_name} review tutorial")
+                }, self.stage_timeouts)
+            result = self.build_result(product_name, outputs, errors, started_at)
+            return result
+        finally:
+            # Also on cancellation, so siblings waiting for this product are released
+            if self.families is not None:
+                self.families.finish(product_name, result)
+
+    async def settle_circuit_async(self, product_name: str, result: Dict) -> Optional[Dict]:
+        """Coroutine version of settle_circuit"""
+        while result.get('circuit_open'):
+            if not await wait_for_circuit_async(result['circuit_open']):
+                return None
+            result = await self.process_product_async(product_name)
+        return result
+
+    async def process_csv_async(self, csv_file_path: str, output_file: str = 'gemini_results_with_links.txt', resume: bool = True,
+                                start_from: int = None, max_in_flight: int = 100, jsonl_output: Optional[str] = None,
+                                reuse_families: bool = False) -> List[Dict]:
+        """Process the CSV with up to max_in_flight products at once, writing results in product order
+
+        With reuse_families, size/shade/tester variants reuse the content generated for a sibling.
+        """
+        try:
+            get_run_metrics().start_run('process_csv_async')
+            products = self.load_products(csv_file_path)
+            print(f"Found {len(products)} products to process")
+            if reuse_families:
+                self.load_families(csv_file_path)
+            start_index, file_mode = self.resolve_start(output_file, resume, start_from, jsonl_output)
+            print(f"Processing with up to {max_in_flight} products in flight"
+                  f"{'' if aiohttp else ' (aiohttp not installed: HTTP calls use worker threads)'}")
+
+            results = []
+            started_at = time.time()
+            stopped = False
+            jsonl_writer = JSONLResultsWriter(jsonl_output, file_mode) if jsonl_output else None
+            semaphore = asyncio.Semaphore(max_in_flight)
+            pending = deque()
+
+            async def run(product_num: int, product: str) -> Dict:
+                async with semaphore:
+                    print(f"\nProcessing {product_num}/{len(products)}: {product}")
+                    return await self.process_product_async(product)
+
+            try:
+                with self.open_output(output_file, file_mode) as f:
+                    # Only a bounded window of products has a task at any time
+                    queue = iter(enumerate(products[start_index:]))
+
+                    def schedule_next() -> None:
+                        item = next(queue, None)
+                        if item is not None:
+                            i, product = item
+                            product_num = start_index + i + 1
+                            pending.append((product_num, product, asyncio.ensure_future(run(product_num, product))))
+
+                    for _ in range(max_in_flight * 2):
+                        schedule_next()
+
+                    while pending:
+                        product_num, product, task = pending.popleft()
+                        result = await self.settle_circuit_async(product, await task)
+                        if result is None:
+                            # Daily quota gone: the products still in flight are left for the next run
+                            stopped = True
+                            break
+                        results.append(result)
+                        if jsonl_writer:
+                            jsonl_writer.write_result(product_num, result)
+                        self.write_result(f, product_num, product, result)
+                        print(f"✓ Written product {product_num}: {product} ({result['status']})")
+                        self.print_throughput(len(results), started_at)
+                        schedule_next()
+            finally:
+                for _, _, task in pending:
+                    task.cancel()
+                if jsonl_writer:
+                    jsonl_writer.close()
+                await self.http.close()
+
+            if stopped:
+                print(f"\nProcessing stopped after {len(results)} products; resume picks up from here. Results saved to {output_file}")
+            else:
+                print(f"\nProcessing complete! Results saved to {output_file}")
+            self.print_throughput(len(results), started_at)
+            self.print_run_stats(output_file)
+            return results
+
+        except Exception as e:
+            print(f"Error processing CSV file: {str(e)}")
+            return []
+
+    def process_csv(self, csv_file_path: str, output_file: str = 'gemini_results_with_links.txt', delay: float = 0.0, resume: bool = True,
+                    start_from: int = None, max_workers: int = 100, jsonl_output: Optional[str] = None,
+                    reuse_families: bool = False) -> List[Dict]:
+        """Blocking wrapper around process_csv_async for the existing scripts (max_workers = products in flight)"""
+        if delay > 0:
+            print("Note: delay is ignored by the async pipeline; API quotas are enforced by the rate limiters")
+        return asyncio.run(self.process_csv_async(csv_file_path, output_file, resume, start_from, max_workers, jsonl_output,
+                                                  reuse_families))
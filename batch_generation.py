@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Batched Gemini generation of short marketing sections.
+Packs several products into one request and asks for a JSON object keyed by
+product ID (each value constrained by the section schema), so the per-request
+overhead is paid once per batch instead of once per product. Responses that
+cannot be parsed are retried in smaller batches, down to single products.
+"""
+
+import argparse
+import json
+import time
+from typing import Dict, List, Optional
+
+from instrumentation import get_run_metrics
+from rate_limiter import RateLimiter
+from resilience import call_with_retry
+from response_cache import ResponseCache
+from structured_generation import SECTION_INSTRUCTIONS, generation_config, load_json_object, section_schema
+
+# Marks the product list in a batch prompt (the fake model looks for it too)
+PRODUCTS_MARKER = 'PRODUCTS (JSON):'
+
+def batch_schema(products: List[Dict]) -> Dict:
+    """Schema of a batch answer: product id -> object with that product's sections"""
+    return {
+        'type': 'object',
+        'properties': {p['id']: section_schema(p['fields']) for p in products},
+        'required': [p['id'] for p in products]
+    }
+
+class BatchContentGenerator:
+    def __init__(self, model, model_name: str, batch_size: int = 8,
+                 rate_limiter: Optional[RateLimiter] = None, cache: Optional[ResponseCache] = None):
+        """Generate sections for many products with one Gemini request per batch"""
+        self.model = model
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.requests = 0
+        self.fallbacks = 0
+
+    def create_batch_prompt(self, products: List[Dict]) -> str:
+        """Prompt for a batch of {'id', 'name', 'fields'} products (fields are section keys)"""
+        fields = [key for key in SECTION_INSTRUCTIONS if any(key in product['fields'] for product in products)]
+        instructions = '\n'.join(f'- "{field}": {SECTION_INSTRUCTIONS[field]}' for field in fields)
+        product_list = json.dumps([{'id': p['id'], 'product': p['name'], 'fields': p['fields']} for p in products], ensure_ascii=False)
+        return f"""Generate content for the following beauty/perfume products in Bulgarian language.
+
+For each product, write ONLY the fields listed for it. Field instructions:
+{instructions}
+
+{PRODUCTS_MARKER}
+{product_list}
+
+Answer with a single JSON object and nothing else. Its keys are the product ids; each value is an
+object mapping the requested field names to their text in Bulgarian. Do NOT include image URLs or video links."""
+
+    @staticmethod
+    def parse_batch_response(text: str, products: List[Dict]) -> Dict[str, Dict[str, str]]:
+        """Split a batch response into per-product fields
+
+        Returns the valid, non-empty fields found for each product (possibly only some of
+        the requested ones); raises ValueError if the response is not a JSON object at all.
+        """
+        data = load_json_object(text)
+
+        parsed = {}
+        for product in products:
+            entry = data.get(product['id'])
+            if not isinstance(entry, dict):
+                continue
+            fields = {field: entry[field].strip() for field in product['fields']
+                      if isinstance(entry.get(field), str) and entry[field].strip()}
+            if fields:
+                parsed[product['id']] = fields
+        return parsed
+
+    def _cache_prompt(self, product: Dict) -> str:
+        # Cached per product, independent of which batch it was generated in
+        return json.dumps({'batch_fields': sorted(product['fields'])})
+
+    def _generate_chunk(self, products: List[Dict]) -> Dict[str, Dict[str, str]]:
+        """One request for a chunk; whatever is missing afterwards is retried in halves"""
+        prompt = self.create_batch_prompt(products)
+
+        def request():
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            self.requests += 1
+            with get_run_metrics().api_call('gemini'):
+                return self.model.generate_content(prompt, generation_config=generation_config(batch_schema(products)))
+
+        response = call_with_retry('gemini', request)
+        try:
+            parsed = self.parse_batch_response(response.text, products)
+        except ValueError as e:
+            print(f"Could not parse batch of {len(products)} products: {e}")
+            parsed = {}
+
+        # Ask again only for the fields that did not come back
+        remaining = []
+        for product in products:
+            got = parsed.get(product['id'], {})
+            missing_fields = [field for field in product['fields'] if field not in got]
+            if missing_fields:
+                remaining.append(dict(product, fields=missing_fields))
+
+        # A single product is only retried while each attempt makes progress
+        if remaining and (len(products) > 1 or len(remaining[0]['fields']) < len(products[0]['fields'])):
+            self.fallbacks += 1
+            middle = (len(remaining) + 1) // 2
+            for part in (remaining[:middle], remaining[middle:]):
+                if part:
+                    for product_id, fields in self._generate_chunk(part).items():
+                        parsed.setdefault(product_id, {}).update(fields)
+        return parsed
+
+    def generate(self, products: List[Dict]) -> Dict[str, Dict[str, str]]:
+        """Generate fields for {'id', 'name', 'fields'} products; returns id -> field -> text
+
+        Fields that still fail as a single-product request are left out.
+        """
+        results = {}
+        pending = []
+        for product in products:
+            if not product['fields']:
+                continue
+            if self.cache:
+                found, fields = self.cache.get('gemini', product['name'], self.model_name, self._cache_prompt(product))
+                if found:
+                    results[product['id']] = fields
+                    continue
+            pending.append(product)
+
+        for start in range(0, len(pending), self.batch_size):
+            chunk = pending[start:start + self.batch_size]
+            chunk_results = self._generate_chunk(chunk)
+            results.update(chunk_results)
+            if self.cache:
+                # Only complete answers are cached
+                for product in chunk:
+                    fields = chunk_results.get(product['id'], {})
+                    if len(fields) == len(product['fields']):
+                        self.cache.set('gemini', product['name'], fields, self.model_name, self._cache_prompt(product))
+        return results
+
+def main():
+    """Benchmark batch sizes against the local fake Gemini model"""
+    from fake_backends import FakeGenerativeModel
+
+    parser = argparse.ArgumentParser(description="Benchmark batched generation against a fake Gemini backend")
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--batch-sizes', default='1,5,10,20')
+    parser.add_argument('--latency', type=float, default=0.2, help="Fake per-request latency in seconds")
+    parser.add_argument('--per-product-latency', type=float, default=0.01, help="Fake extra latency per product in a request")
+    parser.add_argument('--max-batch', type=int, default=12, help="Fake model returns broken JSON for larger batches")
+    args = parser.parse_args()
+
+    fields = ['headline', 'emotional']
+    products = [{'id': str(10000 + i), 'name': f"Brand {i % 37} Parfum {i} EDP 100ml", 'fields': fields} for i in range(args.products)]
+
+    print(f"{'batch':>6} {'requests':>9} {'fallbacks':>9} {'generated':>9} {'seconds':>8} {'products/s':>10}")
+    for batch_size in [int(b) for b in args.batch_sizes.split(',')]:
+        model = FakeGenerativeModel(latency=args.latency, per_product_latency=args.per_product_latency, max_batch_products=args.max_batch)
+        generator = BatchContentGenerator(model, 'fake', batch_size=batch_size)
+        started_at = time.time()
+        results = generator.generate(products)
+        elapsed = time.time() - started_at
+        print(f"{batch_size:>6} {model.request_count:>9} {generator.fallbacks:>9} {len(results):>9} {elapsed:>8.2f} {len(results) / elapsed:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the pipeline.
+Builds synthetic catalogues (1k/10k/100k rows) and runs process_csv (also on a
+catalogue of size variants with family content reuse), regenerate_missing_content, CSVLinkUpdater.process and import_content_from_parf
+on each one against the fake Gemini, Custom Search, YouTube and image host
+backends in fake_backends.py, so no API quota is spent. For every run it records
+wall time, peak memory and fake API calls per second. Peak memory is the process
+RSS high-water mark; --trace-memory adds the peak of Python allocations during
+each benchmark (tracemalloc), at the cost of much slower runs. Results are saved
+as JSON and can be compared with an earlier run.
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from missing_data import CONTENT_COLUMNS
+from results_jsonl import build_record
+
+# Column layout of the real catalogue export
+CATALOGUE_COLUMNS = (['Group', 'ID', 'BarCode', 'Type', 'Brand', 'Line', 'Unnamed: 6', 'New arrivals', 'QTY', 'EUR', 'BGN',
+                      'Best Price', 'Unnamed: 12', 'Our Price', 'Unnamed: 14', 'Марж в левове', 'Марж в %']
+                     + CONTENT_COLUMNS
+                     + ['FAQ', '7. SEO Keywords (Behind-the-scenes)', '✅ Tips for Beauty Product Pages'])
+
+BRANDS = ['Xerjoff', 'Creed', 'Lalique', 'Montblanc', 'Trussardi', 'Davidoff', 'Dsquared2', 'Shiseido', 'Kilian', 'Clarins',
+          'Frederic Malle', 'Bond No. 9', 'Clive Christian', 'Guerlain', 'Chanel', 'Dior', 'Tom Ford', 'Armani']
+LINES = ['Elle', 'Aventus', 'Satine', 'Legend', 'Ruby Red', 'Cool Water', 'Wood', 'Good Girl', 'Signature', 'Oud Stars',
+         'Irisss', 'Homme', 'Symphonium', 'Chelsea Nights', 'Portrait', 'Damarose']
+CONCENTRATIONS = ['EDP', 'EDT', 'Parfum']
+SIZES_ML = [30, 50, 75, 100, 125]
+
+BENCHMARKS = ['process_csv', 'process_csv_families', 'regenerate_missing_content', 'csv_link_update', 'import_content']
+
+# Size variants per product in the process_csv_families catalogue
+FAMILY_VARIANTS = 3
+
+def build_catalogue(rows: int, missing_rate: float = 0.3, seed: int = 0, variants: int = 1) -> pd.DataFrame:
+    """Synthetic catalogue in the real column layout; about missing_rate of the rows lack some content
+
+    With variants > 1, each run of that many rows holds size variants of one product (a product family).
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(100000, 100000 + rows)
+    products = 100000 + np.arange(rows) // variants
+    brands = np.array(BRANDS)[products % len(BRANDS)]
+    lines = np.array(LINES)[(products // len(BRANDS)) % len(LINES)]
+    concentrations = np.array(CONCENTRATIONS)[products % len(CONCENTRATIONS)]
+    if variants > 1:
+        sizes = np.array(SIZES_ML)[np.arange(rows) % variants % len(SIZES_ML)]
+    else:
+        sizes = np.array(SIZES_ML)[(ids // 7) % len(SIZES_ML)]
+    # The catalogue size is part of the name, so runs of different sizes never share cached answers
+    names = [f"{brand} {line} {rows}-{product - 100000} ({concentration}) {size}ml"
+             for product, brand, line, concentration, size in zip(products, brands, lines, concentrations, sizes)]
+
+    df = pd.DataFrame({column: pd.Series([None] * rows, dtype=object) for column in CATALOGUE_COLUMNS})
+    df['Group'] = 'Парфюми'
+    df['ID'] = ids
+    df['Type'] = 'Perfume'
+    df['Brand'] = brands
+    df['Line'] = names
+    df['QTY'] = rng.integers(0, 20, rows)
+    df['EUR'] = rng.uniform(20, 400, rows).round(2)
+
+    for column in CONTENT_COLUMNS:
+        if column.startswith('Image'):
+            values = [f"https://images.example.com/{product_id}/{column[-1]}.jpg" for product_id in ids]
+        elif column == 'Video':
+            values = [f"https://www.youtube.com/watch?v={product_id}" for product_id in ids]
+        else:
+            values = [f"{column.split('. ', 1)[-1]} за {name}" for name in names]
+        # Incomplete rows miss each content field with 50% probability
+        incomplete = rng.random(rows) < missing_rate
+        blank = incomplete & (rng.random(rows) < 0.5)
+        df[column] = np.where(blank, None, np.array(values, dtype=object))
+    return df
+
+def write_results_jsonl(df: pd.DataFrame, path: str, image_host) -> None:
+    """Results file for CSVLinkUpdater: every product gets images on the local host and a video"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for number, (product_id, name) in enumerate(zip(df['ID'], df['Line']), 1):
+            routes = ['image', 'image', 'image', 'broken'] if number % 10 == 0 else ['image'] * 4
+            result = {
+                'product': name,
+                'status': 'success',
+                'description': '',
+                'sections': {'headline': f"Headline за {name}", 'emotional': f"Hook за {name}"},
+                'images': [image_host.url(f"{route}/{product_id}-{rank}.jpg") for rank, route in enumerate(routes)],
+                'video': image_host.url(f"image/{product_id}-video"),
+                'elapsed': 0.0
+            }
+            f.write(json.dumps(build_record(number, result), ensure_ascii=False) + '\n')
+
+class FakeBackends:
+    def __init__(self, gemini_latency: float = 0.02, search_latency: float = 0.01, error_rate: float = 0.0, response_size: int = 200):
+        """Local image host plus fake Gemini, Custom Search and YouTube services"""
+        from fake_backends import FakeCustomSearchService, FakeGenerativeModel, FakeYouTubeService, LocalImageHost
+
+        self.image_host = LocalImageHost()
+        self.model = FakeGenerativeModel(latency=gemini_latency, error_rate=error_rate, response_size=response_size)
+        self.customsearch = FakeCustomSearchService(self.image_host, latency=search_latency, error_rate=error_rate, response_size=response_size)
+        self.youtube = FakeYouTubeService(latency=search_latency, error_rate=error_rate, response_size=response_size)
+
+    def api_calls(self) -> int:
+        """Requests served so far by all fake backends"""
+        return (self.model.request_count + self.customsearch.request_count + self.youtube.request_count
+                + sum(self.image_host.request_counts.values()))
+
+    def searchers(self):
+        """Image and YouTube searchers wired to the fake services"""
+        from gemini_csv_processor import GoogleImageSearcher, YouTubeSearcher
+
+        return (GoogleImageSearcher('fake-key', 'fake-cx', service_factory=lambda: self.customsearch),
+                YouTubeSearcher('fake-key', service_factory=lambda: self.youtube))
+
+    def close(self) -> None:
+        self.image_host.close()
+
+def peak_rss_mb() -> float:
+    """High-water mark of this process's resident memory"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+def use_private_files(workdir: str) -> None:
+    """Point the response cache, URL health, quota and snapshot files into workdir and lift the quota limits
+
+    Must run before anything opens the shared response cache.
+    """
+    os.environ['API_CACHE_FILE'] = os.path.join(workdir, 'api_response_cache.sqlite')
+    os.environ['URL_HEALTH_FILE'] = os.path.join(workdir, 'url_health.sqlite')
+    os.environ['CATALOGUE_SNAPSHOT_DIR'] = os.path.join(workdir, 'catalogue_snapshots')
+    from rate_limiter import configure_rate_limiter
+    for service in ('gemini', 'customsearch', 'youtube'):
+        configure_rate_limiter(service, requests_per_minute=1e9, requests_per_day=None, burst=1_000_000)
+
+def private_cache(workdir: str):
+    """The shared response cache, if its file is inside workdir; raises ValueError otherwise
+
+    Benchmarks purge this cache, so it must never be the real one holding paid API answers.
+    """
+    from response_cache import get_shared_cache
+
+    cache = get_shared_cache()
+    if os.path.commonpath([os.path.abspath(cache.path), os.path.abspath(workdir)]) != os.path.abspath(workdir):
+        raise ValueError(f"Response cache {cache.path} is outside the benchmark directory {workdir}; "
+                         f"call use_private_files() first (or set API_CACHE_FILE) so the real cache is not purged")
+    return cache
+
+def measure(name: str, rows: int, run: Callable[[], None], backends: FakeBackends, workdir: str, verbose: bool = False,
+            trace_memory: bool = False) -> Dict:
+    """Run one benchmark, recording wall time, peak memory and fake API calls/sec"""
+    # Every benchmark starts with a cold response cache
+    private_cache(workdir).purge()
+    calls_before = backends.api_calls()
+    if trace_memory:
+        tracemalloc.start()
+    started_at = time.perf_counter()
+    try:
+        if verbose:
+            run()
+        else:
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                run()
+    finally:
+        elapsed = time.perf_counter() - started_at
+        traced_peak = None
+        if trace_memory:
+            traced_peak = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+            tracemalloc.stop()
+    calls = backends.api_calls() - calls_before
+    result = {
+        'benchmark': name,
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'peak_traced_mb': traced_peak,
+        'api_calls': calls,
+        'calls_per_second': round(calls / elapsed, 1) if elapsed > 0 else 0.0,
+        'rows_per_second': round(rows / elapsed, 1) if elapsed > 0 else 0.0
+    }
+    peak = traced_peak if traced_peak is not None else result['peak_rss_mb']
+    print(f"{name:<28} {rows:>8} {result['seconds']:>9.2f} {peak:>9.1f} {calls:>9} {result['calls_per_second']:>10.1f} {result['rows_per_second']:>10.1f}")
+    return result
+
+def run_suite(sizes: List[int], benchmarks: List[str], workdir: str, backends: FakeBackends, workers: int = 16,
+              missing_rate: float = 0.3, verbose: bool = False, trace_memory: bool = False) -> List[Dict]:
+    """Run the selected benchmarks on a catalogue of each size (workdir must hold the response cache, see use_private_files)"""
+    private_cache(workdir)
+    from gemini_csv_processor import GeminiCSVProcessor
+    from import_content_from_parf import import_content_from_parf
+    from regenerate_missing_content import MissingContentRegenerator
+    from update_csv_with_links import CSVLinkUpdater
+
+    results = []
+    print(f"{'benchmark':<28} {'rows':>8} {'seconds':>9} {'peak MB':>9} {'calls':>9} {'calls/s':>10} {'rows/s':>10}"
+          f"{'  (peak MB: traced Python allocations)' if trace_memory else '  (peak MB: process RSS)'}")
+    for rows in sizes:
+        catalogue = build_catalogue(rows, missing_rate)
+        catalogue_file = os.path.join(workdir, f"catalogue_{rows}.csv")
+        catalogue.to_csv(catalogue_file, index=False)
+
+        if 'process_csv' in benchmarks:
+            image_searcher, youtube_searcher = backends.searchers()
+            processor = GeminiCSVProcessor('fake-key', 'fake-key', 'fake-cx', backends.model, image_searcher, youtube_searcher)
+            output_file = os.path.join(workdir, f"results_{rows}.txt")
+            results.append(measure('process_csv', rows, lambda: processor.process_csv(
+                catalogue_file, output_file, resume=False, max_workers=workers), backends, workdir, verbose, trace_memory))
+
+        if 'process_csv_families' in benchmarks:
+            # Same run on a catalogue of size variants, with variants reusing their family's content
+            families_file = os.path.join(workdir, f"catalogue_{rows}_families.csv")
+            build_catalogue(rows, missing_rate, variants=FAMILY_VARIANTS).to_csv(families_file, index=False)
+            image_searcher, youtube_searcher = backends.searchers()
+            processor = GeminiCSVProcessor('fake-key', 'fake-key', 'fake-cx', backends.model, image_searcher, youtube_searcher)
+            output_file = os.path.join(workdir, f"results_{rows}_families.txt")
+            results.append(measure('process_csv_families', rows, lambda: processor.process_csv(
+                families_file, output_file, resume=False, max_workers=workers, reuse_families=True), backends, workdir, verbose, trace_memory))
+
+        if 'regenerate_missing_content' in benchmarks:
+            image_searcher, youtube_searcher = backends.searchers()
+            regenerator = MissingContentRegenerator('fake-key', 'fake-key', 'fake-cx', os.path.join(workdir, f"ledger_{rows}.jsonl"),
+                                                    model=backends.model, image_searcher=image_searcher, youtube_searcher=youtube_searcher)
+            output_csv = os.path.join(workdir, f"regenerated_{rows}.csv")
+            results.append(measure('regenerate_missing_content', rows, lambda: regenerator.regenerate_missing_content(
+                catalogue_file, output_csv), backends, workdir, verbose, trace_memory))
+
+        if 'csv_link_update' in benchmarks:
+            results_file = os.path.join(workdir, f"link_results_{rows}.jsonl")
+            write_results_jsonl(catalogue, results_file, backends.image_host)
+            updater = CSVLinkUpdater(catalogue_file, results_file)
+            output_csv = os.path.join(workdir, f"linked_{rows}.csv")
+            results.append(measure('csv_link_update', rows, lambda: updater.process(output_csv, validate_links=True), backends, workdir, verbose, trace_memory))
+
+        if 'import_content' in benchmarks:
+            source_file = os.path.join(workdir, f"parf_{rows}.csv")
+            target_file = os.path.join(workdir, f"import_target_{rows}.csv")
+            build_catalogue(rows, missing_rate=0.0, seed=1).to_csv(source_file, index=False)
+            shutil.copyfile(catalogue_file, target_file)
+            results.append(measure('import_content', rows, lambda: import_content_from_parf(source_file, target_file), backends, workdir, verbose, trace_memory))
+    return results
+
+def compare(results: List[Dict], baseline_file: str, tolerance: float = 0.2) -> int:
+    """Print the change against an earlier results file; returns the number of regressions"""
+    with open(baseline_file, encoding='utf-8') as f:
+        baseline = {(r['benchmark'], r['rows']): r for r in json.load(f)['results']}
+
+    regressions = 0
+    print(f"\nCompared with {baseline_file} (tolerance {tolerance:.0%}):")
+    for result in results:
+        previous = baseline.get((result['benchmark'], result['rows']))
+        if not previous:
+            continue
+        time_ratio = result['seconds'] / previous['seconds'] if previous['seconds'] else 1.0
+        # Compare traced peaks when both runs have them; RSS is a process-wide high-water mark
+        memory_key = 'peak_traced_mb' if result['peak_traced_mb'] and previous.get('peak_traced_mb') else 'peak_rss_mb'
+        memory_ratio = result[memory_key] / previous[memory_key] if previous.get(memory_key) else 1.0
+        regressed = time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance
+        regressions += regressed
+        print(f"  {result['benchmark']:<28} {result['rows']:>8}  time x{time_ratio:.2f}  memory x{memory_ratio:.2f}"
+              f"{'  ✗ REGRESSION' if regressed else ''}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline offline against fake API backends")
+    parser.add_argument('--sizes', default='1000', help="Catalogue sizes, e.g. 1000,10000,100000")
+    parser.add_argument('--benchmarks', default=','.join(BENCHMARKS), help=f"Subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--workers', type=int, default=16, help="Concurrent products for process_csv")
+    parser.add_argument('--gemini-latency', type=float, default=0.02, help="Fake Gemini latency in seconds")
+    parser.add_argument('--search-latency', type=float, default=0.01, help="Fake Custom Search / YouTube latency in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of fake API requests that fail with a 503")
+    parser.add_argument('--response-size', type=int, default=200, help="Padding characters per fake generated text / search item")
+    parser.add_argument('--missing-rate', type=float, default=0.3, help="Share of catalogue rows with missing content")
+    parser.add_argument('--workdir', help="Directory for catalogues and outputs (default: a temporary directory)")
+    parser.add_argument('--output', default='benchmark_results.json', help="Where to save the results")
+    parser.add_argument('--compare', help="Earlier results file (made with the same settings) to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Slowdown or memory growth counted as a regression")
+    parser.add_argument('--trace-memory', action='store_true', help="Measure each benchmark's peak Python allocations (slow)")
+    parser.add_argument('--verbose', action='store_true', help="Show the output of the benchmarked code")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='pipeline_bench_')
+    os.makedirs(workdir, exist_ok=True)
+
+    # Private cache, URL health and snapshot files, and no quota limits: only the fakes' latency counts
+    use_private_files(workdir)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    benchmarks = [name.strip() for name in args.benchmarks.split(',') if name.strip()]
+    unknown = [name for name in benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    backends = FakeBackends(args.gemini_latency, args.search_latency, args.error_rate, args.response_size)
+    try:
+        results = run_suite(sizes, benchmarks, workdir, backends, args.workers, args.missing_rate, args.verbose, args.trace_memory)
+    finally:
+        backends.close()
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'verbose')},
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nResults saved to {args.output} (work files in {workdir})")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Compressed catalogue snapshots and per-run delta exports.
+Instead of keeping full CSV copies of the sheet around, a run stores one
+compressed snapshot of its input (Parquet when pyarrow is installed, otherwise
+an xz-compressed pickle; identical inputs share one file) and a small JSONL
+delta with only the cells it changed. Any version of the sheet can be rebuilt
+from a snapshot plus its chain of deltas.
+
+Usage:
+    python catalogue_snapshot.py snapshot [--csv FILE]
+    python catalogue_snapshot.py diff --before OLD.csv --after NEW.csv [--label NAME]
+    python catalogue_snapshot.py rebuild catalogue_snapshots/NAME.delta.jsonl --output NEW.csv
+    python catalogue_snapshot.py list
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:  # optional: without it snapshots are xz-compressed pickles
+    pyarrow = None
+
+from catalogue_store import DEFAULT_CSV_FILE, ID_COLUMN, file_hash, read_catalogue_csv
+
+DEFAULT_SNAPSHOT_DIR = 'catalogue_snapshots'
+DELTA_SUFFIX = '.delta.jsonl'
+
+def snapshot_suffix() -> str:
+    return '.parquet' if pyarrow is not None else '.pkl.xz'
+
+def write_snapshot(df: pd.DataFrame, path: str) -> None:
+    """Write df as a compressed snapshot (format chosen by the file suffix)"""
+    tmp_path = path + '.tmp'
+    if path.endswith('.parquet'):
+        df.to_parquet(tmp_path, compression='zstd', index=False)
+    else:
+        df.to_pickle(tmp_path, compression='xz')
+    os.replace(tmp_path, path)
+
+def read_snapshot(path: str) -> pd.DataFrame:
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path, compression='xz')
+
+def _json_value(value: Any) -> Any:
+    """A cell value as JSON (missing values become null)"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def changed_cells(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """One line (row, id, column, old, new) per cell that differs between two versions of the sheet"""
+    if list(before.columns) != list(after.columns) or not before.index.equals(after.index):
+        raise ValueError("Rows or columns differ between the two versions; take a new snapshot instead of a delta")
+
+    ids = after[ID_COLUMN] if ID_COLUMN in after.columns else pd.Series(None, index=after.index, dtype=object)
+    frames = []
+    for column in after.columns:
+        old, new = before[column], after[column]
+        same = (old.isna() & new.isna()) | old.eq(new).fillna(False).astype(bool)
+        changed = ~same.to_numpy()
+        if changed.any():
+            frames.append(pd.DataFrame({'row': after.index[changed], 'id': ids[changed].to_numpy(dtype=object),
+                                        'column': column, 'old': old[changed].to_numpy(dtype=object),
+                                        'new': new[changed].to_numpy(dtype=object)}))
+    if not frames:
+        return pd.DataFrame(columns=['row', 'id', 'column', 'old', 'new'])
+    return pd.concat(frames, ignore_index=True)
+
+def write_delta(changes: pd.DataFrame, path: str, parent: str, source: str = '', result_sha1: Optional[str] = None) -> int:
+    """Write a delta file: a header line naming its parent, then one line per changed cell
+
+    result_sha1 is the hash of the CSV the delta produces, so a later run on that
+    CSV can chain its own delta onto this one.
+    """
+    header = {'parent': parent, 'source': source, 'result_sha1': result_sha1,
+              'created_at': datetime.now().isoformat(timespec='seconds'), 'cells': len(changes)}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(header, ensure_ascii=False) + '\n')
+        for row, record_id, column, old, new in changes[['row', 'id', 'column', 'old', 'new']].itertuples(index=False):
+            cell = {'row': int(row), 'id': _json_value(record_id), 'column': column, 'old': _json_value(old), 'new': _json_value(new)}
+            f.write(json.dumps(cell, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
+    return len(changes)
+
+def read_delta(path: str) -> Tuple[Dict, List[Dict]]:
+    """(header, cells) of a delta file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        cells = [json.loads(line) for line in f if line.strip()]
+    return header, cells
+
+def apply_delta(df: pd.DataFrame, cells: List[Dict]) -> pd.DataFrame:
+    """Set the new value of every delta cell in df (in place) and return df"""
+    for cell in cells:
+        column = cell['column']
+        if column not in df.columns or cell['row'] not in df.index:
+            continue
+        if cell['new'] is not None and df[column].dtype != object and isinstance(cell['new'], str):
+            df[column] = df[column].astype(object)
+        df.at[cell['row'], column] = cell['new']
+    return df
+
+class SnapshotStore:
+    def __init__(self, directory: Optional[str] = None):
+        """Snapshots and deltas kept in directory (default: CATALOGUE_SNAPSHOT_DIR or catalogue_snapshots)"""
+        self.directory = directory or os.getenv('CATALOGUE_SNAPSHOT_DIR', DEFAULT_SNAPSHOT_DIR)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def find_version(self, sha1: str) -> Optional[str]:
+        """A snapshot or delta that reproduces the CSV with this content hash"""
+        for name in os.listdir(self.directory):
+            if name.endswith(('.parquet', '.pkl.xz')) and f".{sha1[:12]}." in name:
+                return name
+        for name in os.listdir(self.directory):
+            if name.endswith(DELTA_SUFFIX):
+                with open(self.path(name), 'r', encoding='utf-8') as f:
+                    if json.loads(f.readline()).get('result_sha1') == sha1:
+                        return name
+        return None
+
+    def snapshot(self, csv_path: str, df: Optional[pd.DataFrame] = None) -> str:
+        """A stored version of csv_path's current contents (df, if given, must be its parsed frame)
+
+        Versions are matched by content hash: an unchanged sheet is stored once, and a CSV
+        written by an earlier recorded run is represented by that run's delta.
+        Returns the snapshot or delta file name within the store.
+        """
+        sha1 = file_hash(csv_path)
+        existing = self.find_version(sha1)
+        if existing is not None:
+            return existing
+        stem = os.path.splitext(os.path.basename(csv_path))[0]
+        name = f"{stem}.{sha1[:12]}{snapshot_suffix()}"
+        if not os.path.exists(self.path(name)):
+            started_at = time.perf_counter()
+            write_snapshot(df if df is not None else read_catalogue_csv(csv_path), self.path(name))
+            print(f"Snapshot saved: {self.path(name)} ({os.path.getsize(self.path(name)) / 1024:.0f} KB, "
+                  f"{time.perf_counter() - started_at:.2f}s)")
+        return name
+
+    def export_delta(self, before: pd.DataFrame, after: pd.DataFrame, parent: str, label: str,
+                     source: str = '', result_sha1: Optional[str] = None) -> str:
+        """Write the cells changed from before to after as label.delta.jsonl on top of parent"""
+        name = label + DELTA_SUFFIX
+        cells = write_delta(changed_cells(before, after), self.path(name), parent, source, result_sha1)
+        print(f"Delta saved: {self.path(name)} ({cells} changed cells on top of {parent})")
+        return name
+
+    def record_run(self, parent: str, before: pd.DataFrame, after: pd.DataFrame, output_csv: str) -> Optional[str]:
+        """Export a run's changes as a delta on top of parent (the snapshot taken of its input)
+
+        output_csv is the CSV the run wrote; the delta is named after it and the current
+        time. Returns the delta's file name, or None if it could not be written.
+        """
+        label = f"{os.path.splitext(os.path.basename(output_csv))[0]}.{datetime.now():%Y%m%d_%H%M%S}"
+        try:
+            result_sha1 = file_hash(output_csv) if output_csv and os.path.exists(output_csv) else None
+            name = self.export_delta(before, after, parent, label, source=output_csv, result_sha1=result_sha1)
+            print(f"Rebuild this version with: python catalogue_snapshot.py rebuild \"{self.path(name)}\" --output FILE.csv")
+            return name
+        except Exception as e:
+            print(f"Could not export the run's delta: {e}")
+            return None
+
+    def rebuild(self, name: str) -> pd.DataFrame:
+        """The sheet as of a snapshot or delta (following the delta's chain of parents)"""
+        chain = []
+        while name.endswith(DELTA_SUFFIX):
+            header, cells = read_delta(self.path(name))
+            chain.append(cells)
+            name = header['parent']
+        df = read_snapshot(self.path(name))
+        for cells in reversed(chain):
+            apply_delta(df, cells)
+        return df
+
+    def entries(self) -> List[Dict]:
+        """Snapshots and deltas in the store, oldest first"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(('.parquet', '.pkl.xz', DELTA_SUFFIX)):
+                entry = {'name': name, 'size': os.path.getsize(self.path(name)), 'modified': os.path.getmtime(self.path(name))}
+                if name.endswith(DELTA_SUFFIX):
+                    header, cells = read_delta(self.path(name))
+                    entry.update(parent=header['parent'], cells=len(cells))
+                entries.append(entry)
+        return sorted(entries, key=lambda entry: entry['modified'])
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressed catalogue snapshots and per-run deltas")
+    parser.add_argument('--dir', default=os.getenv('CATALOGUE_SNAPSHOT_DIR', DEFAULT_SNAPSHOT_DIR), help="Snapshot directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    snapshot_parser = commands.add_parser('snapshot', help="Snapshot a CSV")
+    snapshot_parser.add_argument('--csv', default=DEFAULT_CSV_FILE, help="Product sheet")
+
+    diff_parser = commands.add_parser('diff', help="Export the cells changed between two CSVs")
+    diff_parser.add_argument('--before', required=True, help="Older version of the sheet")
+    diff_parser.add_argument('--after', required=True, help="Newer version of the sheet")
+    diff_parser.add_argument('--label', help="Delta name (default: the newer file's name)")
+
+    rebuild_parser = commands.add_parser('rebuild', help="Rebuild a CSV from a snapshot or delta")
+    rebuild_parser.add_argument('name', help="Snapshot or delta file (in the snapshot directory)")
+    rebuild_parser.add_argument('--output', required=True, help="CSV to write")
+
+    commands.add_parser('list', help="List snapshots and deltas")
+    args = parser.parse_args()
+
+    store = SnapshotStore(args.dir)
+    if args.command == 'snapshot':
+        print(f"Snapshot: {store.path(store.snapshot(args.csv))}")
+    elif args.command == 'diff':
+        before = read_catalogue_csv(args.before)
+        label = args.label or os.path.splitext(os.path.basename(args.after))[0]
+        store.export_delta(before, read_catalogue_csv(args.after), store.snapshot(args.before, before), label,
+                           source=args.after, result_sha1=file_hash(args.after))
+    elif args.command == 'rebuild':
+        started_at = time.perf_counter()
+        df = store.rebuild(os.path.basename(args.name))
+        df.to_csv(args.output, index=False)
+        print(f"Rebuilt {args.output} ({len(df)} rows) in {time.perf_counter() - started_at:.2f}s")
+    else:
+        for entry in store.entries():
+            detail = f"{entry['cells']} cells on top of {entry['parent']}" if 'parent' in entry else "snapshot"
+            print(f"{datetime.fromtimestamp(entry['modified']):%Y-%m-%d %H:%M}  {entry['size'] / 1024:8.0f} KB  {entry['name']}  ({detail})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Single-pass loader for the product sheet.
+The CSV is parsed once with an explicit schema (IDs and quantities as nullable
+integers, everything else text, so barcodes and empty content columns are not
+turned into floats) and cached as a pickle snapshot next to it. The snapshot is
+reused while the CSV's mtime and size are unchanged, or its content hash still
+matches, so every script starts without parsing the sheet again.
+
+Usage:
+    python catalogue_store.py [--csv FILE] [--rebuild]
+"""
+
+import argparse
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+DEFAULT_CSV_FILE = '18062025 - Парфюми  - Sheet1 (1).csv'
+
+# The product name column (column F of the sheet)
+NAME_COLUMN = 'Line'
+ID_COLUMN = 'ID'
+
+# Columns read as nullable integers; every other column is read as text
+INTEGER_COLUMNS = [ID_COLUMN, 'QTY']
+
+# Bump when the schema changes so old snapshots are rebuilt
+SCHEMA_VERSION = 1
+
+def catalogue_dtypes(columns: List[str]) -> Dict[str, str]:
+    """Explicit dtype for every column of the sheet"""
+    return {column: 'Int64' if column in INTEGER_COLUMNS else object for column in columns}
+
+def read_catalogue_csv(csv_path: str) -> pd.DataFrame:
+    """Parse the CSV with the catalogue schema"""
+    columns = pd.read_csv(csv_path, nrows=0).columns.tolist()
+    try:
+        return pd.read_csv(csv_path, dtype=catalogue_dtypes(columns))
+    except (ValueError, TypeError) as e:
+        # A non-numeric ID or quantity somewhere: keep those columns as text too
+        print(f"Warning: {csv_path} does not fit the integer columns ({e}); reading everything as text")
+        return pd.read_csv(csv_path, dtype=object)
+
+def file_hash(path: str) -> str:
+    hasher = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def snapshot_path(csv_path: str) -> str:
+    """Snapshot file next to a CSV"""
+    return os.path.splitext(csv_path)[0] + '.catalogue.pkl'
+
+def backup_csv(csv_path: str, backup_path: str) -> str:
+    """Back up a CSV by copying the file (no parse and rewrite)"""
+    shutil.copy2(csv_path, backup_path)
+    return backup_path
+
+class CatalogueStore:
+    def __init__(self, csv_path: str = DEFAULT_CSV_FILE, cache_path: Optional[str] = None, use_cache: bool = True):
+        """Load csv_path through a snapshot at cache_path (default: next to the CSV)"""
+        self.csv_path = csv_path
+        self.cache_path = cache_path or snapshot_path(csv_path)
+        self.use_cache = use_cache
+        self._lock = threading.Lock()
+        self._key: Optional[Dict] = None
+        self._frame: Optional[pd.DataFrame] = None
+
+    def _file_key(self) -> Dict:
+        stat = os.stat(self.csv_path)
+        return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+    def _read_snapshot(self, key: Dict) -> Optional[pd.DataFrame]:
+        """The snapshot's frame if it still matches the CSV, else None"""
+        if not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'rb') as f:
+                snapshot = pickle.load(f)
+        except Exception as e:
+            print(f"Ignoring unreadable catalogue snapshot {self.cache_path}: {e}")
+            return None
+        if snapshot.get('schema') != SCHEMA_VERSION or snapshot.get('size') != key['size']:
+            return None
+        if snapshot.get('mtime_ns') != key['mtime_ns']:
+            # Touched but possibly unchanged (e.g. copied or checked out again)
+            if snapshot.get('sha1') != file_hash(self.csv_path):
+                return None
+            snapshot['mtime_ns'] = key['mtime_ns']
+            self._write_snapshot(snapshot)
+        return snapshot['frame']
+
+    def _write_snapshot(self, snapshot: Dict) -> None:
+        tmp_path = self.cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"Could not write catalogue snapshot {self.cache_path}: {e}")
+
+    def _load_frame(self) -> pd.DataFrame:
+        key = self._file_key()
+        if self._frame is not None and self._key == key:
+            return self._frame
+
+        frame = self._read_snapshot(key) if self.use_cache else None
+        if frame is None:
+            started_at = time.perf_counter()
+            frame = read_catalogue_csv(self.csv_path)
+            print(f"Parsed {self.csv_path} ({len(frame)} rows) in {time.perf_counter() - started_at:.2f}s")
+            if self.use_cache:
+                self._write_snapshot(dict(key, schema=SCHEMA_VERSION, sha1=file_hash(self.csv_path), frame=frame))
+        self._key, self._frame = key, frame
+        return frame
+
+    def load(self) -> pd.DataFrame:
+        """The sheet with its positional row index (a copy the caller may modify)"""
+        with self._lock:
+            return self._load_frame().copy()
+
+    def by_id(self) -> pd.DataFrame:
+        """The sheet indexed by product ID (rows without an ID are dropped)"""
+        with self._lock:
+            frame = self._load_frame()
+            return frame[frame[ID_COLUMN].notna()].set_index(ID_COLUMN, drop=False)
+
+    def product_names(self) -> List[str]:
+        """Product names in sheet order, without empty rows"""
+        with self._lock:
+            return self._load_frame()[NAME_COLUMN].dropna().tolist()
+
+    def refresh(self) -> None:
+        """Forget the in-memory copy and rebuild the snapshot from the CSV"""
+        with self._lock:
+            self._key = self._frame = None
+            if os.path.exists(self.cache_path):
+                os.remove(self.cache_path)
+            self._load_frame()
+
+_stores: Dict[str, CatalogueStore] = {}
+_stores_lock = threading.Lock()
+
+def get_catalogue_store(csv_path: str = DEFAULT_CSV_FILE) -> CatalogueStore:
+    """Return the process-wide store for a CSV file"""
+    key = os.path.abspath(csv_path)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = CatalogueStore(csv_path)
+        return _stores[key]
+
+def load_catalogue(csv_path: str = DEFAULT_CSV_FILE) -> pd.DataFrame:
+    """Load a sheet through its shared store"""
+    return get_catalogue_store(csv_path).load()
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the catalogue snapshot of a product sheet")
+    parser.add_argument('--csv', default=DEFAULT_CSV_FILE, help="Product sheet")
+    parser.add_argument('--rebuild', action='store_true', help="Parse the CSV again and rewrite the snapshot")
+    args = parser.parse_args()
+
+    store = get_catalogue_store(args.csv)
+    if args.rebuild:
+        store.refresh()
+    started_at = time.perf_counter()
+    df = store.load()
+    print(f"Loaded {len(df)} rows x {len(df.columns)} columns in {(time.perf_counter() - started_at) * 1000:.1f}ms")
+    print(f"Snapshot: {store.cache_path}")
+    print(f"Products with an ID: {len(store.by_id())}, with a name: {len(store.product_names())}")
+
+if __name__ == "__main__":
+    main()
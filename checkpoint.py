@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Write-ahead journal for incremental CSV checkpoints.
+Instead of rewriting the whole CSV after every updated record, only the changed
+cells are appended to a small JSONL journal next to the output file. The journal
+is compacted into the CSV periodically and at the end of a run, and replayed on
+the next start if the previous run crashed before compacting. The journal's first
+line names the CSV it belongs to, so it can live at a stable path (e.g. derived
+from the input file) even when the output file name changes from run to run.
+"""
+
+import json
+import os
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+from catalogue_store import read_catalogue_csv
+
+def journal_target(journal_path: str) -> Optional[str]:
+    """The CSV a leftover journal belongs to, or None if there is no journal to replay"""
+    if not os.path.exists(journal_path) or os.path.getsize(journal_path) == 0:
+        return None
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        try:
+            return json.loads(f.readline()).get('csv')
+        except ValueError:
+            return None
+
+class CheckpointJournal:
+    def __init__(self, csv_path: str, compact_every: int = 25, journal_path: Optional[str] = None):
+        """Journal for csv_path, stored at journal_path (default <csv_path>.journal.jsonl)"""
+        self.csv_path = csv_path
+        self.journal_path = journal_path or csv_path + '.journal.jsonl'
+        self.compact_every = compact_every
+        self.pending = 0
+
+    def has_entries(self) -> bool:
+        return os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > 0
+
+    def record(self, index: int, cells: Dict[str, Any], record_id: Any = None) -> None:
+        """Append the changed cells of one row as a single journal line"""
+        entry = {'row': int(index), 'id': None if record_id is None or pd.isna(record_id) else str(record_id), 'cells': cells}
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            if f.tell() == 0:
+                f.write(json.dumps({'csv': self.csv_path}, ensure_ascii=False) + '\n')
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.pending += 1
+
+    def replay(self, df: pd.DataFrame) -> int:
+        """Apply journaled cell changes to df. Returns the number of rows replayed."""
+        if not self.has_entries():
+            return 0
+
+        ids = df['ID'].astype(str) if 'ID' in df.columns else None
+        replayed = 0
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash; everything before it is intact
+                    continue
+                if 'row' not in entry:
+                    continue  # the header naming the CSV
+
+                index = entry['row']
+                # Trust the row number only if it still points at the same product ID
+                if ids is not None and entry.get('id') is not None and (index not in df.index or ids.at[index] != entry['id']):
+                    matches = df.index[(ids == entry['id']).to_numpy()]
+                    if len(matches) == 0:
+                        continue
+                    index = matches[0]
+                if index not in df.index:
+                    continue
+
+                for field, value in entry['cells'].items():
+                    if field in df.columns:
+                        if df[field].dtype != object:
+                            df[field] = df[field].astype(object)
+                        df.at[index, field] = value
+                replayed += 1
+        return replayed
+
+    def compact(self, df: pd.DataFrame) -> None:
+        """Write df to the CSV atomically and clear the journal"""
+        tmp_path = self.csv_path + '.tmp'
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.csv_path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.pending = 0
+
+    def maybe_compact(self, df: pd.DataFrame) -> bool:
+        """Compact once compact_every records have been journaled since the last compaction"""
+        if self.pending >= self.compact_every:
+            self.compact(df)
+            return True
+        return False
+
+    def recover(self) -> Optional[pd.DataFrame]:
+        """Replay a leftover journal from a crashed run into its CSV
+
+        Returns the recovered frame, or None if there was nothing to recover.
+        """
+        if not self.has_entries() or not os.path.exists(self.csv_path):
+            return None
+        df = read_catalogue_csv(self.csv_path)
+        replayed = self.replay(df)
+        self.compact(df)
+        print(f"Recovered {replayed} journaled records into {self.csv_path}")
+        return df
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the external services used by the pipeline.
+They let the link validation code be exercised offline against hosts that are
+fast, slow, broken or serve the wrong content type, and the generation and
+search code be benchmarked against Gemini, Custom Search and YouTube fakes
+with a known latency, error rate and response size.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+from batch_generation import PRODUCTS_MARKER
+from results_parser import DESCRIPTION_SECTIONS
+
+# A tiny valid GIF so image responses carry a real body
+PIXEL_GIF = (b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00'
+             b'\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;')
+
+class _ImageHostHandler(BaseHTTPRequestHandler):
+    """Routes:
+    /image/<name>          200 image/gif
+    /slow/<seconds>/<name> sleeps, then 200 image/gif
+    /html/<name>           200 text/html (not an image)
+    /broken/<name>         404
+    /error/<name>          500
+    /nohead/<name>         HEAD 405, GET 200 image/gif (206 with one byte for a Range request)
+    """
+    # Keep-alive like a real CDN, so connection pooling can be observed
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # Keep test and benchmark output quiet
+        pass
+
+    def _respond(self, send_body: bool):
+        with self.server.counts_lock:
+            self.server.request_counts[self.command] = self.server.request_counts.get(self.command, 0) + 1
+        parts = self.path.strip('/').split('/')
+        route = parts[0] if parts else ''
+
+        if route == 'slow' and len(parts) > 1:
+            time.sleep(float(parts[1]))
+            route = 'image'
+
+        if route == 'nohead':
+            if self.command == 'HEAD':
+                route = 'method_not_allowed'
+            elif self.headers.get('Range'):
+                route = 'range'
+            else:
+                route = 'image'
+
+        if route == 'image':
+            status, content_type, body = 200, 'image/gif', PIXEL_GIF
+        elif route == 'range':
+            status, content_type, body = 206, 'image/gif', PIXEL_GIF[:1]
+        elif route == 'method_not_allowed':
+            status, content_type, body = 405, 'text/plain', b'Method not allowed'
+        elif route == 'html':
+            status, content_type, body = 200, 'text/html; charset=utf-8', b'<html><body>Not an image</body></html>'
+        elif route == 'error':
+            status, content_type, body = 500, 'text/plain', b'Internal error'
+        else:
+            status, content_type, body = 404, 'text/plain', b'Not found'
+
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if send_body:
+                self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (e.g. a cancelled or timed out check)
+            pass
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+class LocalImageHost:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        """Start a threaded HTTP server on a free local port"""
+        self.server = ThreadingHTTPServer((host, port), _ImageHostHandler)
+        self.server.daemon_threads = True
+        self.server.request_counts = {}
+        self.server.counts_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path: str) -> str:
+        """Build a URL on this host, e.g. url('slow/3/a.jpg')"""
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    @property
+    def request_counts(self) -> Dict[str, int]:
+        """Number of requests served per HTTP method"""
+        with self.server.counts_lock:
+            return dict(self.server.request_counts)
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class FakeAPIError(Exception):
+    """Error raised by the fake services, shaped like googleapiclient's HttpError"""
+    def __init__(self, status_code: int = 503, reason: str = 'backendError'):
+        super().__init__(f"<FakeAPIError {status_code}: {reason}>")
+        self.status_code = status_code
+        self.content = json.dumps({'error': {'errors': [{'reason': reason}]}}).encode()
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+def filler(size: int) -> str:
+    """size characters of padding text, to make fake responses as large as real ones"""
+    return ('Примерен текст ' * (size // 15 + 1))[:size] if size > 0 else ''
+
+class _FakeService:
+    def __init__(self, latency: float = 0.05, error_rate: float = 0.0, response_size: int = 0, seed: int = 0):
+        """Shared behaviour of the fake APIs: a fixed latency and a random share of 503 errors"""
+        self.latency = latency
+        self.error_rate = error_rate
+        self.response_size = response_size
+        self.request_count = 0
+        self.error_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _start_request(self) -> bool:
+        """Count a request; returns True if it should fail"""
+        with self._lock:
+            self.request_count += 1
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.error_count += 1
+        return fail
+
+    def _call(self, answer: Callable[[], Dict]) -> Dict:
+        fail = self._start_request()
+        time.sleep(self.latency)
+        if fail:
+            raise FakeAPIError(503)
+        return answer()
+
+class _FakeRequest:
+    def __init__(self, service: _FakeService, answer: Callable[[], Dict]):
+        self.service = service
+        self.answer = answer
+
+    def execute(self) -> Dict:
+        return self.service._call(self.answer)
+
+class FakeCustomSearchService(_FakeService):
+    def __init__(self, image_host: Optional[LocalImageHost] = None, broken_rate: float = 0.2, **kwargs):
+        """Stand-in for build("customsearch", "v1"): cse().list(...).execute()
+
+        Image links point at image_host (or a placeholder domain); about broken_rate
+        of them are HTML pages or 404s, so validation has something to reject.
+        """
+        super().__init__(**kwargs)
+        self.image_host = image_host
+        self.broken_rate = broken_rate
+
+    def cse(self):
+        return self
+
+    def list(self, q: str = '', num: int = 10, **params) -> _FakeRequest:
+        return _FakeRequest(self, lambda: self._search(q, num))
+
+    def _search(self, query: str, num: int) -> Dict:
+        items = []
+        for rank in range(num):
+            digest = hashlib.sha1(f"{query}|{rank}".encode('utf-8')).hexdigest()[:16]
+            bucket = int(digest[:4], 16) / 0xFFFF
+            route = 'image' if bucket >= self.broken_rate else ('html' if bucket < self.broken_rate / 2 else 'broken')
+            path = f"{route}/{digest}.jpg"
+            link = self.image_host.url(path) if self.image_host else f"https://images.example.com/{path}"
+            items.append({'link': link, 'title': query, 'snippet': filler(self.response_size)})
+        return {'items': items}
+
+class FakeYouTubeService(_FakeService):
+    """Stand-in for build("youtube", "v3"): search().list(...).execute()"""
+
+    def search(self):
+        return self
+
+    def list(self, q: str = '', **params) -> _FakeRequest:
+        video_id = hashlib.sha1(q.encode('utf-8')).hexdigest()[:11]
+        return _FakeRequest(self, lambda: {'items': [{'id': {'videoId': video_id}, 'snippet': {'title': q, 'description': filler(self.response_size)}}]})
+
+class FakeGenerativeModel:
+    def __init__(self, latency: float = 0.2, per_product_latency: float = 0.0, max_batch_products: Optional[int] = None,
+                 drop_key_every: Optional[int] = None, error_rate: float = 0.0, response_size: int = 0, seed: int = 0):
+        """Offline stand-in for genai.GenerativeModel
+
+        Every request sleeps latency (+ per_product_latency for each product in a batch).
+        Batch prompts get a JSON answer keyed by product id; batches larger than
+        max_batch_products get truncated JSON, like a model that ran out of output tokens.
+        Requests with a response_schema get a JSON object with the required keys, except
+        that every drop_key_every-th answer leaves out its last key. Other prompts get a
+        description with the six numbered sections. A share error_rate of requests fails
+        with a 503, and each generated text is padded with response_size characters.
+        """
+        self.latency = latency
+        self.per_product_latency = per_product_latency
+        self.max_batch_products = max_batch_products
+        self.drop_key_every = drop_key_every
+        self.error_rate = error_rate
+        self.response_size = response_size
+        self.structured_count = 0
+        self.request_count = 0
+        self.error_count = 0
+        self.total_latency = 0.0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _batch_answer(self, prompt: str) -> str:
+        listing = prompt.split(PRODUCTS_MARKER, 1)[1].strip().split('\n', 1)[0]
+        products = json.loads(listing)
+        answer = json.dumps({
+            p['id']: {field: f"{field.split('. ', 1)[-1]} за {p['product']} {filler(self.response_size)}".rstrip() for field in p['fields']}
+            for p in products
+        }, ensure_ascii=False)
+        if self.max_batch_products is not None and len(products) > self.max_batch_products:
+            return answer[:len(answer) // 2]
+        return answer
+
+    def _delay(self, prompt: str) -> float:
+        products = prompt.split(PRODUCTS_MARKER, 1)[1].count('"id"') if PRODUCTS_MARKER in prompt else 1
+        delay = self.latency + self.per_product_latency * products
+        with self._lock:
+            self.request_count += 1
+            self.total_latency += delay
+        return delay
+
+    def _fails(self) -> bool:
+        with self._lock:
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.error_count += 1
+        return fail
+
+    def generate_content(self, prompt: str, generation_config=None, **kwargs) -> FakeResponse:
+        time.sleep(self._delay(prompt))
+        if self._fails():
+            raise FakeAPIError(503, 'UNAVAILABLE')
+        return self._answer(prompt, generation_config)
+
+    async def generate_content_async(self, prompt: str, generation_config=None, **kwargs) -> FakeResponse:
+        await asyncio.sleep(self._delay(prompt))
+        if self._fails():
+            raise FakeAPIError(503, 'UNAVAILABLE')
+        return self._answer(prompt, generation_config)
+
+    def _answer(self, prompt: str, generation_config) -> FakeResponse:
+        if PRODUCTS_MARKER in prompt:
+            return FakeResponse(self._batch_answer(prompt))
+        schema = (generation_config or {}).get('response_schema')
+        if schema:
+            keys = list(schema['required'])
+            with self._lock:
+                self.structured_count += 1
+                drop = self.drop_key_every and self.structured_count % self.drop_key_every == 0
+            if drop:
+                keys = keys[:-1]
+            return FakeResponse(json.dumps({key: f"Примерен текст ({key}) {filler(self.response_size)}".rstrip() for key in keys}, ensure_ascii=False))
+        return FakeResponse('\n\n'.join(f"**{number}. {label}:**\nПримерен текст за раздел {number}. {filler(self.response_size)}".rstrip()
+                                         for number, (_, label) in DESCRIPTION_SECTIONS.items()))
@@ -1,33 +1,73 @@
-import pandas as pd
 import google.generativeai as genai
 import time
 import os
-import requests
-import json
-import re
-from typing import List, Dict, Optional
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, List, Dict, Optional, Tuple
 from googleapiclient.discovery import build
 
+from catalogue_store import get_catalogue_store
+from http_session import PooledHTTPSession, get_shared_session
+from instrumentation import get_run_metrics, report_path
+from pipeline_stages import DEFAULT_STAGE_TIMEOUTS, format_stage_errors, run_stages, stage_error_messages, stage_status
+from product_families import ProductFamilies, adapt_result, shares_images
+from rate_limiter import RateLimiter, get_rate_limiter
+from resilience import call_with_retry, find_circuit_error, wait_for_circuit
+from results_jsonl import JSONLResultsWriter, iter_jsonl_records, last_product_number, record_to_result
+from results_parser import ResultsIndex
+from response_cache import ResponseCache, get_shared_cache
+from structured_generation import SECTION_KEYS, StructuredSectionGenerator, sections_to_description
+from url_health import URLHealthStore, get_shared_health_store
+
 class GoogleImageSearcher:
-    def __init__(self, api_key: str, search_engine_id: str):
-        """Initialize Google Custom Search API client"""
+    def __init__(self, api_key: str, search_engine_id: str, rate_limiter: Optional[RateLimiter] = None, http_session: Optional[PooledHTTPSession] = None, cache: Optional[ResponseCache] = None, url_health: Optional[URLHealthStore] = None,
+                 service_factory: Optional[Callable[[], Any]] = None):
+        """Initialize Google Custom Search API client (service_factory replaces build(), e.g. with a fake service)"""
         self.api_key = api_key
         self.search_engine_id = search_engine_id
-        self.service = build("customsearch", "v1", developerKey=api_key)
+        self.service_factory = service_factory or (lambda: build("customsearch", "v1", developerKey=self.api_key))
+        self.rate_limiter = rate_limiter or get_rate_limiter('customsearch')
+        self.http_session = http_session or get_shared_session()
+        self.cache = cache or get_shared_cache()
+        self.url_health = url_health or get_shared_health_store()
+        self.max_validation_workers = 10
+        self._local = threading.local()
+    
+    @property
+    def service(self):
+        """Per-thread Custom Search client (httplib2 connections are not thread-safe)"""
+        if not hasattr(self._local, 'service'):
+            self._local.service = self.service_factory()
+        return self._local.service
         
     def search_images(self, query: str, num_images: int = 5) -> List[str]:
-        """Search for images using Google Custom Search API"""
+        """Search for images using Google Custom Search API
+        
+        Transient and rate limit errors are retried; errors that remain are raised so
+        the image stage records them instead of writing an empty result.
+        """
         try:
-            # Perform the search
-            result = self.service.cse().list(
-                q=query,
-                cx=self.search_engine_id,
-                searchType='image',
-                num=num_images,
-                imgSize='LARGE',
-                imgType='photo',
-                safe='active'
-            ).execute()
+            # Reuse the answer from a previous run if we have one
+            found, image_urls = self.cache.get('customsearch', query, prompt=f"num={num_images}")
+            if found:
+                return image_urls
+            
+            def search():
+                # Wait for a Custom Search quota slot, then perform the search
+                self.rate_limiter.acquire()
+                with get_run_metrics().api_call('customsearch'):
+                    return self.service.cse().list(
+                        q=query,
+                        cx=self.search_engine_id,
+                        searchType='image',
+                        num=num_images,
+                        imgSize='LARGE',
+                        imgType='photo',
+                        safe='active'
+                    ).execute()
+            
+            result = call_with_retry('customsearch', search)
             
             # Extract image URLs
             image_urls = []
@@ -36,267 +76,552 @@ class GoogleImageSearcher:
                     if 'link' in item:
                         image_urls.append(item['link'])
             
+            self.cache.set('customsearch', query, image_urls, prompt=f"num={num_images}")
             return image_urls
         except Exception as e:
             print(f"Error searching images for '{query}': {str(e)}")
-            return []
+            raise
+    
+    @staticmethod
+    def is_working_image(record: Dict) -> bool:
+        """Check if a URL health record is a successful response with an image content type"""
+        return URLHealthStore.is_image(record)
     
     def validate_image_url(self, url: str, timeout: int = 10) -> bool:
-        """Validate if an image URL is accessible and returns an image"""
+        """Validate if an image URL is accessible and returns an image (recent checks are answered locally)"""
         try:
-            response = requests.head(url, timeout=timeout, allow_redirects=True)
-            content_type = response.headers.get('content-type', '').lower()
-            
-            # Check if the response is successful and content type is an image
-            return (response.status_code == 200 and 
-                    any(img_type in content_type for img_type in ['image/', 'jpeg', 'jpg', 'png', 'gif', 'webp']))
+            return self.is_working_image(self.url_health.check(url, self.http_session, timeout))
         except:
             return False
     
+    @staticmethod
+    def top_valid_ranks(checked: Dict[int, bool], count: int, num_images: int) -> List[int]:
+        """Valid ranks, best first, among the checked ranks before the first unchecked one (at most num_images)"""
+        selected = []
+        for rank in range(count):
+            if rank not in checked or len(selected) >= num_images:
+                break
+            if checked[rank]:
+                selected.append(rank)
+        return selected
+    
     def get_working_image_urls(self, query: str, num_images: int = 5) -> List[str]:
-        """Get working image URLs for a search query"""
+        """Get working image URLs for a search query
+        
+        Candidates are validated concurrently. The remaining checks are cancelled
+        once the num_images best-ranked valid URLs are known, i.e. every URL ranked
+        above the num_images-th valid one has been checked, so the result is the same
+        as checking them one by one in search-rank order (a slow top result is
+        waited for rather than replaced by faster lower-ranked ones).
+        """
         # Search for more images than needed to account for invalid ones
         search_results = self.search_images(query, num_images * 2)
+        if not search_results:
+            return []
         
-        working_urls = []
-        for url in search_results:
-            if len(working_urls) >= num_images:
-                break
-                
-            if self.validate_image_url(url):
-                working_urls.append(url)
-                print(f"✓ Valid image URL found: {url[:80]}...")
-            else:
-                print(f"✗ Invalid image URL: {url[:80]}...")
+        executor = ThreadPoolExecutor(max_workers=min(self.max_validation_workers, len(search_results)))
+        futures = {executor.submit(self.validate_image_url, url): rank for rank, url in enumerate(search_results)}
+        checked: Dict[int, bool] = {}
+        selected: List[int] = []
+        try:
+            for future in as_completed(futures):
+                rank = futures[future]
+                url = search_results[rank]
+                checked[rank] = future.result()
+                if checked[rank]:
+                    print(f"✓ Valid image URL found: {url[:80]}...")
+                else:
+                    print(f"✗ Invalid image URL: {url[:80]}...")
+                selected = self.top_valid_ranks(checked, len(search_results), num_images)
+                if len(selected) >= num_images:
+                    break
+        finally:
+            # Drop checks that have not started; running ones finish in the background
+            executor.shutdown(wait=False, cancel_futures=True)
         
-        return working_urls
+        return [search_results[rank] for rank in selected]
 
 class YouTubeSearcher:
-    def __init__(self, api_key: str):
-        """Initialize YouTube Data API client"""
+    def __init__(self, api_key: str, rate_limiter: Optional[RateLimiter] = None, cache: Optional[ResponseCache] = None,
+                 service_factory: Optional[Callable[[], Any]] = None):
+        """Initialize YouTube Data API client (service_factory replaces build(), e.g. with a fake service)"""
         self.api_key = api_key
-        self.service = build("youtube", "v3", developerKey=api_key)
+        self.service_factory = service_factory or (lambda: build("youtube", "v3", developerKey=self.api_key))
+        self.rate_limiter = rate_limiter or get_rate_limiter('youtube')
+        self.cache = cache or get_shared_cache()
+        self._local = threading.local()
+    
+    @property
+    def service(self):
+        """Per-thread YouTube client (httplib2 connections are not thread-safe)"""
+        if not hasattr(self._local, 'service'):
+            self._local.service = self.service_factory()
+        return self._local.service
     
     def search_video(self, query: str) -> Optional[str]:
-        """Search for a YouTube video"""
+        """Search for a YouTube video (errors left after retrying are raised)"""
         try:
-            # Perform the search
-            result = self.service.search().list(
-                q=query,
-                part='snippet',
-                type='video',
-                maxResults=1,
-                order='relevance',
-                safeSearch='moderate'
-            ).execute()
+            # Reuse the answer from a previous run if we have one
+            found, video_url = self.cache.get('youtube', query)
+            if found:
+                return video_url
+            
+            def search():
+                # Wait for a YouTube quota slot, then perform the search
+                self.rate_limiter.acquire()
+                with get_run_metrics().api_call('youtube'):
+                    return self.service.search().list(
+                        q=query,
+                        part='snippet',
+                        type='video',
+                        maxResults=1,
+                        order='relevance',
+                        safeSearch='moderate'
+                    ).execute()
+            
+            result = call_with_retry('youtube', search)
             
             # Extract video URL
+            video_url = None
             if 'items' in result and len(result['items']) > 0:
                 video_id = result['items'][0]['id']['videoId']
-                return f"https://www.youtube.com/watch?v={video_id}"
+                video_url = f"https://www.youtube.com/watch?v={video_id}"
             
-            return None
+            self.cache.set('youtube', query, video_url)
+            return video_url
         except Exception as e:
             print(f"Error searching YouTube for '{query}': {str(e)}")
-            return None
+            raise
 
 class GeminiCSVProcessor:
-    def __init__(self, gemini_api_key: str, google_api_key: str, search_engine_id: str):
-        """Initialize the Gemini API client and Google Search"""
-        genai.configure(api_key=gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+    def __init__(self, gemini_api_key: str, google_api_key: str, search_engine_id: str, model=None,
+                 image_searcher: Optional[GoogleImageSearcher] = None, youtube_searcher: Optional[YouTubeSearcher] = None):
+        """Initialize the Gemini API client and Google Search (model and searchers can be injected, e.g. fakes for benchmarks)"""
+        self.model_name = 'gemini-2.0-flash-exp'
+        if model is None:
+            genai.configure(api_key=gemini_api_key)
+            model = genai.GenerativeModel(self.model_name)
+        self.model = model
+        self.rate_limiter = get_rate_limiter('gemini')
+        self.cache = get_shared_cache()
+        self.section_generator = StructuredSectionGenerator(self.model, self.model_name, self.rate_limiter, self.cache)
+        
+        # Text, image and video stages of a product run side by side on a pool
+        # created on first use and shut down by close() (process_csv closes it)
+        self.stage_timeouts = dict(DEFAULT_STAGE_TIMEOUTS)
+        self.stage_workers = 32
+        self._stage_executor: Optional[ThreadPoolExecutor] = None
+        self._stage_lock = threading.Lock()
         
         # Initialize search services
-        self.image_searcher = GoogleImageSearcher(google_api_key, search_engine_id)
-        self.youtube_searcher = YouTubeSearcher(google_api_key)
+        self.image_searcher = image_searcher or GoogleImageSearcher(google_api_key, search_engine_id)
+        self.youtube_searcher = youtube_searcher or YouTubeSearcher(google_api_key)
         
+        # Size/shade/tester families whose content is generated once (set by process_csv)
+        self.families: Optional[ProductFamilies] = None
+    
+    @property
+    def stage_executor(self) -> ThreadPoolExecutor:
+        with self._stage_lock:
+            if self._stage_executor is None:
+                self._stage_executor = ThreadPoolExecutor(max_workers=self.stage_workers, thread_name_prefix='stage')
+            return self._stage_executor
+    
+    def close(self) -> None:
+        """Shut down the stage pool (it is created again if the processor is used afterwards)"""
+        with self._stage_lock:
+            executor, self._stage_executor = self._stage_executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
     def create_prompt(self, product_name: str) -> str:
-        """Create the prompt for each product"""
-        base_prompt = f"""Write a detailed product description for this beauty/perfume product in Bulgarian language following this structure:
-
-Best Description Structure for Beauty & Perfume Products
-
-1. Captivating Headline or Tagline
-Start with a brief, poetic or powerful phrase that evokes the essence of the product in Bulgarian.
-
-2. Sensory Introduction (1–2 sentences)
-Describe the experience of using the product, focusing on the feel, scent, effect, or vibe in Bulgarian.
-
-3. Key Features or Ingredients (Bullet Points)
-Present the top 4–6 features, focusing on performance, quality, and what sets it apart in Bulgarian.
-
-4. How to Use
-Simple step-by-step instructions in Bulgarian.
-
-5. Emotional or Lifestyle Hook
-Show the identity or vibe the user taps into by using it in Bulgarian.
-
-6. Tech Specs or Product Facts
-Include size/volume, longevity, origin, certifications in Bulgarian.
-
-Product: {product_name}
-
-Please write ONLY the product description in Bulgarian. Do NOT include any image URLs or video links in your response as I will handle those separately."""
-        
-        return base_prompt
+        """Create the prompt for each product (all six sections as schema-constrained JSON)"""
+        return self.section_generator.create_prompt(product_name, SECTION_KEYS)
+    
+    def search_product_images(self, product_name: str) -> List[str]:
+        """Search for working product images"""
+        image_query = f"{product_name} product high quality"
+        return self.image_searcher.get_working_image_urls(image_query, 5)
+    
+    def search_product_video(self, product_name: str) -> Optional[str]:
+        """Search for a YouTube video of the product"""
+        video_query = f"{product_name} review tutorial"
+        return self.youtube_searcher.search_video(video_query)
     
     def search_product_media(self, product_name: str) -> Dict:
         """Search for images and video for a product"""
         print(f"Searching for media for: {product_name}")
+        return {
+            'images': self.search_product_images(product_name),
+            'video': self.search_product_video(product_name)
+        }
+    
+    def build_result(self, product_name: str, outputs: Dict, stage_errors: Dict[str, Exception], started_at: float) -> Dict:
+        """Combine the stage outputs of a product into a result ('success', 'partial' or 'error')
         
-        # Search for product images
-        image_query = f"{product_name} product high quality"
-        image_urls = self.image_searcher.get_working_image_urls(image_query, 5)
+        'circuit_open' is the CircuitOpenError a stage hit, if any; such a product
+        should be processed again once the service is available rather than written.
+        """
+        errors = stage_error_messages(stage_errors)
+        sections = outputs.get('text') or {}
+        if not sections and 'text' not in errors:
+            errors['text'] = "Gemini returned no usable description sections"
+        images = outputs.get('images') or []
+        video = outputs.get('video')
+        status = stage_status(errors, bool(sections or images or video))
         
-        # Search for YouTube video
-        video_query = f"{product_name} review tutorial"
-        video_url = self.youtube_searcher.search_video(video_query)
+        for stage, message in errors.items():
+            print(f"✗ {stage} stage failed for {product_name}: {message}")
         
         return {
-            'images': image_urls,
-            'video': video_url
+            'product': product_name,
+            'description': sections_to_description(sections) if status != 'error' else f"Error: {format_stage_errors(errors)}",
+            'sections': sections,
+            'images': images,
+            'video': video,
+            'status': status,
+            'errors': errors,
+            'circuit_open': find_circuit_error(stage_errors.values()),
+            'elapsed': time.time() - started_at
         }
     
     def process_product(self, product_name: str) -> Dict:
-        """Process a single product through Gemini API and search for media"""
+        """Process a single product: description, images and video are fetched concurrently
+        
+        Each stage has its own timeout (self.stage_timeouts). A failed stage is recorded
+        under 'errors' and the product is still written with what the other stages found.
+        With self.families set, a variant whose sibling was already processed successfully
+        reuses that content, adapted to its own name, volume and shade (a different
+        shade only searches for its own images).
+        """
+        if self.families is not None:
+            sibling = self.families.claim(product_name)
+            if sibling is not None:
+                result = self.reuse_sibling(sibling, product_name)
+                if shares_images(sibling['product'], product_name):
+                    return result
+                with get_run_metrics().product(product_name):
+                    outputs, errors = run_stages(self.stage_executor, {
+                        'images': lambda: self.search_product_images(product_name)
+                    }, self.stage_timeouts)
+                return self.add_own_images(result, outputs, errors)
+        
+        result = None
         try:
-            # Get product description from Gemini
-            prompt = self.create_prompt(product_name)
-            response = self.model.generate_content(prompt)
-            
-            # Search for actual working media links
-            media_data = self.search_product_media(product_name)
-            
-            return {
-                'product': product_name,
-                'description': response.text,
-                'images': media_data['images'],
-                'video': media_data['video'],
-                'status': 'success'
-            }
-        except Exception as e:
-            return {
-                'product': product_name,
-                'description': f"Error: {str(e)}",
-                'images': [],
-                'video': None,
-                'status': 'error'
-            }
+            started_at = time.time()
+            print(f"Generating description and searching for media for: {product_name}")
+            with get_run_metrics().product(product_name):
+                outputs, errors = run_stages(self.stage_executor, {
+                    'text': lambda: self.section_generator.generate(product_name),
+                    'images': lambda: self.search_product_images(product_name),
+                    'video': lambda: self.search_product_video(product_name)
+                }, self.stage_timeouts)
+            result = self.build_result(product_name, outputs, errors, started_at)
+            return result
+        finally:
+            if self.families is not None:
+                self.families.finish(product_name, result)
+    
+    def reuse_sibling(self, sibling: Dict, product_name: str) -> Dict:
+        """A sibling's result adapted to product_name (without images if the shade differs)"""
+        print(f"Reusing the content of {sibling['product']} for: {product_name}")
+        with get_run_metrics().product(product_name), get_run_metrics().stage('family_reuse'):
+            return adapt_result(sibling, product_name)
+    
+    def add_own_images(self, result: Dict, outputs: Dict, stage_errors: Dict[str, Exception]) -> Dict:
+        """A reused result completed with the output of the variant's own image stage"""
+        errors = dict(result.get('errors') or {}, **stage_error_messages(stage_errors))
+        for stage, message in stage_error_messages(stage_errors).items():
+            print(f"✗ {stage} stage failed for {result['product']}: {message}")
+        images = outputs.get('images') or []
+        status = stage_status(errors, bool(result.get('sections') or images or result.get('video')))
+        return dict(result, images=images, errors=errors, status=status,
+                    circuit_open=find_circuit_error(stage_errors.values()))
+    
+    def settle_circuit(self, product_name: str, result: Dict) -> Optional[Dict]:
+        """Process a product again while its result hit an open circuit breaker
+        
+        Returns the final result, or None when a daily quota is exhausted and the
+        run should stop without writing the product.
+        """
+        while result.get('circuit_open'):
+            if not wait_for_circuit(result['circuit_open']):
+                return None
+            result = self.process_product(product_name)
+        return result
     
     def get_last_processed_product(self, output_file: str) -> int:
-        """Get the number of the last processed product from the output file"""
+        """Get the number of the last processed product from the output file's offset index"""
         if not os.path.exists(output_file):
             return 0
         
         try:
-            with open(output_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            # Find all product numbers using regex
-            product_matches = re.findall(r'PRODUCT (\d+):', content)
-            
-            if product_matches:
-                last_product_num = max(int(num) for num in product_matches)
+            # Only the part of the file written since the last lookup is scanned
+            last_product_num = ResultsIndex(output_file).refresh().last_product_number()
+            if last_product_num > 0:
                 print(f"Found existing output file. Last processed product: {last_product_num}")
-                return last_product_num
-            else:
-                return 0
+            return last_product_num
         except Exception as e:
             print(f"Error reading existing output file: {str(e)}")
             return 0
 
-    def process_csv(self, csv_file_path: str, output_file: str = 'gemini_results_with_links.txt', delay: float = 2.0, resume: bool = True, start_from: int = None) -> List[Dict]:
-        """Process the entire CSV file"""
-        try:
-            # Read CSV file
-            df = pd.read_csv(csv_file_path)
-            
-            # Extract column F (Line) - assuming it's the 6th column (index 5)
-            products = df.iloc[:, 5].dropna().tolist()  # Column F, remove NaN values
+    def write_result(self, f, product_num: int, product: str, result: Dict) -> None:
+        """Write a single PRODUCT block to the results file"""
+        with get_run_metrics().stage('write'):
+            self._write_result(f, product_num, product, result)
+    
+    def _write_result(self, f, product_num: int, product: str, result: Dict) -> None:
+        f.write(f"PRODUCT {product_num}: {product}\n")
+        f.write("-" * 50 + "\n")
+        f.write(f"Status: {result['status']}\n\n")
+        
+        # Partial results are written like successful ones, followed by the failed stages
+        if result['status'] != 'error':
+            f.write("DESCRIPTION:\n")
+            f.write(result['description'])
+            f.write("\n\n")
             
-            print(f"Found {len(products)} products to process")
+            f.write("WORKING IMAGE LINKS:\n")
+            for j, img_url in enumerate(result['images'], 1):
+                f.write(f"Image {j}: {img_url}\n")
+            if not result['images']:
+                f.write("No working image links found\n")
+            f.write("\n")
             
-            # Check if we should resume from a previous run or start from a specific product
-            start_index = 0
-            file_mode = 'w'
+            f.write("VIDEO LINK:\n")
+            if result['video']:
+                f.write(f"Video: {result['video']}\n")
+            else:
+                f.write("No video found\n")
             
-            if start_from is not None:
-                # Force start from a specific product number
-                start_index = start_from - 1  # Convert to 0-based index
-                file_mode = 'a'  # Append to existing file
-                print(f"Force starting from product {start_from}")
-            elif resume:
+            if result.get('errors'):
+                f.write(f"\nStage errors: {format_stage_errors(result['errors'])}\n")
+        else:
+            f.write("ERROR:\n")
+            f.write(result['description'])
+        
+        f.write("\n\n" + "=" * 60 + "\n\n")
+        
+        # Flush to ensure data is written immediately
+        f.flush()
+    
+    def print_throughput(self, processed: int, started_at: float) -> None:
+        """Print the current throughput in products per minute"""
+        elapsed_minutes = (time.time() - started_at) / 60
+        if elapsed_minutes > 0:
+            print(f"Throughput: {processed / elapsed_minutes:.1f} products/minute ({processed} done)")
+    
+    def load_products(self, csv_file_path: str) -> List[str]:
+        """Product names from the CSV file"""
+        return get_catalogue_store(csv_file_path).product_names()
+    
+    def resolve_start(self, output_file: str, resume: bool = True, start_from: int = None, jsonl_output: Optional[str] = None) -> Tuple[int, str]:
+        """Work out where a run starts. Returns (0-based start index, output file mode)."""
+        # Check if we should resume from a previous run or start from a specific product
+        start_index = 0
+        file_mode = 'w'
+        
+        if start_from is not None:
+            # Force start from a specific product number
+            start_index = start_from - 1  # Convert to 0-based index
+            file_mode = 'a'  # Append to existing file
+            print(f"Force starting from product {start_from}")
+        elif resume:
+            if jsonl_output and os.path.exists(jsonl_output):
+                # The JSONL file is written first, so it is the record of what was finished
+                last_processed = last_product_number(jsonl_output)
+                self.sync_text_log(output_file, jsonl_output, last_processed)
+            else:
                 last_processed = self.get_last_processed_product(output_file)
-                if last_processed > 0:
-                    start_index = last_processed  # Start from the next product
-                    file_mode = 'a'  # Append to existing file
-                    print(f"Resuming from product {start_index + 1}")
-                else:
-                    print("Starting fresh processing")
+            if last_processed > 0:
+                start_index = last_processed  # Start from the next product
+                file_mode = 'a'  # Append to existing file
+                print(f"Resuming from product {start_index + 1}")
             else:
                 print("Starting fresh processing")
+        else:
+            print("Starting fresh processing")
+        return start_index, file_mode
+    
+    def sync_text_log(self, output_file: str, jsonl_output: str, last_processed: int) -> None:
+        """Make the text log end with the same product as the JSONL file before resuming
+
+        A run that stopped between the two writes leaves the text log one product
+        short or with a torn last block. Blocks past the JSONL's last product are
+        cut off and missing ones are written from the JSONL records.
+        """
+        if not os.path.exists(output_file):
+            if last_processed == 0:
+                return
+            with self.open_output(output_file, 'w'):
+                pass
+        index = ResultsIndex(output_file).refresh()
+        footer = ("\n\n" + "=" * 60 + "\n\n").encode('utf-8')
+        with open(output_file, 'rb') as f:
+            f.seek(max(0, index.indexed_size - len(footer)))
+            complete = f.read() == footer
+        keep = {number for number in index.offsets if number <= last_processed}
+        if not complete and keep and max(keep) == index.last_product_number():
+            keep.discard(max(keep))  # torn last block: write it again from the JSONL
+        cut = [offset for number, offset in index.offsets.items() if number not in keep]
+        written = max(keep) if keep else 0
+        if not cut and written == last_processed:
+            return
+
+        print(f"Text log out of step with {jsonl_output}; rewriting it from product {written + 1}")
+        with open(output_file, 'r+b') as f:
+            if cut:
+                f.truncate(min(cut))
+        with open(output_file, 'a', encoding='utf-8') as f:
+            for record in iter_jsonl_records(jsonl_output):
+                if written < record['number'] <= last_processed:
+                    self._write_result(f, record['number'], record['product'], record_to_result(record))
+    
+    def open_output(self, output_file: str, file_mode: str):
+        """Open the results text file, writing the header when starting fresh"""
+        f = open(output_file, file_mode, encoding='utf-8')
+        if file_mode == 'w':
+            f.write("GEMINI API RESULTS WITH WORKING LINKS FOR BEAUTY PRODUCTS\n")
+            f.write("=" * 60 + "\n\n")
+        return f
+    
+    def load_families(self, csv_file_path: str) -> None:
+        """Group the sheet's products into families whose content is generated once"""
+        self.families = ProductFamilies.from_catalogue(get_catalogue_store(csv_file_path).load())
+        summary = self.families.summary()
+        print(f"Product families: {summary['families']} families; {summary['reusable_products']} variants can reuse a sibling's content")
+    
+    def print_run_stats(self, output_file: Optional[str] = None) -> None:
+        """Print connection pool, URL health and cache statistics for the run, and write its run report"""
+        self.image_searcher.http_session.print_pool_stats()
+        self.image_searcher.url_health.print_stats()
+        self.cache.print_hit_rates()
+        if self.families is not None:
+            self.families.print_stats(get_run_metrics().report()['api_calls'])
+        if output_file:
+            get_run_metrics().write_report(report_path(output_file))
+    
+    def process_csv(self, csv_file_path: str, output_file: str = 'gemini_results_with_links.txt', delay: float = 0.0, resume: bool = True, start_from: int = None, max_workers: int = 1, jsonl_output: Optional[str] = None,
+                    reuse_families: bool = False) -> List[Dict]:
+        """Process the entire CSV file
+        
+        API quotas are enforced by the shared per-service rate limiters, so delay is
+        only an optional extra pause after each product (applied per worker when
+        max_workers > 1). Results are written to the output file in product order
+        so resume keeps working. If jsonl_output is set, one JSON record per product
+        is appended there first; resume reads its last line and brings the text log
+        in line with it. With reuse_families,
+        size/shade/tester variants reuse the content generated for a sibling.
+        """
+        jsonl_writer = None
+        try:
+            get_run_metrics().start_run('process_csv')
+            products = self.load_products(csv_file_path)
+            print(f"Found {len(products)} products to process")
+            if reuse_families:
+                self.load_families(csv_file_path)
+            start_index, file_mode = self.resolve_start(output_file, resume, start_from, jsonl_output)
             
             results = []
+            started_at = time.time()
+            stopped = False
+            jsonl_writer = JSONLResultsWriter(jsonl_output, file_mode) if jsonl_output else None
+            
+            def write_outputs(f, product_num: int, product: str, result: Dict) -> None:
+                # JSONL first: resume trusts it and rebuilds a lagging text log from it
+                if jsonl_writer:
+                    jsonl_writer.write_result(product_num, result)
+                self.write_result(f, product_num, product, result)
             
             # Open output file for writing/appending
-            with open(output_file, file_mode, encoding='utf-8') as f:
-                # Write header only if starting fresh
-                if file_mode == 'w':
-                    f.write("GEMINI API RESULTS WITH WORKING LINKS FOR BEAUTY PRODUCTS\n")
-                    f.write("=" * 60 + "\n\n")
-                
+            with self.open_output(output_file, file_mode) as f:
                 # Process products starting from the resume point
                 products_to_process = products[start_index:]
                 
-                for i, product in enumerate(products_to_process):
-                    current_product_num = start_index + i + 1
-                    print(f"\nProcessing {current_product_num}/{len(products)}: {product}")
-                    
-                    # Process the product
-                    result = self.process_product(product)
-                    results.append(result)
+                if max_workers > 1:
+                    print(f"Processing with {max_workers} concurrent workers")
                     
-                    # Write to file
-                    f.write(f"PRODUCT {current_product_num}: {product}\n")
-                    f.write("-" * 50 + "\n")
-                    f.write(f"Status: {result['status']}\n\n")
+                    def process_with_delay(product_num: int, product: str) -> Dict:
+                        print(f"\nProcessing {product_num}/{len(products)}: {product}")
+                        result = self.process_product(product)
+                        # Optional extra pause; quotas are handled by the rate limiters
+                        if delay > 0 and product_num < len(products):
+                            get_run_metrics().sleep(delay, 'delay')
+                        return result
                     
-                    if result['status'] == 'success':
-                        f.write("DESCRIPTION:\n")
-                        f.write(result['description'])
-                        f.write("\n\n")
+                    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                        # Keep a bounded window of submitted products; the window is larger
+                        # than the pool so workers stay busy while the oldest one finishes
+                        in_flight = deque()
+                        queue = iter(enumerate(products_to_process))
+                        window = max_workers * 2
                         
-                        f.write("WORKING IMAGE LINKS:\n")
-                        for j, img_url in enumerate(result['images'], 1):
-                            f.write(f"Image {j}: {img_url}\n")
-                        if not result['images']:
-                            f.write("No working image links found\n")
-                        f.write("\n")
+                        def submit_next() -> None:
+                            item = next(queue, None)
+                            if item is not None:
+                                i, product = item
+                                product_num = start_index + i + 1
+                                in_flight.append((product_num, product, executor.submit(process_with_delay, product_num, product)))
                         
-                        f.write("VIDEO LINK:\n")
-                        if result['video']:
-                            f.write(f"Video: {result['video']}\n")
-                        else:
-                            f.write("No video found\n")
-                    else:
-                        f.write("ERROR:\n")
-                        f.write(result['description'])
-                    
-                    f.write("\n\n" + "=" * 60 + "\n\n")
-                    
-                    # Flush to ensure data is written immediately
-                    f.flush()
-                    
-                    # Add delay to avoid rate limiting (Google APIs have limits)
-                    if current_product_num < len(products):  # Don't delay after the last item
-                        time.sleep(delay)
+                        for _ in range(window):
+                            submit_next()
+                        
+                        while in_flight:
+                            current_product_num, product, future = in_flight.popleft()
+                            result = self.settle_circuit(product, future.result())
+                            if result is None:
+                                # Daily quota gone: leave the rest for the next run
+                                stopped = True
+                                for _, _, pending in in_flight:
+                                    pending.cancel()
+                                break
+                            results.append(result)
+                            write_outputs(f, current_product_num, product, result)
+                            print(f"✓ Written product {current_product_num}: {product} ({result['status']})")
+                            self.print_throughput(len(results), started_at)
+                            submit_next()
+                else:
+                    for i, product in enumerate(products_to_process):
+                        current_product_num = start_index + i + 1
+                        print(f"\nProcessing {current_product_num}/{len(products)}: {product}")
+                        
+                        # Process the product
+                        result = self.settle_circuit(product, self.process_product(product))
+                        if result is None:
+                            stopped = True
+                            break
+                        results.append(result)
+                        
+                        # Write to file
+                        write_outputs(f, current_product_num, product, result)
+                        self.print_throughput(len(results), started_at)
+                        
+                        # Optional extra pause; quotas are handled by the rate limiters
+                        if delay > 0 and current_product_num < len(products):  # Don't delay after the last item
+                            get_run_metrics().sleep(delay, 'delay')
             
-            print(f"\nProcessing complete! Results saved to {output_file}")
+            if stopped:
+                print(f"\nProcessing stopped after {len(results)} products; resume picks up from here. Results saved to {output_file}")
+            else:
+                print(f"\nProcessing complete! Results saved to {output_file}")
+            self.print_throughput(len(results), started_at)
+            self.print_run_stats(output_file)
             return results
             
         except Exception as e:
             print(f"Error processing CSV file: {str(e)}")
             return []
+        finally:
+            # Also when the loop raised: the JSONL file is the record resume relies on
+            if jsonl_writer:
+                jsonl_writer.close()
+            self.close()
 
 def main():
     # Configuration
@@ -322,26 +647,37 @@ def main():
     
     CSV_FILE = "18062025 - Парфюми  - Sheet1.csv"
     OUTPUT_FILE = "gemini_beauty_products_results_with_working_links.txt"
-    DELAY_BETWEEN_REQUESTS = 2.0  # seconds (increased for API limits)
+    JSONL_OUTPUT_FILE = "gemini_beauty_products_results.jsonl"  # structured copy for update_csv_with_links.py
+    DELAY_BETWEEN_REQUESTS = 0.0  # extra pause in seconds; API quotas are enforced by rate_limiter.py
+    MAX_CONCURRENT_PRODUCTS = 4  # products processed in parallel (1 = sequential)
+    REUSE_FAMILY_CONTENT = True  # size/shade/tester variants reuse a sibling's generated content
+    USE_ASYNC_PIPELINE = False  # asyncio pipeline from async_clients.py; MAX_CONCURRENT_PRODUCTS is then the number in flight
     
     # Initialize processor
-    processor = GeminiCSVProcessor(GEMINI_API_KEY, GOOGLE_API_KEY, SEARCH_ENGINE_ID)
+    if USE_ASYNC_PIPELINE:
+        from async_clients import AsyncGeminiCSVProcessor
+        processor = AsyncGeminiCSVProcessor(GEMINI_API_KEY, GOOGLE_API_KEY, SEARCH_ENGINE_ID)
+    else:
+        processor = GeminiCSVProcessor(GEMINI_API_KEY, GOOGLE_API_KEY, SEARCH_ENGINE_ID)
     
     # Process the CSV file (with resume capability)
     # Set START_FROM_PRODUCT to force start from a specific product number (set to None for auto-resume)
     START_FROM_PRODUCT = 748  # Change this number to start from a different product
     
-    results = processor.process_csv(CSV_FILE, OUTPUT_FILE, DELAY_BETWEEN_REQUESTS, resume=True, start_from=START_FROM_PRODUCT)
+    results = processor.process_csv(CSV_FILE, OUTPUT_FILE, DELAY_BETWEEN_REQUESTS, resume=True, start_from=START_FROM_PRODUCT, max_workers=MAX_CONCURRENT_PRODUCTS, jsonl_output=JSONL_OUTPUT_FILE,
+                                    reuse_families=REUSE_FAMILY_CONTENT)
     
     # Print summary
     successful = sum(1 for r in results if r['status'] == 'success')
-    failed = len(results) - successful
-    total_images = sum(len(r['images']) for r in results if r['status'] == 'success')
-    total_videos = sum(1 for r in results if r['status'] == 'success' and r['video'])
+    partial = sum(1 for r in results if r['status'] == 'partial')
+    failed = len(results) - successful - partial
+    total_images = sum(len(r['images']) for r in results if r['status'] != 'error')
+    total_videos = sum(1 for r in results if r['status'] != 'error' and r['video'])
     
     print(f"\nSUMMARY (Current Run):")
     print(f"Products processed in this run: {len(results)}")
     print(f"Successful: {successful}")
+    print(f"Partial (some stages failed): {partial}")
     print(f"Failed: {failed}")
     print(f"Total working image links found: {total_images}")
     print(f"Total video links found: {total_videos}")
@@ -349,8 +685,7 @@ def main():
     # Show overall progress
     if os.path.exists(OUTPUT_FILE):
         last_processed = processor.get_last_processed_product(OUTPUT_FILE)
-        df = pd.read_csv(CSV_FILE)
-        total_products = len(df.iloc[:, 5].dropna())
+        total_products = len(get_catalogue_store(CSV_FILE).product_names())
         print(f"\nOVERALL PROGRESS:")
         print(f"Total products processed so far: {last_processed}/{total_products}")
         print(f"Progress: {(last_processed/total_products)*100:.1f}%")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Shared pooled HTTP session for outbound link checks.
+Keeps connections alive per host so repeated checks against the same CDN reuse
+an open TCP/TLS connection instead of setting up a new one every time.
+"""
+
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+class _PoolStatsAdapter(HTTPAdapter):
+    """HTTPAdapter that remembers request/connection counts of evicted host pools"""
+
+    def __init__(self, *args, **kwargs):
+        self._retired = {'requests': 0, 'connections': 0}
+        self._retired_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        pools = self.poolmanager.pools
+        original_dispose = pools.dispose_func
+
+        def dispose(pool):
+            with self._retired_lock:
+                self._retired['requests'] += pool.num_requests
+                self._retired['connections'] += pool.num_connections
+            if original_dispose:
+                original_dispose(pool)
+
+        pools.dispose_func = dispose
+
+    def pool_stats(self) -> Dict[str, Dict[str, int]]:
+        """Per-host request and new-connection counts for the live pools"""
+        stats = {}
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = f"{key.key_scheme}://{key.key_host}:{key.key_port}"
+            host_stats = stats.setdefault(host, {'requests': 0, 'connections': 0})
+            host_stats['requests'] += pool.num_requests
+            host_stats['connections'] += pool.num_connections
+        return stats
+
+    def retired_stats(self) -> Dict[str, int]:
+        with self._retired_lock:
+            return dict(self._retired)
+
+class PooledHTTPSession:
+    def __init__(self, pool_connections: int = 32, max_connections_per_host: int = 4, timeout: float = 10):
+        """Initialize a keep-alive session
+
+        pool_connections is the number of hosts whose pools are kept open and
+        max_connections_per_host caps concurrent connections to a single host
+        (further requests to that host wait for a free connection).
+        """
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': 'Mozilla/5.0 (compatible; ExcelAutomation link checker)'})
+        self.adapter = _PoolStatsAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=max_connections_per_host,
+            pool_block=True
+        )
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.head(url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def get_pool_stats(self) -> Dict:
+        """Connection reuse statistics
+
+        A pool hit is a request served by a pooled connection, a miss is a request
+        for which the pool had to create a new connection.
+        """
+        per_host = self.adapter.pool_stats()
+        retired = self.adapter.retired_stats()
+        total_requests = retired['requests'] + sum(h['requests'] for h in per_host.values())
+        total_connections = retired['connections'] + sum(h['connections'] for h in per_host.values())
+        hits = max(0, total_requests - total_connections)
+        return {
+            'requests': total_requests,
+            'pool_hits': hits,
+            'pool_misses': total_connections,
+            'hit_rate': (hits / total_requests) if total_requests else 0.0,
+            'hosts': len(per_host),
+            'per_host': per_host
+        }
+
+    def print_pool_stats(self) -> None:
+        stats = self.get_pool_stats()
+        print(f"HTTP connection pool: {stats['requests']} requests, "
+              f"{stats['pool_hits']} reused connections, {stats['pool_misses']} new connections "
+              f"({stats['hit_rate'] * 100:.1f}% reuse across {stats['hosts']} hosts)")
+
+    def close(self) -> None:
+        self.session.close()
+
+_shared_session: Optional[PooledHTTPSession] = None
+_shared_session_lock = threading.Lock()
+
+def get_shared_session() -> PooledHTTPSession:
+    """Return the process-wide pooled session used by all link checks"""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = PooledHTTPSession()
+        return _shared_session
@@ -8,14 +8,13 @@ import pandas as pd
 import sys
 from pathlib import Path
 
-def import_content_from_parf():
+from catalogue_snapshot import SnapshotStore
+from catalogue_store import DEFAULT_CSV_FILE, load_catalogue, read_catalogue_csv
+from missing_data import CONTENT_COLUMNS, blank_mask
+
+def import_content_from_parf(source_file: str = "parf.csv", target_file: str = DEFAULT_CSV_FILE):
     """Import content fields from parf.csv to target CSV file."""
     
-    # File paths
-    source_file = "parf.csv"
-    target_file = "18062025 - Парфюми  - Sheet1 (1).csv"
-    backup_file = "18062025 - Парфюми  - Sheet1 (1)_backup.csv"
-    
     # Check if files exist
     if not Path(source_file).exists():
         print(f"Error: Source file '{source_file}' not found!")
@@ -28,93 +27,84 @@ def import_content_from_parf():
     try:
         # Read CSV files
         print("Reading CSV files...")
-        source_df = pd.read_csv(source_file)
-        target_df = pd.read_csv(target_file)
+        source_df = read_catalogue_csv(source_file)
+        target_df = load_catalogue(target_file)
         
-        # Create backup
+        # Back up the target as a compressed snapshot; the imported cells are exported as a delta
         print("Creating backup...")
-        target_df.to_csv(backup_file, index=False)
-        print(f"Backup created: {backup_file}")
+        snapshots = SnapshotStore()
+        original_df = target_df.copy()
+        backup_snapshot = snapshots.snapshot(target_file, original_df)
+        backup_file = snapshots.path(backup_snapshot)
+        print(f"Backup snapshot: {backup_file}")
         
         # Define the fields to import
-        fields_to_import = [
-            'Image 1', 'Image 2', 'Image 3', 'Image 4', 'Image 5', 'Video',
-            '1. Captivating Headline or Tagline',
-            '2. Sensory Introduction (1–2 sentences)',
-            '3. Key Features or Ingredients (Bullet Points or Icons)',
-            '4. How to Use (Optional but useful)',
-            '5. Emotional or Lifestyle Hook',
-            '6. Tech Specs or Product Facts'
-        ]
-        
-        # Statistics
-        total_matches = 0
-        total_updates = 0
-        total_fields_updated = 0
+        fields_to_import = list(CONTENT_COLUMNS)
         
         print("\nStarting import process...")
         print(f"Source records: {len(source_df)}")
         print(f"Target records: {len(target_df)}")
         
-        # Create a mapping of source data by ID
-        source_by_id = {}
-        for idx, row in source_df.iterrows():
-            if pd.notna(row['ID']):
-                source_by_id[row['ID']] = row
+        # Index the source by ID (the last row wins for duplicate IDs)
+        source_by_id = source_df[source_df['ID'].notna()].drop_duplicates('ID', keep='last').set_index('ID')
         
         print(f"Source records with valid ID: {len(source_by_id)}")
         
-        # Process each row in target file
-        for idx, target_row in target_df.iterrows():
-            if pd.notna(target_row['ID']) and target_row['ID'] in source_by_id:
-                total_matches += 1
-                source_row = source_by_id[target_row['ID']]
-                
-                # Track if this record was updated
-                record_updated = False
-                
-                # Import each field if it's empty in target and has content in source
-                for field in fields_to_import:
-                    if field in target_df.columns and field in source_df.columns:
-                        # Check if target field is empty or contains only whitespace
-                        target_value = target_row[field]
-                        source_value = source_row[field]
-                        
-                        # Consider field empty if it's NaN, empty string, or only whitespace
-                        target_is_empty = (pd.isna(target_value) or 
-                                         (isinstance(target_value, str) and target_value.strip() == ''))
-                        
-                        # Consider source has content if it's not NaN and not empty after stripping
-                        source_has_content = (pd.notna(source_value) and 
-                                            isinstance(source_value, str) and 
-                                            source_value.strip() != '')
-                        
-                        # Import if target is empty and source has content
-                        if target_is_empty and source_has_content:
-                            target_df.at[idx, field] = source_value.strip()
-                            total_fields_updated += 1
-                            record_updated = True
-                
-                if record_updated:
-                    total_updates += 1
-                    print(f"Updated record ID {target_row['ID']}: {target_row.get('Brand', 'Unknown')} - {target_row.get('Line', 'Unknown')}")
+        # Align the source rows to the matching target rows in one step
+        matched = target_df['ID'].notna() & target_df['ID'].isin(source_by_id.index)
+        matched_index = target_df.index[matched.to_numpy()]
+        fields = [field for field in fields_to_import if field in target_df.columns and field in source_df.columns]
+        aligned_source = source_by_id.reindex(target_df.loc[matched_index, 'ID'].to_numpy())[fields]
+        aligned_source.index = matched_index
+        
+        total_matches = len(matched_index)
+        fields_updated_per_field = {}
+        record_updated = pd.Series(False, index=matched_index)
+        
+        for field in fields:
+            source_values = aligned_source[field]
+            # Source has content if it is a non-empty string after stripping
+            source_is_text = source_values.map(lambda value: isinstance(value, str), na_action='ignore').fillna(False).astype(bool)
+            source_stripped = source_values.where(source_is_text).astype(object).str.strip()
+            source_has_content = source_is_text & source_stripped.ne('')
+            
+            # Only fill target cells that are NaN, empty or whitespace
+            fill = blank_mask(target_df.loc[matched_index, field]) & source_has_content
+            fill_index = matched_index[fill.to_numpy()]
+            if len(fill_index):
+                if target_df[field].dtype != object:
+                    target_df[field] = target_df[field].astype(object)
+                target_df.loc[fill_index, field] = source_stripped[fill].to_numpy()
+            
+            fields_updated_per_field[field] = len(fill_index)
+            record_updated |= fill
+        
+        total_updates = int(record_updated.sum())
+        total_fields_updated = sum(fields_updated_per_field.values())
+        
+        for idx in matched_index[record_updated.to_numpy()]:
+            target_row = target_df.loc[idx]
+            print(f"Updated record ID {target_row['ID']}: {target_row.get('Brand', 'Unknown')} - {target_row.get('Line', 'Unknown')}")
         
         # Save the updated target file
         print(f"\nSaving updated file...")
         target_df.to_csv(target_file, index=False)
+        snapshots.record_run(backup_snapshot, original_df, target_df, target_file)
         
         # Print summary
         print(f"\n=== IMPORT SUMMARY ===")
         print(f"Total records matched by ID: {total_matches}")
         print(f"Total records updated: {total_updates}")
         print(f"Total fields updated: {total_fields_updated}")
+        for field, count in fields_updated_per_field.items():
+            print(f"  {field}: {count}")
         print(f"Backup file: {backup_file}")
         print(f"Updated file: {target_file}")
         
         # Show some examples of updated records
         if total_updates > 0:
             print(f"\n=== SAMPLE UPDATED RECORDS ===")
-            updated_records = target_df[target_df['ID'].isin(source_by_id.keys())]
+            updated_records = target_df[target_df['ID'].isin(source_by_id.index)]
             for idx, row in updated_records.head(5).iterrows():
                 if pd.notna(row.get('1. Captivating Headline or Tagline')):
                     print(f"ID {row['ID']}: {row.get('Brand', 'Unknown')} - {row.get('Line', 'Unknown')}")
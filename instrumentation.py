@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Lightweight run instrumentation: per-product, per-stage timings, API call counts
+and idle sleeps, written out as a JSON run report with p50/p95/p99 latencies.
+The product being worked on is held in a context variable, so timings taken on
+stage threads and asyncio tasks are attributed to the right product.
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List
+
+current_product: contextvars.ContextVar = contextvars.ContextVar('current_product', default=None)
+
+def percentile(values: List[float], pct: float) -> float:
+    """Linearly interpolated percentile of values (pct in 0-100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(values: List[float]) -> Dict:
+    return {
+        'count': len(values),
+        'total': round(sum(values), 4),
+        'mean': round(sum(values) / len(values), 4) if values else 0.0,
+        'p50': round(percentile(values, 50), 4),
+        'p95': round(percentile(values, 95), 4),
+        'p99': round(percentile(values, 99), 4),
+        'max': round(max(values), 4) if values else 0.0
+    }
+
+class RunMetrics:
+    def __init__(self):
+        """Collects stage timings, API calls and sleeps for one run"""
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, run_name: str = '') -> None:
+        with self._lock:
+            self.run_name = run_name
+            self.started_at = time.time()
+            self.stage_timings: Dict[str, List[float]] = defaultdict(list)
+            self.api_timings: Dict[str, List[float]] = defaultdict(list)
+            self.sleeps: Dict[str, float] = defaultdict(float)
+            self.products: Dict[str, Dict] = {}
+
+    def start_run(self, run_name: str) -> None:
+        """Forget earlier measurements and start timing a new run"""
+        self.reset(run_name)
+
+    def _product_entry(self, product: str) -> Dict:
+        # Caller holds the lock
+        if product not in self.products:
+            self.products[product] = {'stages': defaultdict(float), 'api_calls': defaultdict(int)}
+        return self.products[product]
+
+    @contextmanager
+    def product(self, product_name: str):
+        """Attribute everything measured inside the block to product_name"""
+        token = current_product.set(product_name)
+        try:
+            with self.stage('product'):
+                yield
+        finally:
+            current_product.reset(token)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block as stage name of the current product"""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - started_at)
+
+    def record_stage(self, name: str, seconds: float) -> None:
+        product = current_product.get()
+        with self._lock:
+            self.stage_timings[name].append(seconds)
+            if product is not None:
+                self._product_entry(product)['stages'][name] += seconds
+
+    @contextmanager
+    def api_call(self, service: str):
+        """Time one API request to service (excluding any rate limiter wait before it)"""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started_at
+            product = current_product.get()
+            with self._lock:
+                self.api_timings[service].append(elapsed)
+                if product is not None:
+                    self._product_entry(product)['api_calls'][service] += 1
+
+    def record_sleep(self, reason: str, seconds: float) -> None:
+        if seconds > 0:
+            with self._lock:
+                self.sleeps[reason] += seconds
+
+    def sleep(self, seconds: float, reason: str) -> None:
+        """time.sleep that is counted as idle time"""
+        self.record_sleep(reason, seconds)
+        time.sleep(seconds)
+
+    async def sleep_async(self, seconds: float, reason: str) -> None:
+        self.record_sleep(reason, seconds)
+        await asyncio.sleep(seconds)
+
+    def report(self) -> Dict:
+        """Machine-readable summary of the run"""
+        with self._lock:
+            product_count = len(self.products)
+            api_calls = {service: len(timings) for service, timings in self.api_timings.items()}
+            slowest = sorted(self.products.items(), key=lambda item: item[1]['stages'].get('product', 0.0), reverse=True)[:10]
+            return {
+                'run': self.run_name,
+                'started_at': datetime.fromtimestamp(self.started_at).isoformat(timespec='seconds'),
+                'wall_seconds': round(time.time() - self.started_at, 3),
+                'products': product_count,
+                'stages': {name: summarize(timings) for name, timings in self.stage_timings.items()},
+                'api_latency': {service: summarize(timings) for service, timings in self.api_timings.items()},
+                'api_calls': api_calls,
+                'api_calls_per_product': {service: round(count / product_count, 3) for service, count in api_calls.items()} if product_count else {},
+                'idle_sleep_seconds': dict(self.sleeps, total=round(sum(self.sleeps.values()), 3)),
+                'slowest_products': [
+                    {'product': product, 'seconds': round(entry['stages'].get('product', 0.0), 3),
+                     'stages': {name: round(seconds, 3) for name, seconds in entry['stages'].items()},
+                     'api_calls': dict(entry['api_calls'])}
+                    for product, entry in slowest
+                ]
+            }
+
+    def write_report(self, path: str) -> Dict:
+        """Write the run report as JSON and print a short summary"""
+        report = self.report()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Run report saved to {path}")
+        for name, stats in report['stages'].items():
+            print(f"  {name:<18} n={stats['count']:<6} p50={stats['p50']:.3f}s p95={stats['p95']:.3f}s p99={stats['p99']:.3f}s")
+        for service, calls in report['api_calls'].items():
+            print(f"  {service} calls: {calls} ({report['api_calls_per_product'].get(service, 0)} per product)")
+        print(f"  Idle sleep: {report['idle_sleep_seconds']['total']:.1f}s")
+        return report
+
+def report_path(output_file: str) -> str:
+    """Run report file next to an output file"""
+    return os.path.splitext(output_file)[0] + '.run_report.json'
+
+_run_metrics = RunMetrics()
+
+def get_run_metrics() -> RunMetrics:
+    """Return the process-wide run metrics"""
+    return _run_metrics
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Concurrent bulk link auditor for the product sheet.
+Collects every image and video URL, checks each distinct URL once (many rows
+share links), caps concurrent requests per host, and falls back to a one-byte
+ranged GET when a host rejects HEAD. The result is a table with one line per
+cell (row, ID, column, status, latency), from which the broken cells can be
+blanked so regenerate_missing_content.py refills only those.
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+from catalogue_store import DEFAULT_CSV_FILE, load_catalogue
+from http_session import PooledHTTPSession
+from instrumentation import get_run_metrics
+from missing_data import CONTENT_COLUMNS
+from progress_ledger import ledger_key
+from url_health import URLHealthStore, get_shared_health_store
+
+# Columns holding links in the sheet
+LINK_COLUMNS = [column for column in CONTENT_COLUMNS if column.startswith('Image') or column == 'Video']
+
+# HEAD answers that mean "try GET instead" rather than "the link is broken"
+HEAD_REJECTED = {400, 403, 405, 501}
+
+RESULT_COLUMNS = ['row', 'id', 'column', 'url', 'status', 'ok', 'latency_ms', 'method', 'error', 'cached']
+
+class LinkAuditor:
+    def __init__(self, max_workers: int = 64, max_per_host: int = 8, timeout: float = 10,
+                 session: Optional[PooledHTTPSession] = None, url_health: Optional[URLHealthStore] = None, use_cache: bool = True):
+        """Check links with up to max_workers requests in flight and at most max_per_host per host"""
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.session = session or PooledHTTPSession(pool_connections=max_workers, max_connections_per_host=max_per_host, timeout=timeout)
+        self.url_health = url_health or get_shared_health_store()
+        self.use_cache = use_cache
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_lock = threading.Lock()
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc.lower()
+        with self._host_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_slots[host]
+
+    def check_url(self, url: str) -> Dict:
+        """Check one URL over the network (HEAD, then a ranged GET if HEAD is rejected)"""
+        started_at = time.perf_counter()
+        method = 'HEAD'
+        status, content_type, error = None, '', None
+        with self._host_slot(url):
+            try:
+                with get_run_metrics().api_call('url_head'):
+                    response = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+                status = response.status_code
+                content_type = response.headers.get('content-type', '').lower()
+                if status in HEAD_REJECTED:
+                    method = 'GET'
+                    with get_run_metrics().api_call('url_get'):
+                        response = self.session.get(url, timeout=self.timeout, allow_redirects=True,
+                                                    headers={'Range': 'bytes=0-0'}, stream=True)
+                    # Only the headers are needed; don't download the body
+                    response.close()
+                    status = response.status_code
+                    content_type = response.headers.get('content-type', '').lower()
+            except Exception as e:
+                error = str(e)[:200]
+        latency_ms = (time.perf_counter() - started_at) * 1000
+        record = self.url_health.record_check(url, status, content_type, error)
+        return dict(record, latency_ms=round(latency_ms, 1), method=method, cached=False)
+
+    def check_urls(self, urls: List[str]) -> Dict[str, Dict]:
+        """Check distinct URLs concurrently; recent results come from the URL health store"""
+        checks = {}
+        to_fetch = []
+        for url in dict.fromkeys(urls):
+            record = self.url_health.cached_check(url) if self.use_cache else None
+            if record is not None:
+                checks[url] = dict(record, latency_ms=0.0, method='cache', cached=True)
+            else:
+                to_fetch.append(url)
+
+        if to_fetch:
+            print(f"Checking {len(to_fetch)} URLs ({len(checks)} answered from the URL health store)...")
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(to_fetch)), thread_name_prefix='audit') as executor:
+                futures = {executor.submit(self.check_url, url): url for url in to_fetch}
+                for done, future in enumerate(as_completed(futures), 1):
+                    checks[futures[future]] = future.result()
+                    if done % 500 == 0:
+                        print(f"  {done}/{len(to_fetch)} checked")
+        return checks
+
+    @staticmethod
+    def collect_links(df: pd.DataFrame, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """One line (row, id, column, url) per cell of columns that holds an http(s) link"""
+        columns = [column for column in (columns or LINK_COLUMNS) if column in df.columns]
+        ids = df['ID'] if 'ID' in df.columns else pd.Series(df.index, index=df.index)
+        frames = []
+        for column in columns:
+            urls = df[column].astype(str).str.strip()
+            has_link = df[column].notna() & urls.str.startswith('http')
+            frames.append(pd.DataFrame({'row': df.index[has_link], 'id': ids[has_link].to_numpy(), 'column': column,
+                                        'url': urls[has_link].to_numpy()}))
+        if not frames:
+            return pd.DataFrame(columns=['row', 'id', 'column', 'url'])
+        return pd.concat(frames, ignore_index=True)
+
+    def audit(self, df: pd.DataFrame, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Check every link in columns (default: the image and video columns) and return the results table"""
+        links = self.collect_links(df, columns)
+        checks = self.check_urls(links['url'].tolist())
+        print(f"Audited {len(links)} links ({links['url'].nunique()} distinct URLs)")
+
+        results = links.copy()
+        for field in ('status', 'latency_ms', 'method', 'error', 'cached'):
+            results[field] = [checks[url][field] for url in links['url']]
+        results['ok'] = [URLHealthStore.is_healthy(checks[url]) for url in links['url']]
+        return results[RESULT_COLUMNS]
+
+    @staticmethod
+    def summarize(results: pd.DataFrame) -> Dict[str, Dict[str, int]]:
+        """Total/working/broken link counts per column"""
+        summary = {}
+        for column, group in results.groupby('column', sort=False):
+            working = int(group['ok'].sum())
+            summary[column] = {'total': len(group), 'working': working, 'broken': len(group) - working}
+        return summary
+
+    @staticmethod
+    def clear_broken_cells(df: pd.DataFrame, results: pd.DataFrame) -> pd.DataFrame:
+        """Copy of df with the broken link cells blanked, so the missing content regenerator refills them"""
+        cleared = df.copy()
+        for column, group in results[~results['ok']].groupby('column', sort=False):
+            cleared.loc[group['row'].to_numpy(), column] = None
+        return cleared
+
+def main():
+    parser = argparse.ArgumentParser(description="Check every image and video link in the product sheet")
+    parser.add_argument('--csv', default=DEFAULT_CSV_FILE, help="Product sheet")
+    parser.add_argument('--columns', help="Comma-separated link columns (default: Image 1-5 and Video)")
+    parser.add_argument('--output', default='link_audit.csv', help="Results table (row, id, column, url, status, latency...)")
+    parser.add_argument('--workers', type=int, default=64, help="Requests in flight")
+    parser.add_argument('--per-host', type=int, default=8, help="Requests in flight per host")
+    parser.add_argument('--timeout', type=float, default=10, help="Seconds per request")
+    parser.add_argument('--no-cache', action='store_true', help="Check every URL again instead of using recent results")
+    parser.add_argument('--clear-broken', metavar='CSV', help="Write a copy of the sheet with broken links blanked")
+    args = parser.parse_args()
+
+    df = load_catalogue(args.csv)
+    auditor = LinkAuditor(args.workers, args.per_host, args.timeout, use_cache=not args.no_cache)
+    started_at = time.time()
+    results = auditor.audit(df, args.columns.split(',') if args.columns else None)
+    results.to_csv(args.output, index=False)
+
+    print(f"\nLink audit finished in {time.time() - started_at:.1f}s. Results saved to {args.output}")
+    for column, counts in auditor.summarize(results).items():
+        print(f"  {column}: {counts['total']} links, {counts['working']} working, {counts['broken']} broken")
+
+    broken = results[~results['ok']]
+    if args.clear_broken and len(broken):
+        auditor.clear_broken_cells(df, results).to_csv(args.clear_broken, index=False)
+        ids = ','.join(dict.fromkeys(key for key in map(ledger_key, broken['id']) if key))
+        print(f"\nBroken links blanked in {args.clear_broken}. Refill only those rows with:")
+        print(f"  python regenerate_missing_content.py --csv \"{args.clear_broken}\" --ids {ids}")
+
+if __name__ == "__main__":
+    main()
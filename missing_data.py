@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Vectorized missing-content analysis shared by the regeneration scripts.
+A cell counts as missing when it is NaN, empty or only whitespace.
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# The content columns filled by the generation pipeline
+CONTENT_COLUMNS = [
+    'Image 1', 'Image 2', 'Image 3', 'Image 4', 'Image 5', 'Video',
+    '1. Captivating Headline or Tagline',
+    '2. Sensory Introduction (1–2 sentences)',
+    '3. Key Features or Ingredients (Bullet Points or Icons)',
+    '4. How to Use (Optional but useful)',
+    '5. Emotional or Lifestyle Hook',
+    '6. Tech Specs or Product Facts'
+]
+
+def blank_mask(values: pd.Series) -> pd.Series:
+    """True where a value is NaN, empty or whitespace only"""
+    return values.isna() | values.astype(str).str.strip().eq('')
+
+def missing_mask(df: pd.DataFrame, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Boolean row x field mask of missing content for the columns present in df"""
+    columns = [col for col in (columns or CONTENT_COLUMNS) if col in df.columns]
+    return pd.DataFrame({col: blank_mask(df[col]) for col in columns}, index=df.index, columns=columns)
+
+def analyze_missing(df: pd.DataFrame, columns: Optional[List[str]] = None) -> Dict:
+    """Compute the missing-content mask and its summaries in one pass
+
+    Returns a dict with:
+      mask               row x field boolean frame
+      field_counts       missing cells per field
+      rows_to_regenerate index labels of rows with at least one missing field
+      complete_rows      index labels of rows with every field filled
+      absent_columns     requested columns that do not exist in df
+    """
+    columns = columns or CONTENT_COLUMNS
+    mask = missing_mask(df, columns)
+    row_has_missing = mask.any(axis=1)
+    return {
+        'mask': mask,
+        'field_counts': mask.sum(),
+        'rows_to_regenerate': df.index[row_has_missing.to_numpy()],
+        'complete_rows': df.index[~row_has_missing.to_numpy()],
+        'absent_columns': [col for col in columns if col not in df.columns]
+    }
+
+def missing_fields_by_row(mask: pd.DataFrame) -> Dict[int, List[str]]:
+    """Missing field names for every row that has at least one"""
+    values = mask.to_numpy()
+    columns = np.array(mask.columns)
+    rows = np.flatnonzero(values.any(axis=1))
+    return {mask.index[i]: columns[values[i]].tolist() for i in rows}
+
+def row_is_complete(row: pd.Series, columns: Optional[List[str]] = None) -> bool:
+    """True if a single record has every content field filled"""
+    columns = [col for col in (columns or CONTENT_COLUMNS) if col in row.index]
+    return not blank_mask(row[columns]).any()
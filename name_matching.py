@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Approximate product-name matching between result files, product lists and the sheet.
+Names are normalized (case, accents, punctuation, "(L)/(M)/(U)" markers, spelled-out
+concentrations and volume units) and split into a base name plus volume and tester
+flag. Lookups go exact -> normalized -> fuzzy: a character-trigram index picks a few
+candidates and difflib scores them. A different volume, tester flag or gender is a
+different SKU, so such matches are reported but never accepted.
+
+Usage:
+    python name_matching.py --names products.txt [--csv FILE] [--output name_match_report.csv]
+"""
+
+import argparse
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List
+
+import pandas as pd
+
+from catalogue_store import DEFAULT_CSV_FILE, NAME_COLUMN, get_catalogue_store
+
+GENDER_PATTERN = re.compile(r'\(\s*([lmu])\s*\)')
+TESTER_PATTERN = re.compile(r'\btester\b')
+VOLUME_PATTERN = re.compile(r'(\d+(?:[.,]\d+)?)\s*(ml|l|gr|g|fl\.?\s*oz|oz)\b')
+CONCENTRATIONS = [
+    (re.compile(r'\bextrait de parfum\b'), 'extrait'),
+    (re.compile(r'\beau de parfum\b'), 'edp'),
+    (re.compile(r'\beau de toilette\b'), 'edt'),
+    (re.compile(r'\beau de cologne\b'), 'edc'),
+]
+UNIT_NAMES = {'gr': 'g', 'floz': 'oz', 'fl.oz': 'oz'}
+
+# Fuzzy scores at or above ACCEPT_SCORE are used; HIGH_SCORE and up count as high confidence
+ACCEPT_SCORE = 0.88
+HIGH_SCORE = 0.95
+CANDIDATES = 10
+
+REPORT_COLUMNS = ['query', 'match', 'rows', 'method', 'score', 'confidence', 'accepted', 'note']
+
+def _fold(text: str) -> str:
+    """Lower-case and strip accents"""
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+def parse_name(name: str) -> Dict:
+    """Split a product name into its normalized parts
+
+    Returns a dict with:
+      key     full normalized name (base, volume and tester flag)
+      base    name without gender marker, volume and "Tester"
+      volume  normalized volume like '100ml', or None
+      tester  True for tester SKUs
+      gender  'l', 'm', 'u' or None
+    """
+    text = _fold(name).replace('&', ' and ')
+    gender_match = GENDER_PATTERN.search(text)
+    text = GENDER_PATTERN.sub(' ', text)
+    tester = bool(TESTER_PATTERN.search(text))
+    text = TESTER_PATTERN.sub(' ', text)
+    for pattern, short in CONCENTRATIONS:
+        text = pattern.sub(short, text)
+
+    volume = None
+    volume_match = VOLUME_PATTERN.search(text)
+    if volume_match:
+        amount = volume_match.group(1).replace(',', '.')
+        amount = amount.rstrip('0').rstrip('.') if '.' in amount else amount
+        unit = re.sub(r'\s+', '', volume_match.group(2))
+        volume = amount + UNIT_NAMES.get(unit, unit)
+        text = text[:volume_match.start()] + ' ' + text[volume_match.end():]
+
+    base = ' '.join(re.sub(r'[^\w]+', ' ', text).split())
+    key = ' '.join(part for part in (base, volume, 'tester' if tester else None) if part)
+    return {'key': key, 'base': base, 'volume': volume, 'tester': tester,
+            'gender': gender_match.group(1) if gender_match else None}
+
+def same_sku(a: Dict, b: Dict) -> bool:
+    """True if two parsed names agree on volume, tester flag and (where both have one) gender"""
+    return (a['volume'] == b['volume'] and a['tester'] == b['tester']
+            and (a['gender'] is None or b['gender'] is None or a['gender'] == b['gender']))
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class NameIndex:
+    def __init__(self, names: Iterable[str]):
+        """Index names (e.g. the sheet's product column, in row order) for lookups"""
+        self.names: List[str] = []
+        self.parts: List[Dict] = []
+        self._exact: Dict[str, List[int]] = defaultdict(list)
+        self._normalized: Dict[str, List[int]] = defaultdict(list)
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for position, name in enumerate(names):
+            name = '' if name is None or (not isinstance(name, str) and pd.isna(name)) else str(name).strip()
+            parts = parse_name(name)
+            self.names.append(name)
+            self.parts.append(parts)
+            if not name:
+                continue
+            self._exact[name].append(position)
+            if parts['key'] not in self._normalized:
+                for gram in trigrams(parts['key']):
+                    self._postings[gram].append(position)
+            self._normalized[parts['key']].append(position)
+
+    def _candidates(self, key: str) -> List[int]:
+        """Positions of the indexed names sharing the most trigrams with key"""
+        grams = trigrams(key)
+        shared = Counter(position for gram in grams for position in self._postings.get(gram, ()))
+        scored = [(count / (len(grams) + len(trigrams(self.parts[position]['key'])) - count), position)
+                  for position, count in shared.items()]
+        return [position for _, position in sorted(scored, reverse=True)[:CANDIDATES]]
+
+    def match(self, query: str) -> Dict:
+        """Best match for query as a report row (see REPORT_COLUMNS); 'rows' lists every matching position"""
+        query = str(query).strip()
+        result = {'query': query, 'match': None, 'rows': [], 'method': 'none', 'score': 0.0,
+                  'confidence': 'none', 'accepted': False, 'note': ''}
+        if query in self._exact:
+            return dict(result, match=query, rows=list(self._exact[query]), method='exact', score=1.0,
+                        confidence='exact', accepted=True)
+
+        parts = parse_name(query)
+        rows = [row for row in self._normalized.get(parts['key'], []) if same_sku(parts, self.parts[row])]
+        if rows:
+            return dict(result, match=self.names[rows[0]], rows=list(rows), method='normalized', score=1.0,
+                        confidence='high', accepted=True)
+
+        best_score, best_position = 0.0, None
+        for position in self._candidates(parts['key']):
+            score = SequenceMatcher(None, parts['key'], self.parts[position]['key']).ratio()
+            if score > best_score:
+                best_score, best_position = score, position
+        if best_position is None:
+            return dict(result, note='no candidate shares enough characters')
+
+        candidate = self.parts[best_position]
+        rows = [row for row in self._normalized[candidate['key']] if same_sku(parts, self.parts[row])]
+        result.update(match=self.names[best_position], rows=rows or list(self._normalized[candidate['key']]),
+                      method='fuzzy', score=round(best_score, 3))
+        if not rows:
+            # Same product line, different SKU: never fill one from the other
+            return dict(result, confidence='low', note='volume, tester or gender differs')
+        if best_score >= HIGH_SCORE:
+            return dict(result, confidence='high', accepted=True)
+        if best_score >= ACCEPT_SCORE:
+            return dict(result, confidence='medium', accepted=True)
+        return dict(result, confidence='low', note='below the acceptance score')
+
+    def match_all(self, queries: Iterable[str]) -> pd.DataFrame:
+        """Match report with one row per query"""
+        return pd.DataFrame([self.match(query) for query in queries], columns=REPORT_COLUMNS)
+
+def summarize_matches(report: pd.DataFrame) -> None:
+    """Print match counts by method and the queries that were not accepted or only fuzzily matched"""
+    counts = report['method'].value_counts()
+    print(f"Name matching: {len(report)} names - " + ', '.join(f"{method} {int(counts.get(method, 0))}" for method in ('exact', 'normalized', 'fuzzy', 'none')))
+    for row in report[report['method'] == 'fuzzy'].itertuples():
+        status = 'accepted' if row.accepted else f"rejected ({row.note})"
+        print(f"  '{row.query}' -> '{row.match}' (score {row.score:.2f}, {row.confidence}, {status})")
+    for row in report[report['method'] == 'none'].itertuples():
+        print(f"  '{row.query}' -> no match")
+
+def match_report_path(output_file: str) -> str:
+    """Name match report next to an output file"""
+    return os.path.splitext(output_file)[0] + '.name_matches.csv'
+
+def load_sheet_index(csv_file: str = DEFAULT_CSV_FILE) -> NameIndex:
+    """Name index over the product column of a sheet"""
+    store = get_catalogue_store(csv_file)
+    return NameIndex(store.load()[NAME_COLUMN])
+
+def main():
+    parser = argparse.ArgumentParser(description="Match product names against the names in the product sheet")
+    parser.add_argument('--names', required=True, help="Text file with one product name per line")
+    parser.add_argument('--csv', default=DEFAULT_CSV_FILE, help="Product sheet")
+    parser.add_argument('--output', default='name_match_report.csv', help="Match confidence report")
+    args = parser.parse_args()
+
+    with open(args.names, 'r', encoding='utf-8') as f:
+        names = [line.strip() for line in f if line.strip()]
+    report = load_sheet_index(args.csv).match_all(names)
+    report.to_csv(args.output, index=False)
+    summarize_matches(report)
+    print(f"Report saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Concurrent per-product stages (text generation, image search, video search).
+The stages of one product are independent, so they run at the same time; each
+has its own timeout and its own error slot, and a failed stage no longer throws
+away the output of the stages that succeeded.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import Executor, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from instrumentation import get_run_metrics
+
+# Seconds each stage may take before the product is written without it
+DEFAULT_STAGE_TIMEOUTS = {
+    'text': 120,
+    'images': 60,
+    'video': 30
+}
+
+def run_stages(executor: Executor, stages: Dict[str, Callable[[], Any]], timeouts: Dict[str, float]) -> Tuple[Dict[str, Any], Dict[str, Exception]]:
+    """Run stage functions concurrently on executor
+
+    Returns (outputs, errors): the value of every stage that finished in time, and the
+    exception of every stage that raised or timed out. A stage's timeout counts from
+    when it starts running, not from when it was queued behind busy workers. A timed
+    out stage keeps running in the background, but its result is ignored.
+    """
+    metrics = get_run_metrics()
+    started = {name: threading.Event() for name in stages}
+    started_at: Dict[str, float] = {}
+
+    def timed(name: str, function: Callable[[], Any]) -> Any:
+        started_at[name] = time.monotonic()
+        started[name].set()
+        with metrics.stage(name):
+            return function()
+
+    # Each stage runs in a copy of the caller's context, so its timings belong to the caller's product
+    futures = {name: executor.submit(contextvars.copy_context().run, timed, name, function) for name, function in stages.items()}
+    outputs, errors = {}, {}
+    for name, future in futures.items():
+        timeout = timeouts.get(name)
+        remaining = None
+        if timeout is not None:
+            started[name].wait()
+            remaining = max(0.0, timeout - (time.monotonic() - started_at[name]))
+        try:
+            outputs[name] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            errors[name] = TimeoutError(f"timed out after {timeout:g}s")
+        except Exception as e:
+            errors[name] = e
+    return outputs, errors
+
+async def run_stages_async(stages: Dict[str, Awaitable], timeouts: Dict[str, float]) -> Tuple[Dict[str, Any], Dict[str, Exception]]:
+    """Coroutine version of run_stages; timed out stages are cancelled"""
+    names = list(stages)
+
+    async def run(name: str):
+        timeout = timeouts.get(name)
+        try:
+            with get_run_metrics().stage(name):
+                return await asyncio.wait_for(stages[name], timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"timed out after {timeout:g}s")
+
+    results = await asyncio.gather(*(run(name) for name in names), return_exceptions=True)
+    outputs, errors = {}, {}
+    for name, result in zip(names, results):
+        if isinstance(result, BaseException):
+            if not isinstance(result, Exception):
+                raise result
+            errors[name] = result
+        else:
+            outputs[name] = result
+    return outputs, errors
+
+def stage_error_messages(errors: Dict[str, Exception]) -> Dict[str, str]:
+    """Printable message for each stage exception"""
+    return {name: str(error) or type(error).__name__ for name, error in errors.items()}
+
+def stage_status(errors: Dict, produced_anything: bool) -> str:
+    """'success' if every stage worked, 'partial' if some failed but something was produced, else 'error'"""
+    if not errors:
+        return 'success'
+    return 'partial' if produced_anything else 'error'
+
+def format_stage_errors(errors: Dict[str, str]) -> str:
+    return '; '.join(f"{stage}: {message}" for stage, message in errors.items())
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Product families: SKUs that differ only by volume, shade or "Tester".
+The catalogue is grouped by brand, base name (line and concentration) and gender.
+During processing the first variant of a family is generated and searched as usual;
+its siblings reuse that content with the variant-specific facts (name, volume,
+shade) swapped in, instead of spending Gemini and search quota again. Images are
+only shared between variants of the same shade.
+
+Usage:
+    python product_families.py [--csv FILE] [--output product_families.csv]
+"""
+
+import argparse
+import asyncio
+import re
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from catalogue_store import DEFAULT_CSV_FILE, NAME_COLUMN, get_catalogue_store
+from name_matching import parse_name
+from structured_generation import sections_to_description
+
+# A shade is the last " - " part of a name when it ends in a shade code like MD2, L3 or M1.5
+SHADE_CODE = re.compile(r'\b[a-z]{1,2}\d{1,2}(?:\.\d)?$', re.IGNORECASE)
+VOLUME_TEXT = re.compile(r'\s*\d+(?:[.,]\d+)?\s*(?:ml|l|gr|g|fl\.?\s*oz|oz)\s*$', re.IGNORECASE)
+
+# Quota-limited API calls for one product: Gemini, Custom Search and YouTube
+CALLS_PER_PRODUCT = 3
+
+def parse_variant(name: str) -> Dict:
+    """parse_name() of a product plus its shade; 'base' excludes the shade"""
+    name = str(name).strip()
+    shade = None
+    head, separator, tail = name.rpartition(' - ')
+    if separator:
+        candidate = VOLUME_TEXT.sub('', re.sub(r'\bTester\b', '', tail)).strip()
+        if SHADE_CODE.search(candidate):
+            shade = candidate
+            name = f"{head} {tail.replace(candidate, '', 1)}"
+    parts = parse_name(name)
+    parts['shade'] = shade
+    return parts
+
+def family_key(name: str, brand: Optional[str] = None) -> str:
+    """Key shared by every size, shade and tester variant of a product"""
+    parts = parse_variant(name)
+    brand = '' if brand is None or pd.isna(brand) else str(brand).strip().lower()
+    return f"{brand}|{parts['base']}|{parts['gender'] or ''}"
+
+def _volume_pattern(volume: str) -> re.Pattern:
+    """Regex for a normalized volume like '7.5ml' as written in text ('7,5 ml', '7.5ML')"""
+    amount, unit = re.match(r'([\d.]+)(\D+)', volume).groups()
+    amount = r'[.,]'.join(re.escape(part) for part in amount.split('.'))
+    return re.compile(r'(?<![\d.,])' + amount + r'\s*' + re.escape(unit) + r'\b', re.IGNORECASE)
+
+def adapt_text(text: str, source_name: str, variant_name: str, source: Dict, variant: Dict) -> str:
+    """Swap a sibling's name, volume and shade for the variant's in a piece of generated text"""
+    if not text:
+        return text
+    # Replacements are functions so backslashes in names are not read as escapes
+    text = re.sub(re.escape(source_name), lambda _: variant_name, text, flags=re.IGNORECASE)
+    if source['volume'] and variant['volume'] and source['volume'] != variant['volume']:
+        text = _volume_pattern(source['volume']).sub(lambda _: variant['volume'], text)
+    if source['shade'] and variant['shade'] and source['shade'] != variant['shade']:
+        text = re.sub(re.escape(source['shade']), lambda _: variant['shade'], text, flags=re.IGNORECASE)
+    return text
+
+def shares_images(source_name: str, variant_name: str) -> bool:
+    """True if two variants look the same (same shade or no shade), so one's images fit the other"""
+    return parse_variant(source_name)['shade'] == parse_variant(variant_name)['shade']
+
+def adapt_result(result: Dict, variant_name: str) -> Dict:
+    """A copy of a sibling's result rewritten for variant_name
+
+    Images are kept only if shares_images(); a different shade gets none, and
+    the caller searches for its own.
+    """
+    source_name = result['product']
+    if source_name == variant_name:
+        return dict(result)
+    source, variant = parse_variant(source_name), parse_variant(variant_name)
+    sections = {key: adapt_text(value, source_name, variant_name, source, variant) for key, value in (result.get('sections') or {}).items()}
+    return dict(result, product=variant_name, sections=sections, description=sections_to_description(sections),
+                images=list(result['images']) if source['shade'] == variant['shade'] else [],
+                family_source=source_name, elapsed=0.0)
+
+class ProductFamilies:
+    def __init__(self, names: Iterable[str], brands: Optional[Iterable[Optional[str]]] = None):
+        """Group product names (with their brands, if known) into families"""
+        names = list(names)
+        brands = list(brands) if brands is not None else [None] * len(names)
+        self._keys: Dict[str, str] = {}
+        self.members: Dict[str, List[str]] = defaultdict(list)
+        for name, brand in zip(names, brands):
+            if name is None or (not isinstance(name, str) and pd.isna(name)):
+                continue
+            name = str(name).strip()
+            key = family_key(name, brand)
+            self._keys.setdefault(name, key)
+            self.members[key].append(name)
+
+        self._lock = threading.Lock()
+        # family key -> Future while its first variant is generated, then the reusable result
+        self._canonical: Dict[str, object] = {}
+        self._owners: Dict[str, str] = {}
+        self.reused = 0
+        self.generated = 0
+
+    @classmethod
+    def from_catalogue(cls, df: pd.DataFrame) -> 'ProductFamilies':
+        return cls(df[NAME_COLUMN], df['Brand'] if 'Brand' in df.columns else None)
+
+    def family_of(self, name: str) -> Optional[str]:
+        """Family key of a product, or None if it has no siblings"""
+        key = self._keys.get(str(name).strip())
+        return key if key is not None and len(self.members[key]) > 1 else None
+
+    def _claim_step(self, key: str, name: str) -> Tuple[Optional[Dict], Optional[Future]]:
+        """(reusable result, None), (None, None) if name now owns the family, or (None, Future) to wait on"""
+        with self._lock:
+            state = self._canonical.get(key)
+            if state is None:
+                self._canonical[key] = Future()
+                self._owners[key] = name
+                return None, None
+            if isinstance(state, dict):
+                self.reused += 1
+                return state, None
+            return None, state
+
+    def claim(self, name: str) -> Optional[Dict]:
+        """A sibling's reusable result for name, waiting while one is being generated
+
+        None means name must be generated by the caller, who then reports the
+        result with finish().
+        """
+        key = self.family_of(name)
+        if key is None:
+            return None
+        while True:
+            result, pending = self._claim_step(key, name)
+            if pending is None:
+                return result
+            # A sibling is being generated; None back means it failed and someone must retry
+            pending.result()
+
+    async def claim_async(self, name: str) -> Optional[Dict]:
+        """Coroutine version of claim that waits without blocking the event loop"""
+        key = self.family_of(name)
+        if key is None:
+            return None
+        while True:
+            result, pending = self._claim_step(key, name)
+            if pending is None:
+                return result
+            # Shielded: a cancelled waiter must not cancel the Future its siblings share
+            await asyncio.shield(asyncio.wrap_future(pending))
+
+    def finish(self, name: str, result: Optional[Dict]) -> None:
+        """Report the result generated for a claimed product (None if processing raised)"""
+        key = self.family_of(name)
+        if key is None:
+            with self._lock:
+                self.generated += 1
+            return
+        with self._lock:
+            self.generated += 1
+            future = self._canonical.get(key)
+            if not isinstance(future, Future) or self._owners.get(key) != name:
+                return
+            # Only complete results are shared; otherwise the next sibling generates its own
+            if result is not None and result['status'] == 'success' and not result.get('circuit_open'):
+                self._canonical[key] = result
+            else:
+                del self._canonical[key]
+                result = None
+        if not future.done():
+            future.set_result(result)
+
+    def summary(self) -> Dict:
+        products = sum(len(members) for members in self.members.values())
+        return {
+            'products': products,
+            'families': len(self.members),
+            'multi_variant_families': sum(1 for members in self.members.values() if len(members) > 1),
+            'reusable_products': products - len(self.members)
+        }
+
+    def report(self) -> pd.DataFrame:
+        """One row per product: its family (first member) and family size"""
+        rows = [{'family': members[0], 'product': name, 'variants': len(members)}
+                for members in self.members.values() for name in members]
+        return pd.DataFrame(rows, columns=['family', 'product', 'variants'])
+
+    def print_stats(self, api_calls: Optional[Dict[str, int]] = None) -> None:
+        """Print how many products reused a sibling's content and the API calls that saved"""
+        per_product = sum(api_calls.values()) / self.generated if api_calls and self.generated else CALLS_PER_PRODUCT
+        print(f"Product families: {self.generated} products generated, {self.reused} reused a sibling's content "
+              f"(~{self.reused * per_product:.0f} API calls saved)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Group the sheet's products into size/shade/tester families")
+    parser.add_argument('--csv', default=DEFAULT_CSV_FILE, help="Product sheet")
+    parser.add_argument('--output', default='product_families.csv', help="Product-to-family table")
+    args = parser.parse_args()
+
+    families = ProductFamilies.from_catalogue(get_catalogue_store(args.csv).load())
+    summary = families.summary()
+    families.report().to_csv(args.output, index=False)
+    print(f"{summary['products']} products in {summary['families']} families "
+          f"({summary['multi_variant_families']} with more than one variant)")
+    saved = summary['reusable_products'] * CALLS_PER_PRODUCT
+    print(f"Reusing family content skips {summary['reusable_products']} generations "
+          f"(~{saved} of {summary['products'] * CALLS_PER_PRODUCT} quota API calls, "
+          f"{saved / max(1, summary['products'] * CALLS_PER_PRODUCT) * 100:.0f}%)")
+    print(f"Families saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Persistent progress ledger for missing-content regeneration.
+Every filled field is appended to a JSONL ledger keyed by product ID, together
+with its value, when it was generated and by which model or API. Reruns load the
+ledger into a dict and skip (or re-apply) finished fields without calling the APIs.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional, Set, Union
+
+import pandas as pd
+
+DEFAULT_LEDGER_FILE = 'regeneration_ledger.jsonl'
+
+def ledger_key(record_id: Any) -> Optional[str]:
+    """Normalize a product ID (int, float from pandas, or str) to the ledger key"""
+    if record_id is None or (not isinstance(record_id, str) and pd.isna(record_id)):
+        return None
+    if isinstance(record_id, float) and record_id.is_integer():
+        record_id = int(record_id)
+    key = str(record_id).strip()
+    return key or None
+
+class ProgressLedger:
+    def __init__(self, path: str = DEFAULT_LEDGER_FILE):
+        """Load the ledger at path (created on the first record)"""
+        self.path = path
+        self._lock = threading.Lock()
+        # product ID -> field -> {'value', 'model', 'timestamp'}
+        self.entries: Dict[str, Dict[str, Dict]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash
+                    continue
+                fields = self.entries.setdefault(entry['id'], {})
+                for field, value in entry['fields'].items():
+                    fields[field] = {'value': value, 'model': entry['models'].get(field), 'timestamp': entry['timestamp']}
+
+    def record(self, record_id: Any, cells: Dict[str, str], model: Union[str, Dict[str, str]]) -> None:
+        """Append the filled fields of one product; model is one name or a per-field mapping"""
+        key = ledger_key(record_id)
+        if key is None or not cells:
+            return
+        models = model if isinstance(model, dict) else {field: model for field in cells}
+        entry = {
+            'id': key,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'fields': cells,
+            'models': {field: models.get(field) for field in cells}
+        }
+        with self._lock:
+            # Terminate a torn line left by a crash before appending
+            needs_newline = False
+            if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                with open(self.path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    needs_newline = f.read(1) != b'\n'
+            with open(self.path, 'a', encoding='utf-8') as f:
+                if needs_newline:
+                    f.write('\n')
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            fields = self.entries.setdefault(key, {})
+            for field, value in cells.items():
+                fields[field] = {'value': value, 'model': entry['models'][field], 'timestamp': entry['timestamp']}
+
+    def done_fields(self, record_id: Any) -> Set[str]:
+        """Fields already filled for a product"""
+        return set(self.entries.get(ledger_key(record_id), {}))
+
+    def values(self, record_id: Any) -> Dict[str, str]:
+        """Field -> value for everything already filled for a product"""
+        return {field: info['value'] for field, info in self.entries.get(ledger_key(record_id), {}).items()}
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Token-bucket rate limiting shared by the Gemini, Custom Search and YouTube clients.
+Each service gets one limiter per process, so every worker thread draws from the
+same quota and only waits as long as that service actually requires. Daily request
+counts are kept in a small SQLite file next to the response cache and keyed on the
+Pacific date, so runs on the same quota day share one daily quota.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, Optional
+
+from instrumentation import get_run_metrics
+from response_cache import DEFAULT_CACHE_FILE
+
+try:
+    from zoneinfo import ZoneInfo
+    QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')  # Google API daily quotas reset at midnight Pacific time
+except Exception:
+    QUOTA_TIMEZONE = None
+
+QUOTA_FILE_NAME = 'api_quota_usage.sqlite'
+
+# Default quotas per service (free tier). Override with environment variables such as
+# GEMINI_REQUESTS_PER_MINUTE, CUSTOMSEARCH_REQUESTS_PER_DAY or YOUTUBE_BURST.
+DEFAULT_RATE_LIMITS = {
+    'gemini': {'requests_per_minute': 10, 'requests_per_day': 1500, 'burst': 2},
+    'customsearch': {'requests_per_minute': 100, 'requests_per_day': 100, 'burst': 5},
+    # YouTube allows 10,000 units/day and a search costs 100 units
+    'youtube': {'requests_per_minute': 60, 'requests_per_day': 100, 'burst': 5},
+}
+
+class DailyQuotaExceeded(Exception):
+    """Raised when a service has used up its configured daily request quota"""
+    def __init__(self, service: str, requests_per_day: int):
+        super().__init__(f"Daily quota of {requests_per_day} requests exhausted for {service}")
+        self.service = service
+        self.requests_per_day = requests_per_day
+
+def quota_day() -> date:
+    """The current quota day (the date in Pacific time)"""
+    return datetime.now(QUOTA_TIMEZONE).date()
+
+def default_quota_file() -> str:
+    """Usage file in the response cache's directory (override with API_QUOTA_FILE)"""
+    cache_dir = os.path.dirname(os.getenv('API_CACHE_FILE', DEFAULT_CACHE_FILE))
+    return os.getenv('API_QUOTA_FILE', os.path.join(cache_dir, QUOTA_FILE_NAME))
+
+class QuotaLedger:
+    def __init__(self, path: str):
+        """Open (or create) the SQLite file holding the requests used per service and quota day"""
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS quota_usage (
+                service TEXT NOT NULL,
+                day TEXT NOT NULL,
+                used INTEGER NOT NULL,
+                PRIMARY KEY (service, day)
+            )''')
+        self._conn.commit()
+
+    def take(self, service: str, day: date, limit: int) -> bool:
+        """Count one request against service's quota for day; False if the quota is used up
+
+        Check and increment are one statement, so processes sharing the file
+        cannot go over the limit together.
+        """
+        if limit <= 0:
+            return False
+        with self._lock:
+            taken = self._conn.execute(
+                'INSERT INTO quota_usage (service, day, used) VALUES (?, ?, 1) '
+                'ON CONFLICT(service, day) DO UPDATE SET used = used + 1 WHERE used < ?',
+                (service, day.isoformat(), limit)
+            ).rowcount
+            self._conn.commit()
+        return taken > 0
+
+    def used(self, service: str, day: date) -> int:
+        with self._lock:
+            row = self._conn.execute('SELECT used FROM quota_usage WHERE service = ? AND day = ?',
+                                     (service, day.isoformat())).fetchone()
+        return row[0] if row else 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+_shared_ledger: Optional[QuotaLedger] = None
+_shared_ledger_lock = threading.Lock()
+
+def get_quota_ledger() -> Optional[QuotaLedger]:
+    """Return the process-wide quota ledger (None if its file cannot be opened)"""
+    global _shared_ledger
+    with _shared_ledger_lock:
+        if _shared_ledger is None:
+            try:
+                _shared_ledger = QuotaLedger(default_quota_file())
+            except sqlite3.Error as e:
+                print(f"Warning: could not open the quota usage file ({e}); daily quotas are counted per process")
+                return None
+        return _shared_ledger
+
+class RateLimiter:
+    def __init__(self, service: str, requests_per_minute: float, requests_per_day: Optional[int] = None, burst: int = 1,
+                 ledger: Optional[QuotaLedger] = None):
+        """Initialize a token bucket refilled at requests_per_minute with room for burst requests
+
+        With a ledger the daily count is shared with every run on the same quota
+        day; without one it is only counted in this process.
+        """
+        self.service = service
+        self.requests_per_minute = requests_per_minute
+        self.requests_per_day = requests_per_day
+        self.burst = max(1, burst)
+        self.ledger = ledger
+
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._refill_rate = requests_per_minute / 60.0  # tokens per second
+        self._last_refill = time.monotonic()
+        self._day = quota_day()
+        self._requests_today = 0
+        self.total_wait = 0.0
+
+    def _refill(self, now: float) -> None:
+        """Add the tokens accumulated since the last refill"""
+        elapsed = now - self._last_refill
+        self._tokens = min(float(self.burst), self._tokens + elapsed * self._refill_rate)
+        self._last_refill = now
+
+    def _take_daily(self) -> None:
+        """Count one request against today's quota, raising DailyQuotaExceeded if it is used up"""
+        if self.requests_per_day is None:
+            return
+        today = quota_day()
+        if self.ledger is not None:
+            try:
+                taken = self.ledger.take(self.service, today, self.requests_per_day)
+            except sqlite3.Error as e:
+                print(f"Warning: quota usage file unavailable ({e}); counting {self.service} requests in memory")
+                self.ledger = None
+            else:
+                if not taken:
+                    raise DailyQuotaExceeded(self.service, self.requests_per_day)
+                return
+        if today != self._day:
+            self._day = today
+            self._requests_today = 0
+        if self._requests_today >= self.requests_per_day:
+            raise DailyQuotaExceeded(self.service, self.requests_per_day)
+        self._requests_today += 1
+
+    def _reserve(self) -> float:
+        """Take one request slot and return how long the caller must wait before using it"""
+        with self._lock:
+            self._take_daily()
+
+            now = time.monotonic()
+            self._refill(now)
+
+            # Reserve the token now (the bucket may go negative) so concurrent callers
+            # queue up behind each other instead of all waking at the same moment
+            self._tokens -= 1
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self._refill_rate
+            self.total_wait += wait
+        return wait
+
+    def acquire(self) -> float:
+        """Take one request slot, sleeping if needed. Returns the number of seconds waited."""
+        wait = self._reserve()
+        if wait > 0:
+            get_run_metrics().sleep(wait, f"rate_limit:{self.service}")
+        return wait
+
+    async def acquire_async(self) -> float:
+        """Like acquire, but waits without blocking the event loop"""
+        wait = self._reserve()
+        if wait > 0:
+            await get_run_metrics().sleep_async(wait, f"rate_limit:{self.service}")
+        return wait
+
+    def remaining_today(self) -> Optional[int]:
+        """Number of requests left in today's quota (None if unlimited)"""
+        if self.requests_per_day is None:
+            return None
+        with self._lock:
+            today = quota_day()
+            if self.ledger is not None:
+                try:
+                    return max(0, self.requests_per_day - self.ledger.used(self.service, today))
+                except sqlite3.Error:
+                    pass
+            if today != self._day:
+                return self.requests_per_day
+            return max(0, self.requests_per_day - self._requests_today)
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def _limit_from_env(service: str, name: str, default):
+    """Read a quota override like GEMINI_REQUESTS_PER_MINUTE from the environment"""
+    value = os.getenv(f"{service.upper()}_{name.upper()}")
+    if value is None or value.strip() == '':
+        return default
+    return float(value) if name == 'requests_per_minute' else int(value)
+
+def configure_rate_limiter(service: str, requests_per_minute: float, requests_per_day: Optional[int] = None, burst: int = 1) -> RateLimiter:
+    """Replace the shared limiter for a service with the given quota"""
+    ledger = get_quota_ledger() if requests_per_day is not None else None
+    limiter = RateLimiter(service, requests_per_minute, requests_per_day, burst, ledger)
+    with _limiters_lock:
+        _limiters[service] = limiter
+    return limiter
+
+def get_rate_limiter(service: str) -> RateLimiter:
+    """Return the process-wide limiter for a service, creating it from the defaults on first use"""
+    with _limiters_lock:
+        if service not in _limiters:
+            defaults = DEFAULT_RATE_LIMITS.get(service, {'requests_per_minute': 60, 'requests_per_day': None, 'burst': 1})
+            requests_per_day = _limit_from_env(service, 'requests_per_day', defaults['requests_per_day'])
+            _limiters[service] = RateLimiter(
+                service,
+                _limit_from_env(service, 'requests_per_minute', defaults['requests_per_minute']),
+                requests_per_day,
+                _limit_from_env(service, 'burst', defaults['burst']),
+                get_quota_ledger() if requests_per_day is not None else None
+            )
+        return _limiters[service]
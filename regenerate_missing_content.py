@@ -7,52 +7,117 @@ and regenerates only those missing fields using the Gemini API.
 
 import pandas as pd
 import google.generativeai as genai
+import argparse
 import time
 import os
 import requests
 import json
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional, Tuple
 from googleapiclient.discovery import build
 from datetime import datetime
 
 # Import the existing classes
+from batch_generation import BatchContentGenerator
+from catalogue_snapshot import SnapshotStore
+from catalogue_store import backup_csv, load_catalogue
+from checkpoint import CheckpointJournal, journal_target
 from gemini_csv_processor import GoogleImageSearcher, YouTubeSearcher
+from instrumentation import get_run_metrics, report_path
+from missing_data import CONTENT_COLUMNS, analyze_missing, missing_fields_by_row, row_is_complete
+from pipeline_stages import DEFAULT_STAGE_TIMEOUTS, run_stages, stage_error_messages
+from progress_ledger import DEFAULT_LEDGER_FILE, ProgressLedger, ledger_key
+from rate_limiter import get_rate_limiter
+from resilience import CircuitOpenError, find_circuit_error, wait_for_circuit
+from response_cache import get_shared_cache
+from structured_generation import COLUMN_SECTIONS, SECTION_COLUMNS, StructuredSectionGenerator, parse_sections
+
+# Rows processed when no selection is given on the command line (1-based, inclusive)
+DEFAULT_ROWS = '196-197,221-226,228-245'
+
+def parse_row_ranges(spec: str) -> List[int]:
+    """Turn a 1-based row selection like '196-197,221-226' into 0-based indices"""
+    indices = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            indices.extend(range(int(first) - 1, int(last)))
+        else:
+            indices.append(int(part) - 1)
+    return indices
+
+def regeneration_journal_path(csv_file: str) -> str:
+    """Checkpoint journal of the regeneration runs on an input CSV"""
+    return os.path.splitext(csv_file)[0] + '.regen.journal.jsonl'
 
 class MissingContentRegenerator:
-    def __init__(self, gemini_api_key: str, google_api_key: str, search_engine_id: str):
-        """Initialize the missing content regenerator"""
-        genai.configure(api_key=gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+    def __init__(self, gemini_api_key: str, google_api_key: str, search_engine_id: str, ledger_file: str = DEFAULT_LEDGER_FILE, batch_size: int = 1,
+                 model=None, image_searcher: Optional[GoogleImageSearcher] = None, youtube_searcher: Optional[YouTubeSearcher] = None):
+        """Initialize the missing content regenerator (batch_size > 1 packs that many products into one Gemini request)
+
+        model and the searchers can be injected, e.g. fakes for benchmarks.
+        """
+        self.model_name = 'gemini-2.0-flash-exp'
+        if model is None:
+            genai.configure(api_key=gemini_api_key)
+            model = genai.GenerativeModel(self.model_name)
+        self.model = model
+        self.rate_limiter = get_rate_limiter('gemini')
+        self.cache = get_shared_cache()
+        self.section_generator = StructuredSectionGenerator(self.model, self.model_name, self.rate_limiter, self.cache)
+        self.ledger = ProgressLedger(ledger_file)
+        self.batch_size = batch_size
+        
+        # Text, image and video stages of a record run side by side on this pool
+        self.stage_timeouts = dict(DEFAULT_STAGE_TIMEOUTS)
+        # (created on first use and shut down at the end of each regeneration run)
+        self._stage_executor: Optional[ThreadPoolExecutor] = None
+        self._stage_lock = threading.Lock()
         
         # Initialize search services
-        self.image_searcher = GoogleImageSearcher(google_api_key, search_engine_id)
-        self.youtube_searcher = YouTubeSearcher(google_api_key)
+        self.image_searcher = image_searcher or GoogleImageSearcher(google_api_key, search_engine_id)
+        self.youtube_searcher = youtube_searcher or YouTubeSearcher(google_api_key)
         
         # Define the content columns we work with
-        self.content_columns = [
-            'Image 1', 'Image 2', 'Image 3', 'Image 4', 'Image 5', 'Video',
-            '1. Captivating Headline or Tagline',
-            '2. Sensory Introduction (1–2 sentences)',
-            '3. Key Features or Ingredients (Bullet Points or Icons)',
-            '4. How to Use (Optional but useful)',
-            '5. Emotional or Lifestyle Hook',
-            '6. Tech Specs or Product Facts'
-        ]
+        self.content_columns = list(CONTENT_COLUMNS)
+    
+    @property
+    def stage_executor(self) -> ThreadPoolExecutor:
+        with self._stage_lock:
+            if self._stage_executor is None:
+                self._stage_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='stage')
+            return self._stage_executor
+    
+    def close(self) -> None:
+        """Shut down the stage pool (it is created again if the regenerator is used afterwards)"""
+        with self._stage_lock:
+            executor, self._stage_executor = self._stage_executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
         
     def analyze_missing_data(self, csv_file: str) -> Tuple[pd.DataFrame, List[Dict]]:
         """Analyze the CSV file and identify missing data"""
         print(f"Reading CSV file: {csv_file}")
-        df = pd.read_csv(csv_file)
+        df = load_catalogue(csv_file)
         
         print(f"Total records: {len(df)}")
         
-        # Analyze missing data
-        missing_analysis = {}
+        # Compute the row x field missing mask for the whole frame at once
+        analysis = analyze_missing(df, self.content_columns)
         for col in self.content_columns:
-            if col in df.columns:
-                missing = df[col].isna().sum() + (df[col] == '').sum()
-                missing_analysis[col] = missing
+            if col in analysis['field_counts'].index:
+                missing = int(analysis['field_counts'][col])
                 percentage = (missing / len(df)) * 100
                 print(f"{col}: {missing} missing ({percentage:.1f}%)")
             else:
@@ -60,35 +125,32 @@ class MissingContentRegenerator:
         
         # Find records that need regeneration
         records_needing_regeneration = []
-        records_complete = 0
-        
-        for index, row in df.iterrows():
-            missing_fields = []
-            for col in self.content_columns:
-                if col in df.columns:
-                    # Check if field is missing (NaN, empty string, or just whitespace)
-                    cell_value = row[col]
-                    if pd.isna(cell_value) or str(cell_value).strip() == '':
-                        missing_fields.append(col)
-            
-            if missing_fields:
-                records_needing_regeneration.append({
-                    'index': index,
-                    'id': row.get('ID', 'Unknown'),
-                    'product_name': row.get('Line', 'Unknown Product'),
-                    'brand': row.get('Brand', 'Unknown Brand'),
-                    'missing_fields': missing_fields
-                })
-                if len(records_needing_regeneration) <= 10:  # Only show first 10 to avoid spam
-                    print(f"Record {index + 1} ({row.get('Brand', 'Unknown')} {row.get('Line', 'Unknown')}): Missing {len(missing_fields)} fields - {', '.join(missing_fields[:3])}{'...' if len(missing_fields) > 3 else ''}")
-                elif len(records_needing_regeneration) == 11:
-                    print("... (showing only first 10 records with missing data)")
-            else:
-                records_complete += 1
-                if records_complete <= 5:  # Only show first 5 complete records to avoid spam
-                    print(f"Record {index + 1} ({row.get('Brand', 'Unknown')} {row.get('Line', 'Unknown')}): ✓ Complete - SKIPPING")
-                elif records_complete == 6:
-                    print("... (additional complete records will be skipped silently)")
+        records_complete = len(analysis['complete_rows'])
+        missing_by_row = missing_fields_by_row(analysis['mask'])
+        rows = analysis['rows_to_regenerate']
+        
+        def column_values(column: str, default: str) -> List:
+            return df.loc[rows, column].tolist() if column in df.columns else [default] * len(rows)
+        
+        for index, record_id, product_name, brand in zip(rows, column_values('ID', 'Unknown'), column_values('Line', 'Unknown Product'), column_values('Brand', 'Unknown Brand')):
+            missing_fields = missing_by_row[index]
+            records_needing_regeneration.append({
+                'index': index,
+                'id': record_id,
+                'product_name': product_name,
+                'brand': brand,
+                'missing_fields': missing_fields
+            })
+            if len(records_needing_regeneration) <= 10:  # Only show first 10 to avoid spam
+                print(f"Record {index + 1} ({brand} {product_name}): Missing {len(missing_fields)} fields - {', '.join(missing_fields[:3])}{'...' if len(missing_fields) > 3 else ''}")
+            elif len(records_needing_regeneration) == 11:
+                print("... (showing only first 10 records with missing data)")
+        
+        for index in analysis['complete_rows'][:5]:  # Only show first 5 complete records to avoid spam
+            row = df.loc[index]
+            print(f"Record {index + 1} ({row.get('Brand', 'Unknown')} {row.get('Line', 'Unknown')}): ✓ Complete - SKIPPING")
+        if records_complete > 5:
+            print("... (additional complete records will be skipped silently)")
         
         print(f"\n" + "="*60)
         print(f"ANALYSIS SUMMARY:")
@@ -98,8 +160,8 @@ class MissingContentRegenerator:
         
         if records_needing_regeneration:
             print(f"\nMost frequently missing fields:")
-            missing_summary = self.get_missing_fields_summary(records_needing_regeneration)
-            for field, count in sorted(missing_summary.items(), key=lambda x: x[1], reverse=True):
+            missing_summary = analysis['field_counts'][analysis['field_counts'] > 0]
+            for field, count in missing_summary.sort_values(ascending=False).items():
                 percentage = (count / len(records_needing_regeneration)) * 100
                 print(f"  {field}: {count} records ({percentage:.1f}%)")
         
@@ -109,12 +171,7 @@ class MissingContentRegenerator:
     
     def has_complete_data(self, row: pd.Series) -> bool:
         """Check if a record has all required content fields filled"""
-        for col in self.content_columns:
-            if col in row.index:
-                cell_value = row[col]
-                if pd.isna(cell_value) or str(cell_value).strip() == '':
-                    return False
-        return True
+        return row_is_complete(row, self.content_columns)
     
     def get_missing_fields_summary(self, records_needing_regeneration: List[Dict]) -> Dict[str, int]:
         """Get a summary of which fields are missing most frequently"""
@@ -125,34 +182,13 @@ class MissingContentRegenerator:
         return field_missing_count
     
     def create_content_prompt(self, product_name: str, brand: str, missing_fields: List[str]) -> str:
-        """Create a prompt to generate only the missing content fields"""
-        full_product_name = f"{brand} {product_name}"
-        
-        field_descriptions = {
-            '1. Captivating Headline or Tagline': 'Write a brief, poetic or powerful phrase that evokes the essence of the product in Bulgarian.',
-            '2. Sensory Introduction (1–2 sentences)': 'Describe the experience of using the product, focusing on the feel, scent, effect, or vibe in Bulgarian (1-2 sentences).',
-            '3. Key Features or Ingredients (Bullet Points or Icons)': 'Present the top 4–6 features as bullet points, focusing on performance, quality, and what sets it apart in Bulgarian.',
-            '4. How to Use (Optional but useful)': 'Provide simple step-by-step instructions in Bulgarian.',
-            '5. Emotional or Lifestyle Hook': 'Show the identity or vibe the user taps into by using this product in Bulgarian.',
-            '6. Tech Specs or Product Facts': 'Include size/volume, longevity, origin, certifications in Bulgarian.'
-        }
-        
-        prompt = f"""Generate content for this beauty/perfume product in Bulgarian language: {full_product_name}
-
-Please provide ONLY the following sections that are missing:
-
-"""
-        
-        for field in missing_fields:
-            if field in field_descriptions:
-                prompt += f"**{field}:**\n{field_descriptions[field]}\n\n"
-        
-        prompt += """
-Please write each section clearly separated and labeled. Write ONLY in Bulgarian language.
-Do NOT include any image URLs or video links as I will handle those separately.
-"""
-        
-        return prompt
+        """Create a prompt to generate only the missing content fields (as schema-constrained JSON)"""
+        return self.section_generator.create_prompt(f"{brand} {product_name}", self.section_keys(missing_fields))
+    
+    @staticmethod
+    def section_keys(fields: List[str]) -> List[str]:
+        """Section keys of the text columns among fields"""
+        return [COLUMN_SECTIONS[field] for field in fields if field in COLUMN_SECTIONS]
     
     def search_missing_media(self, product_name: str, brand: str, missing_fields: List[str]) -> Dict:
         """Search for missing images and video"""
@@ -177,161 +213,313 @@ Do NOT include any image URLs or video links as I will handle those separately.
         return media_data
     
     def parse_generated_content(self, content: str, missing_fields: List[str]) -> Dict:
-        """Parse the generated content into individual fields"""
-        parsed_content = {}
-        
-        # Define patterns to match each field
-        field_patterns = {
-            '1. Captivating Headline or Tagline': r'\*\*1\.\s*Captivating Headline or Tagline:\*\*\s*\n(.*?)(?=\n\*\*|\n\n|\Z)',
-            '2. Sensory Introduction (1–2 sentences)': r'\*\*2\.\s*Sensory Introduction.*?\*\*\s*\n(.*?)(?=\n\*\*|\n\n|\Z)',
-            '3. Key Features or Ingredients (Bullet Points or Icons)': r'\*\*3\.\s*Key Features.*?\*\*\s*\n(.*?)(?=\n\*\*|\n\n|\Z)',
-            '4. How to Use (Optional but useful)': r'\*\*4\.\s*How to Use.*?\*\*\s*\n(.*?)(?=\n\*\*|\n\n|\Z)',
-            '5. Emotional or Lifestyle Hook': r'\*\*5\.\s*Emotional or Lifestyle Hook.*?\*\*\s*\n(.*?)(?=\n\*\*|\n\n|\Z)',
-            '6. Tech Specs or Product Facts': r'\*\*6\.\s*Tech Specs.*?\*\*\s*\n(.*?)(?=\n\*\*|\n\n|\Z)'
-        }
-        
-        for field in missing_fields:
-            if field in field_patterns:
-                pattern = field_patterns[field]
-                match = re.search(pattern, content, re.DOTALL | re.IGNORECASE)
-                if match:
-                    parsed_content[field] = match.group(1).strip()
-                else:
-                    # Fallback: try to extract content after the field name
-                    simple_pattern = rf'{re.escape(field)}:?\s*\n(.*?)(?=\n[0-9]+\.|\n\*\*|\Z)'
-                    match = re.search(simple_pattern, content, re.DOTALL | re.IGNORECASE)
-                    if match:
-                        parsed_content[field] = match.group(1).strip()
-        
-        return parsed_content
+        """Parse a JSON (or, as a fallback, markdown) answer into individual fields"""
+        sections = parse_sections(content, self.section_keys(missing_fields))
+        return {SECTION_COLUMNS[key]: text for key, text in sections.items()}
+    
+    def select_records(self, df: pd.DataFrame, records: List[Dict], ids: Optional[List[str]] = None, rows: Optional[List[int]] = None, start_from_id: Optional[str] = None) -> List[Dict]:
+        """Narrow the records needing regeneration to the requested IDs / 0-based rows, starting at start_from_id"""
+        if ids is not None:
+            wanted_ids = {ledger_key(record_id) for record_id in ids}
+            records = [r for r in records if ledger_key(r['id']) in wanted_ids]
+        if rows is not None:
+            wanted_rows = set(rows)
+            records = [r for r in records if r['index'] in wanted_rows]
+        if start_from_id is not None:
+            if 'ID' not in df.columns:
+                print("No ID column in CSV; ignoring start_from_id")
+                return records
+            # The start product itself may already be complete, so locate it in the frame
+            matches = df.index[(df['ID'].map(ledger_key) == ledger_key(start_from_id)).to_numpy()]
+            if len(matches) == 0:
+                print(f"ID {start_from_id} not found in CSV; nothing to process")
+                return []
+            records = [r for r in records if r['index'] >= matches[0]]
+        return records
+    
+    def apply_ledger(self, df: pd.DataFrame, records: List[Dict], journal: CheckpointJournal) -> List[Dict]:
+        """Fill fields already recorded in the progress ledger and return the records that still need work"""
+        remaining_records = []
+        restored_fields = 0
+        for record in records:
+            done = self.ledger.values(record['id'])
+            restored = {field: done[field] for field in record['missing_fields'] if field in done}
+            if restored:
+                for field, value in restored.items():
+                    df.at[record['index'], field] = value
+                journal.record(record['index'], restored, record['id'])
+                restored_fields += len(restored)
+                record['missing_fields'] = [f for f in record['missing_fields'] if f not in restored]
+            if record['missing_fields']:
+                remaining_records.append(record)
+        if restored_fields:
+            print(f"Progress ledger: restored {restored_fields} fields without API calls "
+                  f"({len(records) - len(remaining_records)} records needed no regeneration)")
+            journal.maybe_compact(df)
+        return remaining_records
     
-    def regenerate_missing_content(self, csv_file: str, output_csv: str = None, delay: float = 2.0, start_from_id: str = None) -> None:
-        """Main method to regenerate missing content"""
+    def regenerate_missing_content(self, csv_file: str, output_csv: str = None, delay: float = 0.0, start_from_id: str = None,
+                                   ids: Optional[List[str]] = None, rows: Optional[List[int]] = None) -> None:
+        """Main method to regenerate missing content (API quotas are enforced by the shared rate limiters)
+
+        ids and rows (0-based indices) limit the run to those records; None means all records.
+        Fields already in the progress ledger are filled from it instead of being regenerated.
+        """
+        metrics = get_run_metrics()
+        metrics.start_run('regenerate_missing_content')
+        
+        # The journal lives next to the input, so a crashed run is found again even though
+        # the default output name has a timestamp; it names the output it belongs to
+        journal_path = regeneration_journal_path(csv_file)
+        crashed_output = journal_target(journal_path)
         if output_csv is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_csv = f'updated_products_{timestamp}.csv'
+            output_csv = crashed_output or f'updated_products_{timestamp}.csv'
+        
+        # Replay the journal of a previous run that crashed before its final save
+        if crashed_output and os.path.abspath(crashed_output) != os.path.abspath(output_csv):
+            CheckpointJournal(crashed_output, journal_path=journal_path).recover()
+        journal = CheckpointJournal(output_csv, journal_path=journal_path)
+        recovered = journal.recover() is not None
+        if recovered:
+            print(f"Continuing from recovered output file: {output_csv}")
         
         # Analyze missing data
-        df, records_needing_regeneration = self.analyze_missing_data(csv_file)
+        df, records_needing_regeneration = self.analyze_missing_data(output_csv if recovered else csv_file)
         
         if not records_needing_regeneration:
             print("No missing content found. All records are complete!")
             return
 
-        # Define the specific records to process based on user request
-        # - Rows 196 (ID 14127) and 197 (ID 39745) -> indices 195, 196
-        # - Rows 221 to 226 -> indices 220 to 225
-        # - Rows 228 to 245 -> indices 227 to 244
-        indices_to_process = set()
-        indices_to_process.add(195)  # Row 196
-        indices_to_process.add(196)  # Row 197
-        indices_to_process.update(range(220, 226))  # Rows 221 to 226
-        indices_to_process.update(range(227, 245))  # Rows 228 to 245
-
-        records_to_process = [
-            r for r in records_needing_regeneration if r['index'] in indices_to_process
-        ]
+        records_to_process = self.select_records(df, records_needing_regeneration, ids, rows, start_from_id)
         
         if not records_to_process:
-            print("No records found for regeneration in the specified ranges.")
+            print("No records found for regeneration in the specified selection.")
             return
 
-        print(f"\nStarting regeneration of {len(records_to_process)} specific records...")
+        print(f"\nStarting regeneration of {len(records_to_process)} selected records...")
         print(f"Output file: {output_csv}")
         print("=" * 60)
         
-        # Create a backup
-        backup_file = csv_file.replace('.csv', '_backup_regen.csv')
-        df.to_csv(backup_file, index=False)
-        print(f"Backup created: {backup_file}")
-        
-        # Create initial output file
-        df.to_csv(output_csv, index=False)
-        print(f"Initial output file created: {output_csv}")
+        # Back up the input as a compressed snapshot; the run's changes are exported as a delta on top of it
+        source_csv = output_csv if recovered else csv_file
+        snapshots = SnapshotStore()
+        original_df = df.copy()
+        backup_snapshot = snapshots.snapshot(source_csv, original_df)
+        print(f"Backup snapshot: {snapshots.path(backup_snapshot)}")
+        if not recovered:
+            # Create initial output file (the frame is still identical to the CSV, so this is a file copy)
+            if os.path.abspath(output_csv) != os.path.abspath(csv_file):
+                backup_csv(csv_file, output_csv)
+            print(f"Initial output file created: {output_csv}")
+        
+        # Content columns that pandas read as numbers (all empty) must accept text
+        for col in self.content_columns:
+            if col in df.columns and pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = df[col].astype(object)
         
-        # Process each record
-        updated_count = 0
-        total_fields_updated = 0
-        skipped_count = 0
+        # Reuse fields generated by earlier runs
+        selected_count = len(records_to_process)
+        records_to_process = self.apply_ledger(df, records_to_process, journal)
         
-        print(f"\nStarting to process {len(records_needing_regeneration)} records with missing data...")
+        print(f"\nStarting to process {len(records_to_process)} records with missing data...")
         print(f"Note: Records with complete data have already been identified and will be skipped.")
-        print(f"Auto-save: Progress will be saved after each record to prevent data loss.\n")
+        print(f"Auto-save: Changed cells are journaled after each record and merged into the CSV every {journal.compact_every} records.\n")
+        
+        try:
+            self.process_records(df, records_to_process, journal, delay)
+        finally:
+            # Final compaction of the journal into the CSV (also on interrupt)
+            with metrics.stage('csv_write'):
+                journal.compact(df)
+            snapshots.record_run(backup_snapshot, original_df, df, output_csv)
+            self.close()
         
-        for i, record in enumerate(records_to_process, 1):
+        updated_count = self.updated_count
+        total_fields_updated = self.total_fields_updated
+        
+        print("\n" + "=" * 60)
+        print(f"Regeneration complete!")
+        print(f"Records selected: {selected_count}")
+        print(f"Records processed: {len(records_to_process)}")
+        print(f"Records updated: {updated_count} ({self.partial_count} partially, some stages failed)")
+        print(f"Total fields updated: {total_fields_updated}")
+        print(f"Final output saved to: {output_csv}")
+        print(f"Backup snapshot: {snapshots.path(backup_snapshot)}")
+        print(f"Note: Progress was journaled after each record.")
+        self.cache.print_hit_rates()
+        metrics.write_report(report_path(output_csv))
+        print(f"=" * 60)
+    
+    def generate_text_batch(self, batch_generator: BatchContentGenerator, records: List[Dict]) -> Dict[int, Dict[str, str]]:
+        """Generate the missing text fields of several records with batched Gemini requests"""
+        # Every record of the chunk counts as attempted, even if the batch fails
+        texts = {record['index']: {} for record in records}
+        products = []
+        for record in records:
+            keys = self.section_keys(record['missing_fields'])
+            if keys:
+                products.append({'id': str(record['index']), 'name': f"{record['brand']} {record['product_name']}", 'fields': keys})
+        if not products:
+            return texts
+        
+        print(f"\nGenerating text for {len(products)} products in one batch...")
+        requests_before = batch_generator.requests
+        try:
+            for product_id, sections in batch_generator.generate(products).items():
+                texts[int(product_id)] = {SECTION_COLUMNS[key]: text for key, text in sections.items()}
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            print(f"✗ Error generating batch: {str(e)}")
+        print(f"Batch used {batch_generator.requests - requests_before} Gemini requests")
+        return texts
+    
+    def process_records(self, df: pd.DataFrame, records_to_process: List[Dict], journal: CheckpointJournal, delay: float = 0.0) -> None:
+        """Regenerate the given records in df, journaling the changed cells of each one
+        
+        When a service's circuit breaker opens, the fields that did arrive are kept and
+        the record is retried once the circuit closes; an exhausted daily quota ends
+        the run instead, leaving the remaining records for the next one.
+        """
+        self.updated_count = 0
+        self.total_fields_updated = 0
+        self.partial_count = 0
+        
+        batch_generator = None
+        batch_texts: Dict[int, Dict[str, str]] = {}
+        if self.batch_size > 1:
+            batch_generator = BatchContentGenerator(self.model, self.model_name, self.batch_size, self.rate_limiter, self.cache)
+        
+        metrics = get_run_metrics()
+        position = 0
+        while position < len(records_to_process):
+            i = position + 1
+            record = records_to_process[position]
             index = record['index']
             product_name = record['product_name']
             brand = record['brand']
             missing_fields = record['missing_fields']
             
+            if batch_generator and index not in batch_texts:
+                try:
+                    with metrics.stage('text_batch'):
+                        batch_texts.update(self.generate_text_batch(batch_generator, records_to_process[position:position + self.batch_size]))
+                except CircuitOpenError as e:
+                    if not wait_for_circuit(e):
+                        return
+                    continue
+            
             print(f"\nProcessing {i}/{len(records_to_process)}: {brand} {product_name} (Row: {index + 1})")
             print(f"Missing fields: {', '.join(missing_fields)}")
             
             try:
-                # Generate content for text fields
-                text_fields = [f for f in missing_fields if not f.startswith('Image') and f != 'Video']
-                generated_content = {}
+                # Generate text and search for missing media at the same time
+                keys = self.section_keys(missing_fields)
+                full_product_name = f"{brand} {product_name}"
+                stages = {}
+                if keys and not batch_generator:
+                    stages['text'] = lambda: self.section_generator.generate(full_product_name, keys)
+                if any(f.startswith('Image') for f in missing_fields):
+                    print(f"Searching for images for: {full_product_name}")
+                    stages['images'] = lambda: self.image_searcher.get_working_image_urls(f"{full_product_name} product high quality", 5)
+                if 'Video' in missing_fields:
+                    print(f"Searching for video for: {full_product_name}")
+                    stages['video'] = lambda: self.youtube_searcher.search_video(f"{full_product_name} review tutorial")
+                with metrics.product(full_product_name):
+                    outputs, stage_errors = run_stages(self.stage_executor, stages, self.stage_timeouts)
+                errors = stage_error_messages(stage_errors)
+                for stage, message in errors.items():
+                    print(f"✗ {stage} stage failed: {message}")
                 
-                if text_fields:
-                    prompt = self.create_content_prompt(product_name, brand, text_fields)
-                    response = self.model.generate_content(prompt)
-                    generated_content = self.parse_generated_content(response.text, text_fields)
-                
-                # Search for missing media
-                media_data = self.search_missing_media(product_name, brand, missing_fields)
+                if batch_generator:
+                    generated_content = batch_texts.pop(index, {})
+                else:
+                    generated_content = {SECTION_COLUMNS[key]: text for key, text in (outputs.get('text') or {}).items()}
+                media_data = {'images': outputs.get('images') or [], 'video': outputs.get('video')}
                 
-                # Update the dataframe
-                fields_updated = 0
+                # Collect the changed cells
+                updated_cells = {}
                 
                 # Update text fields
                 for field, content in generated_content.items():
                     if field in df.columns and content:
-                        df.at[index, field] = content
-                        fields_updated += 1
+                        updated_cells[field] = content
                 
                 # Update image fields
                 for img_idx, image_url in enumerate(media_data['images']):
                     image_field = f'Image {img_idx+1}'
                     if image_field in missing_fields and image_field in df.columns:
-                        df.at[index, image_field] = image_url
-                        fields_updated += 1
+                        updated_cells[image_field] = image_url
                 
                 # Update video field
                 if 'Video' in missing_fields and media_data['video'] and 'Video' in df.columns:
-                    df.at[index, 'Video'] = media_data['video']
-                    fields_updated += 1
+                    updated_cells['Video'] = media_data['video']
                 
+                fields_updated = len(updated_cells)
                 if fields_updated > 0:
-                    updated_count += 1
-                    total_fields_updated += fields_updated
-                    print(f"✓ Updated {fields_updated} fields")
+                    for field, value in updated_cells.items():
+                        df.at[index, field] = value
+                    self.updated_count += 1
+                    self.total_fields_updated += fields_updated
+                    if errors:
+                        self.partial_count += 1
+                    print(f"✓ Updated {fields_updated} fields{' (partial: ' + ', '.join(errors) + ' failed)' if errors else ''}")
                     
-                    # Save progress after each successful update
-                    df.to_csv(output_csv, index=False)
-                    print(f"✓ Progress saved to {output_csv}")
+                    # Remember what was filled so reruns never regenerate it
+                    models = {field: 'customsearch' if field.startswith('Image') else 'youtube' if field == 'Video' else self.model_name
+                              for field in updated_cells}
+                    with metrics.stage('csv_write'):
+                        self.ledger.record(record['id'], updated_cells, models)
+                        
+                        # Journal only the changed cells; the CSV is rewritten periodically
+                        journal.record(index, updated_cells, record['id'])
+                        compacted = journal.maybe_compact(df)
+                    if compacted:
+                        print(f"✓ Progress merged into {journal.csv_path}")
+                    else:
+                        print(f"✓ Progress journaled to {journal.journal_path}")
                 else:
                     print("✗ No content generated")
                 
-                # Add delay between requests
-                if i < len(records_to_process):
+                # A service is unavailable: retry what is still missing once it is back
+                circuit = find_circuit_error(stage_errors.values())
+                if circuit:
+                    if not wait_for_circuit(circuit):
+                        return
+                    record['missing_fields'] = [f for f in missing_fields if f not in updated_cells]
+                    continue
+                
+                # Optional extra pause; quotas are handled by the rate limiters
+                if delay > 0 and i < len(records_to_process):
                     print(f"Waiting {delay} seconds...")
-                    time.sleep(delay)
+                    metrics.sleep(delay, 'delay')
                 
             except Exception as e:
                 print(f"✗ Error processing record: {str(e)}")
-        
-        print("\n" + "=" * 60)
-        print(f"Regeneration complete!")
-        print(f"Records processed: {len(records_to_process)}")
-        print(f"Records updated: {updated_count}")
-        print(f"Total fields updated: {total_fields_updated}")
-        print(f"Final output saved to: {output_csv}")
-        print(f"Backup created: {backup_file}")
-        print(f"Note: Progress was automatically saved after each record.")
-        print(f"=" * 60)
+            position += 1
 
 def main():
     """Main function to run the missing content regeneration"""
+    parser = argparse.ArgumentParser(description="Regenerate missing content fields in the products CSV")
+    parser.add_argument('--csv', default='updated_products_20250624_131259.csv', help="Input CSV file")
+    parser.add_argument('--output', help="Output CSV file (default: auto-generated)")
+    parser.add_argument('--delay', type=float, default=0.0, help="Extra delay between products in seconds")
+    parser.add_argument('--ids', help="Comma-separated product IDs to process")
+    parser.add_argument('--rows', help=f"1-based row ranges to process, e.g. '196-197,221-226' (default: {DEFAULT_ROWS})")
+    parser.add_argument('--all', action='store_true', help="Process every record with missing data")
+    parser.add_argument('--start-from-id', help="Skip records before this product ID")
+    parser.add_argument('--ledger', default=DEFAULT_LEDGER_FILE, help="Progress ledger file")
+    parser.add_argument('--batch-size', type=int, default=1, help="Products per Gemini request for text fields (1 = one request per product)")
+    args = parser.parse_args()
+    
+    ids = [i.strip() for i in args.ids.split(',') if i.strip()] if args.ids else None
+    if args.rows:
+        rows = parse_row_ranges(args.rows)
+    elif args.all or ids is not None or args.start_from_id:
+        rows = None
+    else:
+        rows = parse_row_ranges(DEFAULT_ROWS)
     
     print("=" * 60)
     print("MISSING CONTENT REGENERATION SCRIPT")
@@ -371,26 +559,15 @@ def main():
     print()
     
     # CSV file to process
-    csv_file = 'updated_products_20250624_131259.csv'
+    csv_file = args.csv
     
     if not os.path.exists(csv_file):
         print(f"ERROR: CSV file '{csv_file}' not found!")
         return
     
-    # Get processing options
-    delay = input("Enter delay between requests in seconds (default: 2.0): ").strip()
-    if not delay:
-        delay = 2.0
-    else:
-        try:
-            delay = float(delay)
-        except ValueError:
-            print("Invalid delay value. Using default 2.0 seconds.")
-            delay = 2.0
-    
-    output_file = input("Enter output CSV filename (press Enter for auto-generated): ").strip()
-    if not output_file:
-        output_file = None
+    # API quotas are enforced by rate_limiter.py; the delay is only an optional extra pause
+    delay = args.delay
+    output_file = args.output
     
     print()
     print("=" * 60)
@@ -399,14 +576,19 @@ def main():
     print(f"Input CSV: {csv_file}")
     print(f"Delay between requests: {delay} seconds")
     print(f"Output file: {'Auto-generated' if output_file is None else output_file}")
+    print(f"Selection: {'IDs ' + args.ids if ids else 'rows ' + (args.rows or DEFAULT_ROWS) if rows is not None else 'all records'}"
+          f"{', starting from ID ' + args.start_from_id if args.start_from_id else ''}")
+    print(f"Progress ledger: {args.ledger}")
+    print(f"Products per Gemini request: {args.batch_size}")
     print()
     
     # Create regenerator instance
-    regenerator = MissingContentRegenerator(GEMINI_API_KEY, GOOGLE_API_KEY, SEARCH_ENGINE_ID)
+    regenerator = MissingContentRegenerator(GEMINI_API_KEY, GOOGLE_API_KEY, SEARCH_ENGINE_ID, ledger_file=args.ledger, batch_size=args.batch_size)
     
     try:
         # Process the CSV file
-        regenerator.regenerate_missing_content(csv_file, output_csv=output_file, delay=delay)
+        regenerator.regenerate_missing_content(csv_file, output_csv=output_file, delay=delay, start_from_id=args.start_from_id,
+                                               ids=ids, rows=rows)
         
         print()
         print("=" * 60)
@@ -17,12 +17,19 @@ from googleapiclient.discovery import build
 from datetime import datetime
 
 # Import the existing classes
+from catalogue_store import DEFAULT_CSV_FILE
 from gemini_csv_processor import GeminiCSVProcessor
+from instrumentation import get_run_metrics, report_path
+from name_matching import load_sheet_index, match_report_path, summarize_matches
+from pipeline_stages import format_stage_errors
+from results_jsonl import JSONLResultsWriter
 
 class ProductListRegenerator:
-    def __init__(self, gemini_api_key: str, google_api_key: str, search_engine_id: str):
-        """Initialize the product list regenerator"""
+    def __init__(self, gemini_api_key: str, google_api_key: str, search_engine_id: str, csv_file: str = DEFAULT_CSV_FILE):
+        """Initialize the product list regenerator (listed names are matched against csv_file)"""
         self.processor = GeminiCSVProcessor(gemini_api_key, google_api_key, search_engine_id)
+        self.csv_file = csv_file
+        self.jsonl_writer = None
         
     def get_product_list(self) -> List[str]:
         """Return the specific product list to regenerate"""
@@ -267,14 +274,28 @@ class ProductListRegenerator:
             "Xerjoff Oud Stars Alexandria II Anniversary (U) Parfum 100ml"
         ]
     
-    def process_product_list(self, output_file: str = None, delay: float = 2.0) -> List[Dict]:
-        """Process the specific product list"""
+    def resolve_product_names(self, products: List[str], output_file: str) -> List[str]:
+        """Replace listed names with the sheet's spelling, so the results merge back onto the right rows"""
+        if not os.path.exists(self.csv_file):
+            print(f"Sheet {self.csv_file} not found; using the product names as listed")
+            return products
+        report = load_sheet_index(self.csv_file).match_all(products)
+        summarize_matches(report)
+        report_file = match_report_path(output_file)
+        report.to_csv(report_file, index=False)
+        print(f"Name match report saved to: {report_file}")
+        return [row.match if row.accepted else row.query for row in report.itertuples()]
+    
+    def process_product_list(self, output_file: str = None, delay: float = 0.0) -> List[Dict]:
+        """Process the specific product list (API quotas are enforced by the shared rate limiters)"""
         if output_file is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             output_file = f'regenerated_products_results_{timestamp}.txt'
         
-        products = self.get_product_list()
+        products = self.resolve_product_names(self.get_product_list(), output_file)
         results = []
+        metrics = get_run_metrics()
+        metrics.start_run('process_product_list')
         
         print(f"Starting to process {len(products)} products...")
         print(f"Output file: {output_file}")
@@ -287,29 +308,39 @@ class ProductListRegenerator:
             f.write(f"Total products: {len(products)}\n")
             f.write("=" * 60 + "\n\n")
         
+        # Structured copy of the results, one JSON record per product
+        jsonl_file = os.path.splitext(output_file)[0] + '.jsonl'
+        self.jsonl_writer = JSONLResultsWriter(jsonl_file, mode='w')
+        print(f"Structured results: {jsonl_file}")
+        
         for i, product in enumerate(products, 1):
             print(f"\nProcessing {i}/{len(products)}: {product}")
             
             try:
-                # Process the product
-                result = self.processor.process_product(product)
+                # Process the product (again, once an open circuit breaker closes)
+                result = self.processor.settle_circuit(product, self.processor.process_product(product))
+                if result is None:
+                    print(f"Stopped before product {i}; the remaining products were not processed")
+                    break
                 results.append(result)
                 
                 # Write result to file immediately
-                self.write_result_to_file(output_file, i, result)
+                with metrics.stage('write'):
+                    self.write_result_to_file(output_file, i, result)
                 
                 # Status update
-                if result['status'] == 'success':
+                if result['status'] != 'error':
                     image_count = len(result['images'])
                     video_status = "✓" if result['video'] else "✗"
-                    print(f"✓ Success - {image_count} images, video: {video_status}")
+                    label = "Success" if result['status'] == 'success' else f"Partial ({', '.join(result['errors'])} failed)"
+                    print(f"✓ {label} - {image_count} images, video: {video_status}")
                 else:
                     print(f"✗ Error: {result['description']}")
                 
-                # Add delay between requests
-                if i < len(products):  # Don't delay after the last product
+                # Optional extra pause; quotas are handled by the rate limiters
+                if delay > 0 and i < len(products):  # Don't delay after the last product
                     print(f"Waiting {delay} seconds...")
-                    time.sleep(delay)
+                    metrics.sleep(delay, 'delay')
                     
             except Exception as e:
                 error_result = {
@@ -325,21 +356,30 @@ class ProductListRegenerator:
         
         # Write summary
         self.write_summary_to_file(output_file, results)
+        self.jsonl_writer.close()
+        self.jsonl_writer = None
+        self.processor.close()
         
         print("\n" + "=" * 60)
         print(f"Processing complete! Results saved to: {output_file}")
         self.print_summary(results)
+        self.processor.cache.print_hit_rates()
+        metrics.write_report(report_path(output_file))
         
         return results
     
     def write_result_to_file(self, output_file: str, product_number: int, result: Dict):
-        """Write a single result to the output file"""
+        """Write a single result to the output file (and its JSONL copy, if open)"""
+        if self.jsonl_writer:
+            self.jsonl_writer.write_result(product_number, result)
+        
         with open(output_file, 'a', encoding='utf-8') as f:
             f.write(f"PRODUCT {product_number}: {result['product']}\n")
             f.write(f"Status: {result['status']}\n")
             f.write(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
             
-            if result['status'] == 'success':
+            # Partial results are written like successful ones, followed by the failed stages
+            if result['status'] != 'error':
                 # Write description
                 f.write("DESCRIPTION:\n")
                 f.write(result['description'])
@@ -361,6 +401,9 @@ class ProductListRegenerator:
                 else:
                     f.write("No video link found.\n")
                 f.write("\n")
+                
+                if result.get('errors'):
+                    f.write(f"Stage errors: {format_stage_errors(result['errors'])}\n\n")
             else:
                 f.write(f"ERROR: {result['description']}\n\n")
             
@@ -369,9 +412,10 @@ class ProductListRegenerator:
     def write_summary_to_file(self, output_file: str, results: List[Dict]):
         """Write processing summary to the output file"""
         successful = len([r for r in results if r['status'] == 'success'])
+        partial = len([r for r in results if r['status'] == 'partial'])
         failed = len([r for r in results if r['status'] == 'error'])
-        total_images = sum(len(r['images']) for r in results if r['status'] == 'success')
-        total_videos = len([r for r in results if r['status'] == 'success' and r['video']])
+        total_images = sum(len(r['images']) for r in results if r['status'] != 'error')
+        total_videos = len([r for r in results if r['status'] != 'error' and r['video']])
         
         with open(output_file, 'a', encoding='utf-8') as f:
             f.write("\n" + "=" * 60 + "\n")
@@ -379,6 +423,7 @@ class ProductListRegenerator:
             f.write("=" * 60 + "\n")
             f.write(f"Total products processed: {len(results)}\n")
             f.write(f"Successful: {successful}\n")
+            f.write(f"Partial (some stages failed): {partial}\n")
             f.write(f"Failed: {failed}\n")
             f.write(f"Total images found: {total_images}\n")
             f.write(f"Total videos found: {total_videos}\n")
@@ -387,12 +432,14 @@ class ProductListRegenerator:
     def print_summary(self, results: List[Dict]):
         """Print processing summary to console"""
         successful = len([r for r in results if r['status'] == 'success'])
+        partial = len([r for r in results if r['status'] == 'partial'])
         failed = len([r for r in results if r['status'] == 'error'])
-        total_images = sum(len(r['images']) for r in results if r['status'] == 'success')
-        total_videos = len([r for r in results if r['status'] == 'success' and r['video']])
+        total_images = sum(len(r['images']) for r in results if r['status'] != 'error')
+        total_videos = len([r for r in results if r['status'] != 'error' and r['video']])
         
         print(f"Total products processed: {len(results)}")
         print(f"Successful: {successful}")
+        print(f"Partial (some stages failed): {partial}")
         print(f"Failed: {failed}")
         print(f"Total images found: {total_images}")
         print(f"Total videos found: {total_videos}")
@@ -418,7 +465,7 @@ def main():
     
     # Process the product list
     try:
-        results = regenerator.process_product_list(delay=2.0)
+        results = regenerator.process_product_list()
         
         print(f"\nRegeneration complete!")
         print(f"Check the output file for detailed results.")
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Shared retry and circuit-breaker layer for the Gemini, Custom Search and YouTube calls.
+Errors are classified as transient (5xx, timeouts, connection resets), rate limited
+(429 / per-minute quota), daily quota exhausted, or permanent. Transient and rate
+limited calls are retried with jittered exponential backoff. Repeated failures open
+a short per-service circuit, and an exhausted daily quota opens it until the quota
+resets, so a run can pause or stop cleanly instead of writing failed rows.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+import requests
+
+from instrumentation import get_run_metrics
+from rate_limiter import QUOTA_TIMEZONE, DailyQuotaExceeded
+
+TRANSIENT = 'transient'
+RATE_LIMITED = 'rate_limited'
+QUOTA_EXHAUSTED = 'quota_exhausted'
+PERMANENT = 'permanent'
+
+DAILY_QUOTA_MARKERS = ('dailylimitexceeded', 'per day', 'perday')
+RATE_LIMIT_MARKERS = ('ratelimitexceeded', 'userratelimitexceeded', 'per minute', 'perminute', 'resource_exhausted', 'quotaexceeded', 'too many requests')
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit is open"""
+    def __init__(self, service: str, reopen_at: float, daily: bool):
+        kind = "daily quota exhausted" if daily else "too many consecutive failures"
+        super().__init__(f"{service} circuit open ({kind}); retry in {max(0.0, reopen_at - time.time()):.0f}s")
+        self.service = service
+        self.reopen_at = reopen_at
+        self.daily = daily
+
+    def retry_after(self) -> float:
+        """Seconds until the service may be called again"""
+        return max(0.0, self.reopen_at - time.time())
+
+def _status_code(error: Exception) -> Optional[int]:
+    """HTTP status of an API error from googleapiclient, google.api_core, requests or aiohttp"""
+    for attribute in ('status_code', 'code', 'status'):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, 'response', None)
+    if response is not None and isinstance(getattr(response, 'status_code', None), int):
+        return response.status_code
+    return None
+
+def _error_text(error: Exception) -> str:
+    """Lower-cased message plus any response body, where quota reasons are spelled out"""
+    parts = [str(error)]
+    content = getattr(error, 'content', None)
+    if isinstance(content, bytes):
+        parts.append(content.decode('utf-8', errors='replace'))
+    response = getattr(error, 'response', None)
+    if response is not None and isinstance(getattr(response, 'text', None), str):
+        parts.append(response.text)
+    return ' '.join(parts).lower()
+
+def classify_error(error: Exception) -> str:
+    """Classify an API error as TRANSIENT, RATE_LIMITED, QUOTA_EXHAUSTED or PERMANENT"""
+    if isinstance(error, DailyQuotaExceeded):
+        return QUOTA_EXHAUSTED
+    if isinstance(error, CircuitOpenError):
+        return PERMANENT
+
+    status = _status_code(error)
+    text = _error_text(error)
+    if status in (429, 403) or (status is None and 'resource_exhausted' in text):
+        if any(marker in text for marker in DAILY_QUOTA_MARKERS):
+            return QUOTA_EXHAUSTED
+        if status == 429 or any(marker in text for marker in RATE_LIMIT_MARKERS):
+            return RATE_LIMITED
+        return PERMANENT
+    if status is not None and (status >= 500 or status == 408):
+        return TRANSIENT
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return TRANSIENT
+    if status is None and isinstance(error, OSError):
+        return TRANSIENT
+    return PERMANENT
+
+def seconds_until_quota_reset(now: Optional[datetime] = None) -> float:
+    """Seconds until the next midnight Pacific time, when Google's daily quotas reset"""
+    now = now or datetime.now(QUOTA_TIMEZONE)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
+class CircuitBreaker:
+    def __init__(self, service: str, failure_threshold: int = 5, cooldown: float = 60):
+        """Opens for cooldown seconds after failure_threshold consecutive failures, or until the daily quota resets"""
+        self.service = service
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open_until = 0.0
+        self._daily = False
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError if the service must not be called yet"""
+        with self._lock:
+            if time.time() < self._open_until:
+                raise CircuitOpenError(self.service, self._open_until, self._daily)
+            # After the cooldown the circuit is half-open: the next call decides
+            self._daily = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self, kind: str) -> None:
+        with self._lock:
+            if kind == QUOTA_EXHAUSTED:
+                self._open_until = time.time() + seconds_until_quota_reset()
+                self._daily = True
+                print(f"✗ {self.service}: daily quota exhausted, circuit open until the quota resets")
+                return
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._open_until = time.time() + self.cooldown
+                self._failures = 0
+                print(f"✗ {self.service}: {self.failure_threshold} consecutive failures, circuit open for {self.cooldown:g}s")
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return time.time() < self._open_until
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(service: str) -> CircuitBreaker:
+    """Return the process-wide circuit breaker for a service"""
+    with _breakers_lock:
+        if service not in _breakers:
+            _breakers[service] = CircuitBreaker(service)
+        return _breakers[service]
+
+def backoff_delay(attempt: int, kind: str, base_delay: float = 1.0, max_delay: float = 60.0) -> float:
+    """Full-jitter exponential backoff; rate limited calls start from a longer base"""
+    base = base_delay * (5 if kind == RATE_LIMITED else 1)
+    return random.uniform(0, min(max_delay, base * (2 ** attempt)))
+
+def call_with_retry(service: str, function: Callable[[], Any], max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 60.0) -> Any:
+    """Call function, retrying transient and rate limited errors with backoff
+
+    Raises CircuitOpenError if the service's circuit is (or becomes) open, or the
+    last error once the attempts are used up or the error is permanent.
+    """
+    breaker = get_circuit_breaker(service)
+    for attempt in range(max_attempts):
+        breaker.before_call()
+        try:
+            result = function()
+        except Exception as e:
+            kind = classify_error(e)
+            if kind == PERMANENT:
+                raise
+            breaker.record_failure(kind)
+            if kind == QUOTA_EXHAUSTED:
+                breaker.before_call()
+                raise
+            if attempt + 1 >= max_attempts:
+                raise
+            delay = backoff_delay(attempt, kind, base_delay, max_delay)
+            print(f"{service} call failed ({kind}: {str(e)[:100]}); retry {attempt + 1}/{max_attempts - 1} in {delay:.1f}s")
+            get_run_metrics().sleep(delay, f"backoff:{service}")
+        else:
+            breaker.record_success()
+            return result
+
+async def call_with_retry_async(service: str, function: Callable[[], Awaitable], max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 60.0) -> Any:
+    """Coroutine version of call_with_retry; function returns a new awaitable per attempt"""
+    breaker = get_circuit_breaker(service)
+    for attempt in range(max_attempts):
+        breaker.before_call()
+        try:
+            result = await function()
+        except Exception as e:
+            kind = classify_error(e)
+            if kind == PERMANENT:
+                raise
+            breaker.record_failure(kind)
+            if kind == QUOTA_EXHAUSTED:
+                breaker.before_call()
+                raise
+            if attempt + 1 >= max_attempts:
+                raise
+            delay = backoff_delay(attempt, kind, base_delay, max_delay)
+            print(f"{service} call failed ({kind}: {str(e)[:100]}); retry {attempt + 1}/{max_attempts - 1} in {delay:.1f}s")
+            await get_run_metrics().sleep_async(delay, f"backoff:{service}")
+        else:
+            breaker.record_success()
+            return result
+
+def find_circuit_error(errors: Iterable[Exception]) -> Optional[CircuitOpenError]:
+    """The first CircuitOpenError among stage errors, preferring daily ones"""
+    circuit_errors = [e for e in errors if isinstance(e, CircuitOpenError)]
+    daily = [e for e in circuit_errors if e.daily]
+    return (daily or circuit_errors or [None])[0]
+
+def wait_for_circuit(error: CircuitOpenError) -> bool:
+    """Sleep until a short-lived circuit closes; returns False (stop the run) for a daily quota"""
+    if error.daily:
+        print(f"\n✗ Daily quota exhausted for {error.service}; stopping. Rerun after the quota resets to continue.")
+        return False
+    if error.retry_after() > 0:
+        print(f"\n{error.service} circuit open; pausing {error.retry_after():.0f}s before retrying")
+        get_run_metrics().sleep(error.retry_after(), f"circuit:{error.service}")
+    return True
+
+async def wait_for_circuit_async(error: CircuitOpenError) -> bool:
+    """Coroutine version of wait_for_circuit"""
+    if error.daily:
+        print(f"\n✗ Daily quota exhausted for {error.service}; stopping. Rerun after the quota resets to continue.")
+        return False
+    if error.retry_after() > 0:
+        print(f"\n{error.service} circuit open; pausing {error.retry_after():.0f}s before retrying")
+        await get_run_metrics().sleep_async(error.retry_after(), f"circuit:{error.service}")
+    return True
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Persistent on-disk cache for Gemini, Custom Search and YouTube responses.
+Reruns of the processing scripts read through this cache so products that were
+already answered do not spend API quota again.
+
+Usage:
+    python response_cache.py stats
+    python response_cache.py list [--service gemini] [--limit 20]
+    python response_cache.py purge [--service youtube] [--expired]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_CACHE_FILE = 'api_response_cache.sqlite'
+DAY = 24 * 60 * 60
+
+# How long cached answers stay valid per service (seconds)
+DEFAULT_TTLS = {
+    'gemini': 180 * DAY,
+    'customsearch': 30 * DAY,
+    'youtube': 30 * DAY,
+}
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+class ResponseCache:
+    def __init__(self, path: str = DEFAULT_CACHE_FILE, ttls: Optional[Dict[str, int]] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        """Open (or create) the SQLite cache file"""
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_bytes = max_bytes
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                service TEXT NOT NULL,
+                query TEXT NOT NULL,
+                model TEXT,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_access ON responses(last_access)')
+        self._conn.commit()
+        # Running size of the stored values, so writes do not have to scan the table
+        self._total_bytes = self._stored_bytes()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Case- and whitespace-insensitive form of a query"""
+        return ' '.join(str(query).lower().split())
+
+    def make_key(self, service: str, query: str, model: Optional[str] = None, prompt: Optional[str] = None) -> str:
+        """Cache key from (service, normalized query, model name, prompt hash)"""
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest() if prompt else ''
+        raw = json.dumps([service, self.normalize_query(query), model or '', prompt_hash])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, service: str, query: str, model: Optional[str] = None, prompt: Optional[str] = None) -> Tuple[bool, Any]:
+        """Look up a cached response. Returns (found, value)."""
+        key = self.make_key(service, query, model, prompt)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT value, expires_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is not None and (row[1] is None or row[1] > now):
+                self._conn.execute('UPDATE responses SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?', (now, key))
+                self._conn.commit()
+                self.hits[service] = self.hits.get(service, 0) + 1
+                return True, json.loads(row[0])
+            self.misses[service] = self.misses.get(service, 0) + 1
+            return False, None
+
+    def set(self, service: str, query: str, value: Any, model: Optional[str] = None, prompt: Optional[str] = None) -> None:
+        """Store a response and evict old entries if the cache grew too large"""
+        key = self.make_key(service, query, model, prompt)
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        ttl = self.ttls.get(service)
+        expires_at = now + ttl if ttl else None
+        size = len(payload.encode('utf-8'))
+        with self._lock:
+            replaced = self._conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, service, query, model, value, size, created_at, expires_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, service, self.normalize_query(query), model, payload, size, now, expires_at, now)
+            )
+            self._total_bytes += size - (replaced[0] if replaced else 0)
+            self._evict_if_needed()
+            self._conn.commit()
+
+    def get_or_compute(self, service: str, query: str, compute: Callable[[], Any], model: Optional[str] = None, prompt: Optional[str] = None) -> Any:
+        """Return the cached response, or call compute() and cache what it returns
+
+        Exceptions from compute() propagate and nothing is cached for them.
+        """
+        found, value = self.get(service, query, model, prompt)
+        if found:
+            return value
+        value = compute()
+        self.set(service, query, value, model, prompt)
+        return value
+
+    def _stored_bytes(self) -> int:
+        return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def _evict_if_needed(self) -> None:
+        """Drop expired entries, then least recently used ones, until under max_bytes
+
+        Only the running total is checked per write; the table is summed again
+        (which also picks up writes from other processes) once it passes max_bytes.
+        """
+        if self._total_bytes <= self.max_bytes:
+            return
+        self._conn.execute('DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?', (time.time(),))
+        total = self._total_bytes = self._stored_bytes()
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        to_delete = []
+        for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY last_access ASC'):
+            if total - freed <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            freed += size
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', to_delete)
+        self._total_bytes = total - freed
+
+    def purge(self, service: Optional[str] = None, expired_only: bool = False) -> int:
+        """Delete entries (optionally only for one service or only expired ones). Returns the number removed."""
+        conditions = []
+        params: List[Any] = []
+        if service:
+            conditions.append('service = ?')
+            params.append(service)
+        if expired_only:
+            conditions.append('expires_at IS NOT NULL AND expires_at <= ?')
+            params.append(time.time())
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        with self._lock:
+            removed = self._conn.execute(f'DELETE FROM responses{where}', params).rowcount
+            self._conn.commit()
+            self._total_bytes = self._stored_bytes()
+        return removed
+
+    def stats(self) -> Dict[str, Dict]:
+        """Stored entries per service plus this process's hit/miss counters"""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT service, COUNT(*), SUM(size), SUM(hit_count), '
+                'SUM(CASE WHEN expires_at IS NOT NULL AND expires_at <= ? THEN 1 ELSE 0 END) '
+                'FROM responses GROUP BY service', (now,)
+            ).fetchall()
+        stats = {}
+        for service, count, size, stored_hits, expired in rows:
+            stats[service] = {'entries': count, 'bytes': size or 0, 'expired': expired or 0, 'lifetime_hits': stored_hits or 0}
+        for service in set(self.hits) | set(self.misses):
+            service_stats = stats.setdefault(service, {'entries': 0, 'bytes': 0, 'expired': 0, 'lifetime_hits': 0})
+            hits = self.hits.get(service, 0)
+            misses = self.misses.get(service, 0)
+            service_stats['hits'] = hits
+            service_stats['misses'] = misses
+            service_stats['hit_rate'] = hits / (hits + misses) if hits + misses else 0.0
+        return stats
+
+    def print_hit_rates(self) -> None:
+        """Print this process's cache hit rate per service"""
+        for service in sorted(set(self.hits) | set(self.misses)):
+            hits = self.hits.get(service, 0)
+            total = hits + self.misses.get(service, 0)
+            print(f"Response cache [{service}]: {hits}/{total} hits ({(hits / total) * 100 if total else 0:.1f}%)")
+
+    def list_entries(self, service: Optional[str] = None, limit: int = 20) -> List[Tuple]:
+        """Most recently used entries as (service, query, model, size, created_at, hit_count)"""
+        sql = 'SELECT service, query, model, size, created_at, hit_count FROM responses'
+        params: List[Any] = []
+        if service:
+            sql += ' WHERE service = ?'
+            params.append(service)
+        sql += ' ORDER BY last_access DESC LIMIT ?'
+        params.append(limit)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+_shared_cache: Optional[ResponseCache] = None
+_shared_cache_lock = threading.Lock()
+
+def get_shared_cache() -> ResponseCache:
+    """Return the process-wide response cache (file set by API_CACHE_FILE, default api_response_cache.sqlite)"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache(os.getenv('API_CACHE_FILE', DEFAULT_CACHE_FILE))
+        return _shared_cache
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or purge the API response cache")
+    parser.add_argument('--file', default=os.getenv('API_CACHE_FILE', DEFAULT_CACHE_FILE), help="Cache file")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help="Show entries and size per service")
+    list_parser = subparsers.add_parser('list', help="List recently used entries")
+    list_parser.add_argument('--service')
+    list_parser.add_argument('--limit', type=int, default=20)
+    purge_parser = subparsers.add_parser('purge', help="Delete cached entries")
+    purge_parser.add_argument('--service')
+    purge_parser.add_argument('--expired', action='store_true', help="Only delete expired entries")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.file):
+        print(f"Cache file not found: {args.file}")
+        return
+
+    cache = ResponseCache(args.file)
+    if args.command == 'stats':
+        stats = cache.stats()
+        if not stats:
+            print("Cache is empty")
+        for service, service_stats in sorted(stats.items()):
+            print(f"{service}: {service_stats['entries']} entries, {service_stats['bytes'] / 1024:.1f} KB, "
+                  f"{service_stats['expired']} expired, {service_stats['lifetime_hits']} hits served")
+    elif args.command == 'list':
+        for service, query, model, size, created_at, hit_count in cache.list_entries(args.service, args.limit):
+            created = time.strftime('%Y-%m-%d %H:%M', time.localtime(created_at))
+            print(f"[{service}] {query[:70]} (model: {model or '-'}, {size} bytes, created {created}, {hit_count} hits)")
+    elif args.command == 'purge':
+        removed = cache.purge(args.service, args.expired)
+        print(f"Removed {removed} cached responses")
+    cache.close()
+
+if __name__ == "__main__":
+    main()
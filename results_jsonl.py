@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Append-only JSON Lines results format.
+One record per product (description sections, images, video, status, timing),
+written alongside the human-readable text log so the CSV updater can load
+results without regex parsing and resume only needs to read the file's tail.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+from results_parser import split_description_sections
+
+def build_record(product_number: int, result: Dict) -> Dict:
+    """Turn a process_product result into a JSONL record"""
+    succeeded = result['status'] != 'error'
+    description = result.get('description') or ''
+    return {
+        'number': product_number,
+        'product': result['product'],
+        'status': result['status'],
+        'description': description if succeeded else '',
+        'sections': result.get('sections') or (split_description_sections(description) if succeeded else {}),
+        'images': result.get('images') or [],
+        'video': result.get('video'),
+        'error': '' if succeeded else description,
+        'errors': result.get('errors') or {},
+        'elapsed_seconds': result.get('elapsed'),
+        'timestamp': datetime.now().isoformat(timespec='seconds')
+    }
+
+def record_to_result(record: Dict) -> Dict:
+    """Turn a JSONL record back into the process_product result it was built from"""
+    failed = record['status'] == 'error'
+    return {
+        'product': record['product'],
+        'status': record['status'],
+        'description': record.get('error', '') if failed else record.get('description', ''),
+        'sections': record.get('sections') or {},
+        'images': record.get('images') or [],
+        'video': record.get('video'),
+        'errors': record.get('errors') or {},
+        'elapsed': record.get('elapsed_seconds')
+    }
+
+class JSONLResultsWriter:
+    def __init__(self, path: str, mode: str = 'a'):
+        """Open a JSONL results file for appending (mode='w' starts a fresh file)"""
+        self.path = path
+        self._lock = threading.Lock()
+
+        # A crash can leave a torn last line; terminate it so the next record starts on its own line
+        needs_newline = False
+        if mode == 'a' and os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+
+        self._file = open(path, mode, encoding='utf-8')
+        if needs_newline:
+            self._file.write('\n')
+            self._file.flush()
+
+    def write(self, record: Dict) -> None:
+        """Append one record as a single line and force it to disk"""
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def write_result(self, product_number: int, result: Dict) -> None:
+        self.write(build_record(product_number, result))
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def iter_jsonl_records(path: str) -> Iterator[Dict]:
+    """Yield records from a JSONL results file, skipping torn or malformed lines"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+def read_last_record(path: str, chunk_size: int = 8192) -> Optional[Dict]:
+    """Return the last complete record by reading backwards from the end of the file"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        buffer = b''
+        while position > 0:
+            read_size = min(chunk_size, position)
+            position -= read_size
+            f.seek(position)
+            buffer = f.read(read_size) + buffer
+            lines = buffer.split(b'\n')
+            # The first piece may be a partial line unless we reached the start of the file
+            candidates = lines if position == 0 else lines[1:]
+            for line in reversed(candidates):
+                if not line.strip():
+                    continue
+                try:
+                    return json.loads(line.decode('utf-8'))
+                except ValueError:
+                    continue
+            buffer = lines[0] if position > 0 else b''
+    return None
+
+def last_product_number(path: str) -> int:
+    """Number of the last product written to a JSONL results file (0 if none)"""
+    record = read_last_record(path)
+    return record['number'] if record else 0
+
+def load_results_jsonl(path: str) -> Dict[str, Dict]:
+    """Load successful results keyed by product name, in the shape CSVLinkUpdater expects"""
+    products_data = {}
+    for record in iter_jsonl_records(path):
+        if record.get('status') == 'error':
+            continue
+        images = record.get('images') or []
+        sections = record.get('sections') or {}
+        # Like the text parser, skip products that produced no content at all
+        if not (images or record.get('video') or any(sections.values())):
+            continue
+        products_data[str(record['product']).strip()] = {
+            'images': images,
+            'video': record.get('video'),
+            'marketing_content': sections
+        }
+    return products_data
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Streaming parser for the Gemini results text files.
+Reads the file line by line and yields one product record at a time, and keeps a
+sidecar offset index (product number -> byte offset) so resuming and lookups do
+not have to rescan multi-megabyte result logs.
+"""
+
+import json
+import os
+import re
+from typing import Dict, Iterable, Iterator, List, Optional
+
+SEPARATOR = '=' * 60
+PRODUCT_LINE = re.compile(r'^PRODUCT (\d+): (.+)$')
+IMAGE_LINE = re.compile(r'^Image \d+: (https?://\S+)')
+VIDEO_LINE = re.compile(r'^Video: (https?://\S+)')
+SECTION_HEADING = re.compile(r'^\*\*([1-6])\.\s*(.*)$')
+
+BLOCK_HEADINGS = {
+    'DESCRIPTION:': 'description',
+    'WORKING IMAGE LINKS:': 'images',
+    'VIDEO LINK:': 'video',
+    'ERROR:': 'error'
+}
+
+# Marketing sections of a description: number -> (key, heading label)
+DESCRIPTION_SECTIONS = {
+    1: ('headline', 'Captivating Headline or Tagline'),
+    2: ('sensory', 'Sensory Introduction'),
+    3: ('features', 'Key Features or Ingredients'),
+    4: ('how_to_use', 'How to Use'),
+    5: ('emotional', 'Emotional or Lifestyle Hook'),
+    6: ('tech_specs', 'Tech Specs or Product Facts')
+}
+
+def split_description_sections(description: str) -> Dict[str, str]:
+    """Split a Gemini description into its six marketing sections
+
+    A section starts at a '**N. <heading>' line and runs until the heading of the
+    next section (section 6 ends at the next bold line). Whitespace inside a
+    section is collapsed to single spaces.
+    """
+    sections = {key: [] for key, _ in DESCRIPTION_SECTIONS.values()}
+    current = None
+    for line in description.splitlines():
+        match = SECTION_HEADING.match(line)
+        if match:
+            number = int(match.group(1))
+            key, label = DESCRIPTION_SECTIONS[number]
+            rest = match.group(2)
+            if rest.lower().startswith(label.lower()):
+                # Content may follow the heading on the same line, after the colon
+                after_label = rest[len(label):]
+                if ':' in after_label:
+                    after_label = after_label.split(':', 1)[1]
+                sections[key] = [after_label.lstrip('*')]
+                current = number
+                continue
+            if current is not None and number == current + 1:
+                # An unrecognised heading for the next section still ends this one
+                current = None
+                continue
+        if current == 6 and line.startswith('**'):
+            current = None
+        if current is not None:
+            sections[DESCRIPTION_SECTIONS[current][0]].append(line)
+    return {key: ' '.join(' '.join(lines).split()) for key, lines in sections.items()}
+
+def parse_record_lines(lines: Iterable[str]) -> Dict:
+    """Parse the lines of one PRODUCT block into a record"""
+    record = {
+        'number': None,
+        'product': None,
+        'status': None,
+        'description': '',
+        'images': [],
+        'video': None,
+        'error': ''
+    }
+    block = None
+    description_lines: List[str] = []
+    error_lines: List[str] = []
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if record['number'] is None:
+            match = PRODUCT_LINE.match(line)
+            if match:
+                record['number'] = int(match.group(1))
+                record['product'] = match.group(2).strip()
+                continue
+
+        if line in BLOCK_HEADINGS:
+            block = BLOCK_HEADINGS[line]
+            continue
+        if block is None and line.startswith('ERROR: '):
+            # Regeneration logs put the error message on the heading line
+            block = 'error'
+            error_lines.append(line[len('ERROR: '):])
+            continue
+
+        if block is None:
+            if line.startswith('Status: '):
+                record['status'] = line[len('Status: '):].strip()
+        elif block == 'description':
+            description_lines.append(line)
+        elif block == 'images':
+            match = IMAGE_LINE.match(line)
+            if match:
+                record['images'].append(match.group(1))
+        elif block == 'video':
+            match = VIDEO_LINE.match(line)
+            if match and record['video'] is None:
+                record['video'] = match.group(1)
+        elif block == 'error':
+            error_lines.append(line)
+
+    record['description'] = '\n'.join(description_lines).strip()
+    record['error'] = '\n'.join(error_lines).strip()
+    record['marketing_content'] = split_description_sections(record['description'])
+    return record
+
+def iter_product_records(results_file: str, start_offset: int = 0) -> Iterator[Dict]:
+    """Yield product records from a results file one at a time
+
+    Each record carries the byte offset of its PRODUCT line under 'offset'.
+    """
+    with open(results_file, 'rb') as f:
+        f.seek(start_offset)
+        offset = start_offset
+        current_lines: List[str] = []
+        current_offset = None
+
+        for raw_line in f:
+            line = raw_line.decode('utf-8', errors='replace').rstrip('\r\n')
+            if PRODUCT_LINE.match(line) or line == SEPARATOR:
+                if current_lines:
+                    record = parse_record_lines(current_lines)
+                    record['offset'] = current_offset
+                    yield record
+                current_lines = []
+                current_offset = None
+                if line != SEPARATOR:
+                    current_lines.append(line)
+                    current_offset = offset
+            elif current_lines:
+                current_lines.append(line)
+            offset += len(raw_line)
+
+        if current_lines:
+            record = parse_record_lines(current_lines)
+            record['offset'] = current_offset
+            yield record
+
+class ResultsIndex:
+    def __init__(self, results_file: str):
+        """Offset index for a results file, stored next to it as <file>.idx.json"""
+        self.results_file = results_file
+        self.index_file = results_file + '.idx.json'
+        self.offsets: Dict[int, int] = {}
+        self.products: Dict[int, str] = {}
+        self.indexed_size = 0
+        self.resume_offset = 0
+        self.tail_check = ''
+
+    def _read_tail_check(self, size: int) -> str:
+        """Last bytes before a given size, used to detect rewritten files"""
+        with open(self.results_file, 'rb') as f:
+            f.seek(max(0, size - 64))
+            return f.read(min(size, 64)).hex()
+
+    def _load(self) -> bool:
+        """Load the sidecar index; returns False if it is missing or stale"""
+        if not os.path.exists(self.index_file):
+            return False
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.offsets = {int(k): v for k, v in data['offsets'].items()}
+            self.products = {int(k): v for k, v in data['products'].items()}
+            self.indexed_size = data['indexed_size']
+            self.resume_offset = data['resume_offset']
+            self.tail_check = data['tail_check']
+        except (ValueError, KeyError, OSError):
+            return False
+
+        size = os.path.getsize(self.results_file)
+        # The file must have grown (or stayed the same) from the indexed content
+        return size >= self.indexed_size and self._read_tail_check(self.indexed_size) == self.tail_check
+
+    def _save(self) -> None:
+        data = {
+            'indexed_size': self.indexed_size,
+            'resume_offset': self.resume_offset,
+            'tail_check': self.tail_check,
+            'offsets': self.offsets,
+            'products': self.products
+        }
+        tmp_file = self.index_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_file, self.index_file)
+
+    def refresh(self) -> 'ResultsIndex':
+        """Bring the index up to date, scanning only the part of the file added since the last refresh"""
+        if not os.path.exists(self.results_file):
+            self.offsets, self.products = {}, {}
+            self.indexed_size = self.resume_offset = 0
+            return self
+
+        if not self._load():
+            self.offsets, self.products = {}, {}
+            self.indexed_size = self.resume_offset = 0
+
+        size = os.path.getsize(self.results_file)
+        if size == self.indexed_size and self.offsets:
+            return self
+
+        # Rescan from the start of the last indexed product, which may have been incomplete
+        with open(self.results_file, 'rb') as f:
+            f.seek(self.resume_offset)
+            offset = self.resume_offset
+            for raw_line in f:
+                if raw_line.startswith(b'PRODUCT '):
+                    match = PRODUCT_LINE.match(raw_line.decode('utf-8', errors='replace').rstrip('\r\n'))
+                    if match:
+                        number = int(match.group(1))
+                        self.offsets[number] = offset
+                        self.products[number] = match.group(2).strip()
+                        self.resume_offset = offset
+                offset += len(raw_line)
+
+        self.indexed_size = offset
+        self.tail_check = self._read_tail_check(offset)
+        try:
+            self._save()
+        except OSError as e:
+            print(f"Could not save results index: {e}")
+        return self
+
+    def last_product_number(self) -> int:
+        """Highest product number in the results file (0 if none)"""
+        return max(self.offsets) if self.offsets else 0
+
+    def read_record(self, number: int) -> Optional[Dict]:
+        """Parse a single product record by number without scanning the file"""
+        if number not in self.offsets:
+            return None
+        for record in iter_product_records(self.results_file, self.offsets[number]):
+            return record
+        return None
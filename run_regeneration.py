@@ -49,15 +49,16 @@ def main():
     print()
     
     # Get processing options
-    delay = input("Enter delay between requests in seconds (default: 2.0): ").strip()
+    # API quotas are enforced by rate_limiter.py; this is only an optional extra pause
+    delay = input("Enter extra delay between products in seconds (default: 0): ").strip()
     if not delay:
-        delay = 2.0
+        delay = 0.0
     else:
         try:
             delay = float(delay)
         except ValueError:
-            print("Invalid delay value. Using default 2.0 seconds.")
-            delay = 2.0
+            print("Invalid delay value. Using default 0 seconds.")
+            delay = 0.0
     
     output_file = input("Enter output filename (press Enter for auto-generated): ").strip()
     if not output_file:
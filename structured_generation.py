@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Schema-constrained generation of the six marketing sections.
+Gemini is asked for a JSON object with one string per requested section
+(response_mime_type + response_schema), the answer is validated, and only the
+sections that came back missing or empty are requested again.
+"""
+
+import json
+import re
+from typing import Dict, List, Optional
+
+from instrumentation import get_run_metrics
+from missing_data import CONTENT_COLUMNS
+from rate_limiter import RateLimiter
+from resilience import call_with_retry
+from response_cache import ResponseCache
+from results_parser import DESCRIPTION_SECTIONS, split_description_sections
+
+SECTION_KEYS = [key for key, _ in DESCRIPTION_SECTIONS.values()]
+
+# Section key <-> CSV column holding it
+SECTION_COLUMNS = dict(zip(SECTION_KEYS, CONTENT_COLUMNS[6:]))
+COLUMN_SECTIONS = {column: key for key, column in SECTION_COLUMNS.items()}
+
+# What the model is asked to write for each section
+SECTION_INSTRUCTIONS = {
+    'headline': 'A brief, poetic or powerful phrase that evokes the essence of the product.',
+    'sensory': 'The experience of using the product, focusing on the feel, scent, effect, or vibe (1-2 sentences).',
+    'features': 'The top 4-6 features as bullet points, focusing on performance, quality, and what sets it apart.',
+    'how_to_use': 'Simple step-by-step instructions.',
+    'emotional': 'The identity or vibe the user taps into by using this product.',
+    'tech_specs': 'Size/volume, longevity, origin, certifications.'
+}
+
+JSON_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+def section_schema(keys: List[str]) -> Dict:
+    """JSON schema of an object with one required string per section key"""
+    return {
+        'type': 'object',
+        'properties': {key: {'type': 'string'} for key in keys},
+        'required': list(keys)
+    }
+
+def generation_config(schema: Dict) -> Dict:
+    """Gemini generation config that constrains the answer to a JSON schema"""
+    return {'response_mime_type': 'application/json', 'response_schema': schema}
+
+def load_json_object(text: str) -> Dict:
+    """Parse a JSON object answer (tolerating a ```json fence); raises ValueError otherwise"""
+    data = json.loads(JSON_FENCE.sub('', text.strip()))
+    if not isinstance(data, dict):
+        raise ValueError("response is not a JSON object")
+    return data
+
+def parse_sections(text: str, keys: List[str]) -> Dict[str, str]:
+    """Valid, non-empty sections from an answer
+
+    Falls back to the markdown section parser when the model ignored the JSON format.
+    """
+    try:
+        data = load_json_object(text)
+    except ValueError:
+        data = split_description_sections(text)
+    return {key: data[key].strip() for key in keys if isinstance(data.get(key), str) and data[key].strip()}
+
+def sections_to_description(sections: Dict[str, str]) -> str:
+    """Render sections as the numbered markdown description used in the results files"""
+    blocks = []
+    for number, (key, label) in DESCRIPTION_SECTIONS.items():
+        if sections.get(key):
+            blocks.append(f"**{number}. {label}:**\n{sections[key]}")
+    return '\n\n'.join(blocks)
+
+class StructuredSectionGenerator:
+    def __init__(self, model, model_name: str, rate_limiter: Optional[RateLimiter] = None, cache: Optional[ResponseCache] = None, max_attempts: int = 3):
+        """Generate marketing sections as validated JSON, re-asking only for missing keys"""
+        self.model = model
+        self.model_name = model_name
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.max_attempts = max_attempts
+        self.requests = 0
+        self.retries = 0
+
+    def create_prompt(self, product_name: str, keys: List[str]) -> str:
+        """Prompt asking for the given sections of one product as JSON"""
+        instructions = '\n'.join(f'- "{key}": {SECTION_INSTRUCTIONS[key]}' for key in keys)
+        return f"""Write product content for this beauty/perfume product in Bulgarian language: {product_name}
+
+Answer with a JSON object containing exactly these keys, each a string in Bulgarian:
+{instructions}
+
+Do NOT include any image URLs or video links."""
+
+    def _request(self, prompt: str, keys: List[str]) -> str:
+        """One Gemini request for the given keys (waits for a quota slot first)"""
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        self.requests += 1
+        with get_run_metrics().api_call('gemini'):
+            return self.model.generate_content(prompt, generation_config=generation_config(section_schema(keys))).text
+
+    def generate(self, product_name: str, keys: Optional[List[str]] = None) -> Dict[str, str]:
+        """Return key -> text for the requested sections (all six by default)
+
+        Sections still missing after max_attempts requests are left out.
+        """
+        missing = list(keys or SECTION_KEYS)
+        sections: Dict[str, str] = {}
+        for attempt in range(self.max_attempts):
+            prompt = self.create_prompt(product_name, missing)
+            found, text = self.cache.get('gemini', product_name, self.model_name, prompt) if self.cache else (False, None)
+            if not found:
+                text = call_with_retry('gemini', lambda: self._request(prompt, missing))
+
+            parsed = parse_sections(text, missing)
+            # Answers without a single usable section are not cached, so a retry really asks again
+            if parsed and not found and self.cache:
+                self.cache.set('gemini', product_name, text, self.model_name, prompt)
+            sections.update(parsed)
+            missing = [key for key in missing if key not in sections]
+            if not missing:
+                break
+            if attempt + 1 < self.max_attempts:
+                self.retries += 1
+                print(f"Retrying {len(missing)} missing sections for {product_name}: {', '.join(missing)}")
+        return sections
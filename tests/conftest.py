@@ -0,0 +1,36 @@
+"""
+Shared fixtures. The tests run against the local stand-ins in fake_backends.py,
+and every shared SQLite file (response cache, URL health, quota usage) lives in
+a temporary directory so the real ones are never touched.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_backends import LocalImageHost  # noqa: E402
+from url_health import URLHealthStore  # noqa: E402
+
+@pytest.fixture(scope='session', autouse=True)
+def private_files(tmp_path_factory):
+    """Point the process-wide stores at a temporary directory before anything opens them"""
+    directory = tmp_path_factory.mktemp('stores')
+    os.environ['API_CACHE_FILE'] = str(directory / 'api_response_cache.sqlite')
+    os.environ['URL_HEALTH_FILE'] = str(directory / 'url_health.sqlite')
+    os.environ['API_QUOTA_FILE'] = str(directory / 'api_quota_usage.sqlite')
+    os.environ['CATALOGUE_SNAPSHOT_DIR'] = str(directory / 'catalogue_snapshots')
+    return directory
+
+@pytest.fixture
+def image_host():
+    with LocalImageHost() as host:
+        yield host
+
+@pytest.fixture
+def url_health(tmp_path):
+    store = URLHealthStore(str(tmp_path / 'url_health.sqlite'))
+    yield store
+    store.close()
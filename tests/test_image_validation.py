@@ -0,0 +1,37 @@
+from gemini_csv_processor import GoogleImageSearcher
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache
+
+def make_searcher(tmp_path, url_health, urls):
+    searcher = GoogleImageSearcher('fake-key', 'fake-cx', rate_limiter=RateLimiter('customsearch', 1e9, burst=1000),
+                                   cache=ResponseCache(str(tmp_path / 'cache.sqlite')), url_health=url_health)
+    searcher.search_images = lambda query, num_images: list(urls)
+    return searcher
+
+def test_results_keep_search_rank_order(tmp_path, image_host, url_health):
+    urls = [image_host.url(path) for path in ['slow/0.3/a.jpg', 'broken/b.jpg', 'html/c.jpg', 'image/d.jpg',
+                                                'error/e.jpg', 'slow/0.1/f.jpg', 'image/g.jpg', 'nohead/h.jpg']]
+    searcher = make_searcher(tmp_path, url_health, urls)
+
+    assert searcher.get_working_image_urls('query', 5) == [urls[0], urls[3], urls[5], urls[6]]
+
+def test_slow_top_result_is_not_replaced_by_faster_ones(tmp_path, image_host, url_health):
+    urls = [image_host.url(path) for path in ['slow/0.5/a.jpg', 'html/b.jpg', 'image/c.jpg', 'image/d.jpg',
+                                                'image/e.jpg', 'image/f.jpg']]
+    searcher = make_searcher(tmp_path, url_health, urls)
+
+    assert searcher.get_working_image_urls('query', 2) == [urls[0], urls[2]]
+
+def test_stops_once_top_ranks_are_settled(tmp_path, image_host, url_health):
+    urls = [image_host.url(path) for path in ['image/a.jpg', 'image/b.jpg', 'slow/2/c.jpg', 'slow/2/d.jpg']]
+    searcher = make_searcher(tmp_path, url_health, urls)
+    searcher.max_validation_workers = 4
+
+    assert searcher.get_working_image_urls('query', 2) == urls[:2]
+    # The slow checks were still running when the result was returned
+    assert url_health.lookup(urls[2]) is None
+
+def test_top_valid_ranks():
+    assert GoogleImageSearcher.top_valid_ranks({0: False, 1: True, 3: True}, 4, 2) == [1]
+    assert GoogleImageSearcher.top_valid_ranks({0: True, 1: False, 2: True, 3: True}, 4, 2) == [0, 2]
+    assert GoogleImageSearcher.top_valid_ranks({1: True, 2: True}, 3, 2) == []
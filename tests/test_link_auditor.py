@@ -0,0 +1,93 @@
+import threading
+
+import pandas as pd
+
+from http_session import PooledHTTPSession
+from link_auditor import LinkAuditor
+
+
+class CountingSession(PooledHTTPSession):
+    """Pooled session that records the most requests it had in flight at once"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _track(self, send, url, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            return send(url, **kwargs)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def head(self, url, **kwargs):
+        return self._track(super().head, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self._track(super().get, url, **kwargs)
+
+
+def make_auditor(url_health, **kwargs):
+    return LinkAuditor(url_health=url_health, timeout=5, **kwargs)
+
+
+def test_each_distinct_url_is_requested_once(image_host, url_health):
+    shared = image_host.url('image/shared.jpg')
+    df = pd.DataFrame({'ID': ['a', 'b', 'c'],
+                       'Image 1': [shared, shared, image_host.url('image/own.jpg')],
+                       'Image 2': [shared, None, shared]})
+
+    results = make_auditor(url_health).audit(df)
+
+    assert len(results) == 5
+    assert results['ok'].all()
+    assert image_host.request_counts == {'HEAD': 2}
+
+
+def test_requests_per_host_stay_under_the_cap(image_host, url_health):
+    session = CountingSession(max_connections_per_host=2)
+    auditor = make_auditor(url_health, max_workers=8, max_per_host=2, session=session)
+
+    checks = auditor.check_urls([image_host.url(f'slow/0.2/{i}.jpg') for i in range(8)])
+
+    assert all(check['status'] == 200 for check in checks.values())
+    assert session.peak == 2
+
+
+def test_rejected_head_falls_back_to_ranged_get(image_host, url_health):
+    url = image_host.url('nohead/a.jpg')
+
+    check = make_auditor(url_health).check_url(url)
+
+    assert check['method'] == 'GET'
+    assert image_host.request_counts == {'HEAD': 1, 'GET': 1}
+    # The ranged GET answers 206; it is stored as a plain 200
+    assert check['status'] == 200
+    assert url_health.lookup(url)['status'] == 200
+
+
+def test_clear_broken_cells_clears_only_broken_links(image_host, url_health):
+    good, html = image_host.url('image/good.jpg'), image_host.url('html/page.jpg')
+    broken, error = image_host.url('broken/gone.jpg'), image_host.url('error/oops.jpg')
+    df = pd.DataFrame({'ID': ['a', 'b'],
+                       'Image 1': [good, broken],
+                       'Image 2': [error, good],
+                       'Video': [html, 'not a link'],
+                       'Title': ['A', 'B']})
+
+    auditor = make_auditor(url_health)
+    results = auditor.audit(df)
+    cleared = auditor.clear_broken_cells(df, results)
+
+    assert cleared['Image 1'].isna().tolist() == [False, True]
+    assert cleared['Image 2'].isna().tolist() == [True, False]
+    assert cleared.at[0, 'Image 1'] == good and cleared.at[1, 'Image 2'] == good
+    # A 200 page is a working link even if it is not an image; non-links are left alone
+    assert cleared['Video'].tolist() == [html, 'not a link']
+    assert cleared['Title'].tolist() == ['A', 'B']
+    assert df['Image 1'].tolist() == [good, broken]
@@ -0,0 +1,31 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline_stages import run_stages
+
+
+def sleeper(seconds, value):
+    def run():
+        time.sleep(seconds)
+        return value
+    return run
+
+
+def test_timeout_starts_when_the_stage_starts():
+    # One worker: 'video' waits for 'text' before it runs, longer than its own timeout
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        outputs, errors = run_stages(executor, {'text': sleeper(0.3, 'description'), 'video': sleeper(0.05, 'url')},
+                                     {'text': 1.0, 'video': 0.2})
+    assert errors == {}
+    assert outputs == {'text': 'description', 'video': 'url'}
+
+
+def test_errors_are_the_stage_exceptions():
+    def fail():
+        raise ValueError('no results')
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        outputs, errors = run_stages(executor, {'images': fail, 'video': sleeper(0.5, 'url')}, {'images': 1.0, 'video': 0.1})
+    assert outputs == {}
+    assert isinstance(errors['images'], ValueError)
+    assert isinstance(errors['video'], TimeoutError)
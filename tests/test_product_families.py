@@ -0,0 +1,47 @@
+import asyncio
+
+from product_families import ProductFamilies
+
+NAMES = ['Chanel No 5 EDP 50ml', 'Chanel No 5 EDP 100ml', 'Chanel No 5 EDP 35ml']
+
+
+def test_cancelled_waiter_does_not_break_the_family():
+    families = ProductFamilies(NAMES, ['Chanel'] * len(NAMES))
+    owner, cancelled, waiting = NAMES
+    result = {'status': 'success', 'description': 'Описание'}
+
+    async def run():
+        assert await families.claim_async(owner) is None
+        cancelled_waiter = asyncio.ensure_future(families.claim_async(cancelled))
+        other_waiter = asyncio.ensure_future(families.claim_async(waiting))
+        await asyncio.sleep(0.01)
+
+        # Cancel one waiter while the owner is still generating
+        cancelled_waiter.cancel()
+        await asyncio.sleep(0.01)
+        assert cancelled_waiter.cancelled()
+
+        families.finish(owner, result)
+        return await asyncio.wait_for(other_waiter, 1)
+
+    assert asyncio.run(run()) == result
+    assert families.claim(cancelled) == result
+    assert families.reused == 2
+
+
+def test_failed_owner_hands_the_family_to_a_waiter():
+    families = ProductFamilies(NAMES, ['Chanel'] * len(NAMES))
+    owner, waiting = NAMES[:2]
+
+    async def run():
+        assert await families.claim_async(owner) is None
+        waiter = asyncio.ensure_future(families.claim_async(waiting))
+        await asyncio.sleep(0.01)
+        families.finish(owner, None)
+        return await asyncio.wait_for(waiter, 1)
+
+    # None means the waiter now owns the family and generates it itself
+    assert asyncio.run(run()) is None
+    result = {'status': 'success', 'description': 'Описание'}
+    families.finish(waiting, result)
+    assert families.claim(NAMES[2]) == result
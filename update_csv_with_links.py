@@ -1,21 +1,32 @@
+import numpy as np
 import pandas as pd
 import re
 import os
 from typing import Dict, List, Optional, Tuple
 
+from catalogue_snapshot import SnapshotStore
+from catalogue_store import load_catalogue
+from link_auditor import LinkAuditor
+from name_matching import NameIndex, match_report_path, summarize_matches
+from results_jsonl import load_results_jsonl
+from results_parser import iter_product_records, parse_record_lines
+from url_health import get_shared_health_store
+
 class CSVLinkUpdater:
     def __init__(self, csv_file: str, results_file: str):
         """Initialize the CSV Link Updater"""
         self.csv_file = csv_file
         self.results_file = results_file
         self.df = None
+        self.match_report = None
         self.updated_count = 0
         self.skipped_count = 0
         
     def load_csv(self) -> bool:
         """Load the CSV file"""
         try:
-            self.df = pd.read_csv(self.csv_file)
+            self.df = load_catalogue(self.csv_file)
+            self.original_df = self.df.copy()
             print(f"Loaded CSV with {len(self.df)} rows")
             return True
         except Exception as e:
@@ -24,104 +35,63 @@ class CSVLinkUpdater:
     
     def extract_links_from_new_format(self, section: str) -> Tuple[List[str], Optional[str], Dict[str, str]]:
         """Extract image links, video link, and marketing content from the new results format"""
-        image_urls = []
-        video_url = None
-        marketing_content = {}
-        
-        # Extract image URLs from WORKING IMAGE LINKS section
-        image_section_match = re.search(r'WORKING IMAGE LINKS:\n(.*?)(?=\n\nVIDEO LINK:|$)', section, re.DOTALL)
-        if image_section_match:
-            image_content = image_section_match.group(1)
-            # Find all image URLs in the format "Image X: URL"
-            image_matches = re.findall(r'Image \d+: (https?://[^\s]+)', image_content)
-            image_urls.extend(image_matches)
-        
-        # Extract video URL from VIDEO LINK section
-        video_section_match = re.search(r'VIDEO LINK:\n(.*?)(?=\n\n|$)', section, re.DOTALL)
-        if video_section_match:
-            video_content = video_section_match.group(1)
-            # Find video URL in the format "Video: URL"
-            video_match = re.search(r'Video: (https?://[^\s]+)', video_content)
-            if video_match:
-                video_url = video_match.group(1)
-        
-        # Extract marketing content sections
-        marketing_sections = {
-            'headline': r'\*\*1\. Captivating Headline or Tagline[:\*]*\s*(.*?)(?=\n\*\*2\.|$)',
-            'sensory': r'\*\*2\. Sensory Introduction[^:]*[:\*]*\s*(.*?)(?=\n\*\*3\.|$)',
-            'features': r'\*\*3\. Key Features or Ingredients[^:]*[:\*]*\s*(.*?)(?=\n\*\*4\.|$)',
-            'how_to_use': r'\*\*4\. How to Use[^:]*[:\*]*\s*(.*?)(?=\n\*\*5\.|$)',
-            'emotional': r'\*\*5\. Emotional or Lifestyle Hook[^:]*[:\*]*\s*(.*?)(?=\n\*\*6\.|$)',
-            'tech_specs': r'\*\*6\. Tech Specs or Product Facts[^:]*[:\*]*\s*(.*?)(?=\n\*\*|$)'
-        }
-        
-        for key, pattern in marketing_sections.items():
-            match = re.search(pattern, section, re.DOTALL | re.IGNORECASE)
-            if match:
-                content = match.group(1).strip()
-                # Clean up the content by removing extra whitespace and newlines
-                content = re.sub(r'\n\s*\n', '\n', content)  # Remove empty lines
-                content = re.sub(r'\s+', ' ', content)  # Normalize whitespace
-                marketing_content[key] = content
-            else:
-                marketing_content[key] = ''
-        
-        return image_urls, video_url, marketing_content
+        record = parse_record_lines(section.splitlines())
+        return record['images'], record['video'], record['marketing_content']
     
     def parse_results_file(self) -> Dict[str, Dict]:
-        """Parse the Gemini results file and extract links for each product"""
+        """Parse the Gemini results file and extract links for each product
+        
+        The file is streamed one product record at a time, so large result logs
+        are never held in memory as a whole. JSONL results are loaded directly.
+        """
         if not os.path.exists(self.results_file):
             print(f"Results file not found: {self.results_file}")
             return {}
         
-        try:
-            with open(self.results_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-        except Exception as e:
-            print(f"Error reading results file: {e}")
-            return {}
-        
-        # Split content by product sections (updated separator)
-        product_sections = content.split('============================================================')
+        if self.results_file.endswith('.jsonl'):
+            try:
+                products_data = load_results_jsonl(self.results_file)
+            except Exception as e:
+                print(f"Error reading results file: {e}")
+                return {}
+            print(f"Loaded {len(products_data)} successful products from {self.results_file}")
+            return products_data
         
         products_data = {}
         
-        for section in product_sections:
-            if 'PRODUCT' not in section:
-                continue
+        try:
+            for record in iter_product_records(self.results_file):
+                product_name = record['product']
+                
+                # Check if the request was successful
+                if record['status'] == 'error':
+                    print(f"Skipping {product_name} - API error")
+                    continue
                 
-            # Extract product name
-            product_match = re.search(r'PRODUCT \d+: (.+)', section)
-            if not product_match:
-                continue
+                image_urls = record['images']
+                video_url = record['video']
+                marketing_content = record['marketing_content']
                 
-            product_name = product_match.group(1).strip()
-            
-            # Check if the request was successful
-            if 'Status: error' in section:
-                print(f"Skipping {product_name} - API error")
-                continue
-            
-            # Extract links from the new format
-            image_urls, video_url, marketing_content = self.extract_links_from_new_format(section)
-            
-            # Include products that have links OR marketing content
-            if image_urls or video_url or any(marketing_content.values()):
-                products_data[product_name] = {
-                    'images': image_urls,
-                    'video': video_url,
-                    'marketing_content': marketing_content
-                }
-                content_info = []
-                if image_urls:
-                    content_info.append(f"{len(image_urls)} images")
-                if video_url:
-                    content_info.append("1 video")
-                if any(marketing_content.values()):
-                    content_info.append("marketing content")
-                print(f"Found {', '.join(content_info)} for: {product_name}")
-            else:
-                print(f"Skipping {product_name} - No content found")
+                # Include products that have links OR marketing content
+                if image_urls or video_url or any(marketing_content.values()):
+                    products_data[product_name] = {
+                        'images': image_urls,
+                        'video': video_url,
+                        'marketing_content': marketing_content
+                    }
+                    content_info = []
+                    if image_urls:
+                        content_info.append(f"{len(image_urls)} images")
+                    if video_url:
+                        content_info.append("1 video")
+                    if any(marketing_content.values()):
+                        content_info.append("marketing content")
+                    print(f"Found {', '.join(content_info)} for: {product_name}")
+                else:
+                    print(f"Skipping {product_name} - No content found")
+        except Exception as e:
+            print(f"Error reading results file: {e}")
+            return {}
         
         return products_data
     
@@ -162,91 +132,83 @@ class CSVLinkUpdater:
         while len(self.df.columns) < required_cols:
             self.df[f'Column_{len(self.df.columns)}'] = ''
         
-        # Update each row
-        for index, row in self.df.iterrows():
-            product_name = str(row.iloc[product_col_index]).strip()
-            
-            if product_name in products_data:
-                data = products_data[product_name]
-                
-                # Clear existing image data first
-                for img_col_idx in image_col_indices:
-                    self.df.iloc[index, img_col_idx] = ''
-                
-                # Update image columns with working URLs
-                for i, img_url in enumerate(data['images']):
-                    if i < len(image_col_indices):
-                        self.df.iloc[index, image_col_indices[i]] = img_url
-                
-                # Update video column
-                if data['video']:
-                    self.df.iloc[index, video_col_index] = data['video']
-                else:
-                    self.df.iloc[index, video_col_index] = ''
-                
-                # Update marketing content columns
-                if 'marketing_content' in data:
-                    marketing_data = data['marketing_content']
-                    for key, col_index in marketing_col_indices.items():
-                        content = marketing_data.get(key, '')
-                        self.df.iloc[index, col_index] = content
-                
-                self.updated_count += 1
-                print(f"Updated row {index + 1}: {product_name} - {len(data['images'])} images, {'1' if data['video'] else '0'} video, marketing content added")
-            else:
-                self.skipped_count += 1
+        # Turn the parsed results into a frame keyed by product name, one column per
+        # target cell. Missing images/video become '' so matched rows are cleared then filled.
+        results = pd.DataFrame.from_dict({
+            product_name: {
+                **{img_col_idx: (data['images'][i] if i < len(data['images']) else '') for i, img_col_idx in enumerate(image_col_indices)},
+                video_col_index: data['video'] or '',
+                **{col_index: data.get('marketing_content', {}).get(key, '') for key, col_index in marketing_col_indices.items()}
+            }
+            for product_name, data in products_data.items()
+        }, orient='index')
+        target_columns = image_col_indices + [video_col_index] + list(marketing_col_indices.values())
+        results = results.reindex(columns=target_columns)
+        
+        # Match the result names to the CSV rows (exact, normalized, then fuzzy); the
+        # report of every match and its confidence is kept in self.match_report
+        name_index = NameIndex(self.df.iloc[:, product_col_index])
+        self.match_report = name_index.match_all(results.index)
+        summarize_matches(self.match_report)
+        accepted = self.match_report.assign(product=results.index)
+        accepted = accepted[accepted['accepted']].sort_values('score', kind='stable')
+        row_products = {}
+        for product_name, rows in zip(accepted['product'], accepted['rows']):
+            # Where two results match the same row, the better-scoring one wins
+            row_products.update(dict.fromkeys(rows, product_name))
+        matched_positions = np.array(sorted(row_products), dtype=int)
+        product_names = pd.Series(row_products, dtype=object)
+        aligned = results.reindex([row_products[position] for position in matched_positions])
+        
+        # Column-wise assignment for all matched rows at once
+        for col_index in target_columns:
+            if self.df.iloc[:, col_index].dtype != object:
+                self.df.isetitem(col_index, self.df.iloc[:, col_index].astype(object))
+            self.df.iloc[matched_positions, col_index] = aligned[col_index].to_numpy(dtype=object)
+        
+        self.updated_count += len(matched_positions)
+        self.skipped_count += len(self.df) - len(matched_positions)
+        
+        for position in matched_positions[:10]:
+            data = products_data[product_names[position]]
+            print(f"Updated row {position + 1}: {product_names[position]} - {len(data['images'])} images, {'1' if data['video'] else '0'} video, marketing content added")
+        if len(matched_positions) > 10:
+            print(f"... and {len(matched_positions) - 10} more rows")
+        print(f"Rows updated: {len(matched_positions)}, rows skipped (no results): {len(self.df) - len(matched_positions)}")
         
         return True
     
     def validate_links_in_csv(self) -> Dict[str, int]:
-        """Validate the links that were added to the CSV"""
+        """Validate the links that were added to the CSV
+        
+        Delegates to LinkAuditor, which checks each distinct URL once, concurrently and
+        with a per-host cap. The per-cell results table is kept in self.link_audit.
+        """
         if self.df is None:
             return {}
         
-        import requests
-        
-        stats = {
-            'total_image_links': 0,
-            'working_image_links': 0,
-            'broken_image_links': 0,
-            'total_video_links': 0,
-            'working_video_links': 0,
-            'broken_video_links': 0
-        }
-        
         image_col_indices = [14, 15, 16, 17]  # Columns O, P, Q, R
         video_col_index = 19  # Column T
+        image_columns = [self.df.columns[i] for i in image_col_indices if i < len(self.df.columns)]
+        video_columns = [self.df.columns[video_col_index]] if video_col_index < len(self.df.columns) else []
         
         print("Validating links in CSV...")
+        auditor = LinkAuditor(url_health=get_shared_health_store())
+        self.link_audit = auditor.audit(self.df, image_columns + video_columns)
         
-        for index, row in self.df.iterrows():
-            # Check image links
-            for img_col_idx in image_col_indices:
-                url = str(row.iloc[img_col_idx]).strip()
-                if url and url != 'nan' and url.startswith('http'):
-                    stats['total_image_links'] += 1
-                    try:
-                        response = requests.head(url, timeout=10, allow_redirects=True)
-                        if response.status_code == 200:
-                            stats['working_image_links'] += 1
-                        else:
-                            stats['broken_image_links'] += 1
-                    except:
-                        stats['broken_image_links'] += 1
-            
-            # Check video link
-            video_url = str(row.iloc[video_col_index]).strip()
-            if video_url and video_url != 'nan' and video_url.startswith('http'):
-                stats['total_video_links'] += 1
-                try:
-                    response = requests.head(video_url, timeout=10, allow_redirects=True)
-                    if response.status_code == 200:
-                        stats['working_video_links'] += 1
-                    else:
-                        stats['broken_video_links'] += 1
-                except:
-                    stats['broken_video_links'] += 1
+        is_video = self.link_audit['column'].isin(video_columns)
+        images, videos = self.link_audit[~is_video], self.link_audit[is_video]
+        stats = {
+            'total_image_links': len(images),
+            'working_image_links': int(images['ok'].sum()),
+            'broken_image_links': int((~images['ok']).sum()),
+            'total_video_links': len(videos),
+            'working_video_links': int(videos['ok'].sum()),
+            'broken_video_links': int((~videos['ok']).sum())
+        }
         
+        auditor.session.print_pool_stats()
+        auditor.url_health.print_stats()
         return stats
     
     def save_updated_csv(self, output_file: str = None) -> bool:
@@ -255,27 +217,24 @@ class CSVLinkUpdater:
             print("No data to save")
             return False
         
+        # Back up the input as a compressed snapshot (one per distinct version of the sheet)
+        snapshots = SnapshotStore()
+        backup_snapshot = None
+        try:
+            backup_snapshot = snapshots.snapshot(self.csv_file, self.original_df)
+            print(f"Backup snapshot: {snapshots.path(backup_snapshot)}")
+        except Exception as e:
+            print(f"Error creating backup: {e}")
+        
         if output_file is None:
-            # Create backup and overwrite original
-            backup_file = self.csv_file.replace('.csv', '_backup.csv')
-            try:
-                # Create backup only if it doesn't exist
-                if not os.path.exists(backup_file):
-                    original_df = pd.read_csv(self.csv_file)
-                    original_df.to_csv(backup_file, index=False)
-                    print(f"Created backup: {backup_file}")
-                else:
-                    print(f"Backup already exists: {backup_file}")
-                
-                # Save updated file
-                output_file = self.csv_file
-            except Exception as e:
-                print(f"Error creating backup: {e}")
-                output_file = self.csv_file.replace('.csv', '_updated.csv')
+            # Overwrite the original only if it is backed up
+            output_file = self.csv_file if backup_snapshot else self.csv_file.replace('.csv', '_updated.csv')
         
         try:
             self.df.to_csv(output_file, index=False)
             print(f"Updated CSV saved to: {output_file}")
+            if backup_snapshot:
+                snapshots.record_run(backup_snapshot, self.original_df, self.df, output_file)
             return True
         except Exception as e:
             print(f"Error saving CSV: {e}")
@@ -308,6 +267,10 @@ class CSVLinkUpdater:
         if not self.save_updated_csv(output_file):
             return False
         
+        report_file = match_report_path(output_file or self.csv_file)
+        self.match_report.to_csv(report_file, index=False)
+        print(f"Name match report saved to: {report_file}")
+        
         # Validate links if requested
         if validate_links:
             print("Validating links...")
@@ -326,9 +289,14 @@ def main():
     # Configuration
     CSV_FILE = "18062025 - Парфюми  - Sheet1.csv"
     RESULTS_FILE = "gemini_beauty_products_results_with_working_links.txt"
+    JSONL_RESULTS_FILE = "gemini_beauty_products_results.jsonl"
     OUTPUT_FILE = None  # Will create backup and overwrite original
     VALIDATE_LINKS = True  # Set to True to validate all links after updating
     
+    # Prefer the structured results written alongside the text log
+    if os.path.exists(JSONL_RESULTS_FILE):
+        RESULTS_FILE = JSONL_RESULTS_FILE
+    
     # Check if files exist
     if not os.path.exists(CSV_FILE):
         print(f"CSV file not found: {CSV_FILE}")
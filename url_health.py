@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Persistent store of URL health checks.
+Every link validator consults it before touching the network, so URLs that were
+checked recently (by any script) are answered locally. Working and broken URLs
+expire separately: broken ones are re-checked sooner.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from http_session import PooledHTTPSession, get_shared_session
+from instrumentation import get_run_metrics
+
+DEFAULT_HEALTH_FILE = 'url_health.sqlite'
+DAY = 24 * 60 * 60
+DEFAULT_POSITIVE_TTL = 14 * DAY
+DEFAULT_NEGATIVE_TTL = 1 * DAY
+
+# Content types accepted as an image by is_image()
+IMAGE_TYPE_MARKERS = ('image/', 'jpeg', 'jpg', 'png', 'gif', 'webp')
+
+class URLHealthStore:
+    def __init__(self, path: str = DEFAULT_HEALTH_FILE, positive_ttl: float = DEFAULT_POSITIVE_TTL, negative_ttl: float = DEFAULT_NEGATIVE_TTL):
+        """Open (or create) the SQLite health store"""
+        self.path = path
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.local_hits = 0
+        self.network_checks = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS url_health (
+                url TEXT PRIMARY KEY,
+                status INTEGER,
+                content_type TEXT,
+                error TEXT,
+                checked_at REAL NOT NULL
+            )''')
+        self._conn.commit()
+
+    @staticmethod
+    def is_healthy(record: Dict) -> bool:
+        """A URL is healthy when it answered 200 (ranged GETs are stored as 200, see record())"""
+        return record.get('status') == 200
+
+    @staticmethod
+    def is_image(record: Dict) -> bool:
+        """A healthy URL that serves an image content type"""
+        content_type = record.get('content_type') or ''
+        return URLHealthStore.is_healthy(record) and any(marker in content_type for marker in IMAGE_TYPE_MARKERS)
+
+    def lookup(self, url: str) -> Optional[Dict]:
+        """Return the stored check for a URL, or None if unknown or expired"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT status, content_type, error, checked_at FROM url_health WHERE url = ?', (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        record = {'url': url, 'status': row[0], 'content_type': row[1] or '', 'error': row[2], 'checked_at': row[3]}
+        ttl = self.positive_ttl if self.is_healthy(record) else self.negative_ttl
+        if time.time() - record['checked_at'] > ttl:
+            return None
+        return record
+
+    def record(self, url: str, status: Optional[int], content_type: str = '', error: Optional[str] = None) -> Dict:
+        """Store the result of a network check"""
+        if status == 206:
+            # A one-byte ranged GET (used when HEAD is rejected) means the full resource is served
+            status = 200
+        record = {'url': url, 'status': status, 'content_type': content_type or '', 'error': error, 'checked_at': time.time()}
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO url_health (url, status, content_type, error, checked_at) VALUES (?, ?, ?, ?, ?)',
+                (url, status, record['content_type'], error, record['checked_at'])
+            )
+            self._conn.commit()
+        return record
+
+    def cached_check(self, url: str) -> Optional[Dict]:
+        """Fresh stored result for a URL, counted as answered locally; None if it must be checked"""
+        record = self.lookup(url)
+        if record is not None:
+            with self._lock:
+                self.local_hits += 1
+        return record
+
+    def record_check(self, url: str, status: Optional[int], content_type: str = '', error: Optional[str] = None) -> Dict:
+        """Store the result of a network check made by the caller"""
+        with self._lock:
+            self.network_checks += 1
+        return self.record(url, status, content_type, error)
+
+    def check(self, url: str, session: Optional[PooledHTTPSession] = None, timeout: float = 10) -> Dict:
+        """Return the health of a URL, using the stored result when it is still fresh"""
+        record = self.cached_check(url)
+        if record is not None:
+            return record
+
+        session = session or get_shared_session()
+        try:
+            with get_run_metrics().api_call('url_head'):
+                response = session.head(url, timeout=timeout, allow_redirects=True)
+            return self.record_check(url, response.status_code, response.headers.get('content-type', '').lower())
+        except Exception as e:
+            return self.record_check(url, None, error=str(e)[:200])
+
+    def print_stats(self) -> None:
+        """Print how many checks were answered locally in this process"""
+        total = self.local_hits + self.network_checks
+        if total:
+            print(f"URL health store: {self.local_hits}/{total} checks answered locally "
+                  f"({self.local_hits / total * 100:.1f}%), {self.network_checks} network checks")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+_shared_store: Optional[URLHealthStore] = None
+_shared_store_lock = threading.Lock()
+
+def get_shared_health_store() -> URLHealthStore:
+    """Return the process-wide URL health store (file set by URL_HEALTH_FILE, default url_health.sqlite)"""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = URLHealthStore(os.getenv('URL_HEALTH_FILE', DEFAULT_HEALTH_FILE))
+        return _shared_store